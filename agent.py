@@ -1,48 +1,46 @@
 import re
-from langchain.agents import initialize_agent, AgentType
+import json
+import contextvars
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+from langchain.agents import initialize_agent, AgentType, AgentExecutor, create_tool_calling_agent
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.schema import SystemMessage
 from utils.retrievers import RetrieverManager
-from src.nodes.faq_node import FaqTool
+from src.nodes.faq_node import FaqTool, faq_stats
 from src.nodes.package_info_node import PackageInfoTool
 from src.nodes.package_recommendation_node import PackageRecommendationTool
+from src.nodes.package_compare_node import PackageCompareTool
 from src.nodes.support_node import SupportTool
-from config import require_openai_key, LLM_MODEL
+from utils.deadline import deadline_scope, within_deadline
+from utils.hedging import hedged, hedge_stats
+from utils.prompt_cache import prompt_stats, track_prompt_usage
+from utils.ledger import ledger
+from utils.prefetch import prefetch_scope, prefetch_stats
+from utils.adaptive_k import adaptive_stats
+from utils.shadow import shadow, shadow_stats, answer_similarity
+from utils.profiling import profiler
+from utils.history import CompactHistory, TurnMemory
+from utils.session_queue import SessionActors
+from utils.session_cache import SessionToolCache, session_cache_stats
+from utils.records import pack_snippets
+from config import require_openai_key, LLM_MODEL, AGENT_MODE, SPECULATIVE_PREFETCH, SHADOW_ANSWERS
 from constants import (
     EMPTY_MESSAGE, MESSAGE_TOO_LONG, MESSAGE_TOO_SHORT, PROCESSING_ERROR,
     NO_RESPONSE, MAX_MESSAGE_LENGTH, MIN_MESSAGE_LENGTH, MAX_ACTIVE_SESSIONS,
-    AGENT_MAX_ITERATIONS, AGENT_TEMPERATURE, AGENT_REQUEST_TIMEOUT, AGENT_MAX_RETRIES
+    AGENT_MAX_ITERATIONS, AGENT_TEMPERATURE, AGENT_REQUEST_TIMEOUT, AGENT_MAX_RETRIES,
+    AGENT_WORKERS, REQUEST_DEADLINE_S, DEGRADED_RESERVE_S, DEGRADED_WORKERS, DEGRADED_MAX_PACKAGES,
+    DEGRADED_MESSAGE, DEGRADED_PACKAGES_HEADER, FAQ_EXTRACTIVE_TEMPLATE,
+    FAQ_EXTRACTIVE_MIN_SCORE, RECOMMENDATION_CONTEXT_TOKEN_BUDGET, AGENT_CHEAP_MAX_ITERATIONS
 )
 import re
 
-class CustomerSupportAgent:
-    """
-    React Agent for customer support with per-session memory.
-    """
-
-    def __init__(self, retriever_manager: RetrieverManager):
-        retriever_manager.setup_retrievers()
-        self.retriever_manager = retriever_manager
-        self.llm = ChatOpenAI(
-            api_key=require_openai_key(),
-            model_name=LLM_MODEL,
-            temperature=AGENT_TEMPERATURE,
-            request_timeout=AGENT_REQUEST_TIMEOUT,
-            max_retries=AGENT_MAX_RETRIES
-        )
-        # dictionary for active agents per session
-        self.sessions = {}
-
-    def _create_agent_for_session(self, session_id: str):
-        """Create a new agent with its own memory for a specific session."""
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            output_key="output"
-        )
-
-        system_prompt = """
+SYSTEM_PROMPT = """
 # دورك
 أنت مساعد ذكي لخدمة عملاء شركة النمسا المتحدة للاتصالات.
 اسمك: "مساعد فودافون الذكي" ✨
@@ -93,13 +91,17 @@ class CustomerSupportAgent:
 - لعرض قائمة كل الباقات المتاحة
 - مثال: "باقة للمكالمات بحد ١٠٠ج" أو "ايه الباقات المتاحة؟"
 
+📌 package_compare_tool:
+- لمقارنة باقتين أو أكثر في خطوة واحدة
+- مثال: "قارن بين فليكس ٧٠ و Plus 60"
+
 📌 support_tool:
 - للمشاكل التقنية والإدارية
 - مثال: "مشكلة في الراوتر"
 
 # المقارنة بين الباقات 🔄
 عند طلب المقارنة:
-1. استخدم package_info_tool لكل باقة
+1. استخدم package_compare_tool مرة واحدة بكل أسماء الباقات (لا تستدعِ package_info_tool لكل باقة)
 2. اعرض مقارنة واضحة:
    
    📊 المقارنة:
@@ -129,29 +131,109 @@ class CustomerSupportAgent:
 🚀 إذا احتاج تدخل بشري:
 "سأقوم بتحويلك لفريق الدعم المتخصص. رقم الدعم: ١٦٠ (متاح ٢٤/٧)"
 """
-        # Add system prompt to memory
-        memory.chat_memory.add_message(SystemMessage(content=system_prompt))
 
-        # Initialize tools with session memory
+# ReAct mode: the system prompt leads the agent prompt, before the tool list and format instructions
+REACT_PREFIX = SYSTEM_PROMPT.strip() + """
+
+TOOLS:
+------
+
+Assistant has access to the following tools:"""
+
+
+class CustomerSupportAgent:
+    """
+    Customer support agent with per-session memory.
+
+    mode="react" uses the text ReAct agent; mode="tools" uses native tool/function calling.
+    """
+
+    def __init__(self, retriever_manager: RetrieverManager, mode: str = AGENT_MODE):
+        if mode not in ("react", "tools"):
+            raise ValueError(f"Agent mode '{mode}' غير مدعوم")
+        self.retriever_manager = retriever_manager
+        self.mode = mode
+        # timeout / retries per call come out of the turn's deadline, so an agent turn abandoned
+        # at the deadline does not keep calling the provider (and holding a worker) for long
+        self.llm = track_prompt_usage(within_deadline(hedged(ChatOpenAI(
+            api_key=require_openai_key(),
+            model_name=LLM_MODEL,
+            temperature=AGENT_TEMPERATURE,
+            request_timeout=AGENT_REQUEST_TIMEOUT,
+            max_retries=0
+        ), "agent"), AGENT_REQUEST_TIMEOUT, AGENT_MAX_RETRIES), "agent")
+        # dictionary for active agents per session
+        self.sessions = {}
+        # agent turns run here so handle_message can stop waiting at the request deadline
+        self._executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="agent")
+        # degraded lookups get their own small pool: the agent pool is the one that just timed out
+        self._degraded_executor = ThreadPoolExecutor(max_workers=DEGRADED_WORKERS, thread_name_prefix="degraded")
+        self.degraded_count = 0
+        # one turn at a time per session (agent + memory), sessions in parallel
+        self.actors = SessionActors()
+
+    def _create_agent_for_session(self, session_id: str, tenant: Optional[str] = None):
+        """Create a new agent with its own memory for a specific session (bound to its tenant's catalog)."""
+        memory = TurnMemory(
+            # role codes + interned texts; message objects only built when the prompt is
+            chat_memory=CompactHistory(),
+            memory_key="chat_history",
+            return_messages=True,
+            output_key="output"
+        )
+
+        # Initialize tools with session memory; the package tools share the session's
+        # tool-result cache and the packages already shown ("الباقة السابقة")
+        cache = SessionToolCache()
         tools = [
-            FaqTool(self.retriever_manager, memory),
-            PackageInfoTool(self.retriever_manager, memory),
-            PackageRecommendationTool(self.retriever_manager, memory),
+            FaqTool(self.retriever_manager, memory, tenant=tenant),
+            PackageInfoTool(self.retriever_manager, memory, tenant=tenant, cache=cache),
+            PackageRecommendationTool(self.retriever_manager, memory, tenant=tenant, cache=cache),
+            PackageCompareTool(self.retriever_manager, memory, tenant=tenant, cache=cache),
             SupportTool(memory)
         ]
 
-        agent = initialize_agent(
+        if self.mode == "tools":
+            agent = self._create_tool_calling_agent(tools, memory)
+        else:
+            # System prompt + tool descriptions form the static prompt prefix (not a per-session memory message)
+            agent = initialize_agent(
+                tools=tools,
+                llm=self.llm,
+                agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+                memory=memory,
+                verbose=True,
+                handle_parsing_errors=self._handle_parsing_error,
+                max_iterations=AGENT_MAX_ITERATIONS,
+                early_stopping_method="generate",
+                agent_kwargs={"prefix": REACT_PREFIX}
+            )
+            prompt_stats.register_static("agent", agent.agent.llm_chain.prompt.template.split("{chat_history}")[0])
+        agent.metadata = {"tenant": tenant}
+        self.sessions[session_id] = agent
+        return agent
+
+    def _create_tool_calling_agent(self, tools, memory: ConversationBufferMemory) -> AgentExecutor:
+        """Native function-calling agent: tools are called through their args_schema,
+        several per turn if needed, so there is no free-text ReAct output to parse."""
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=SYSTEM_PROMPT),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ])
+        agent = create_tool_calling_agent(self.llm, tools, prompt)
+        # static prefix = system prompt + tool schemas (sent before the messages)
+        prompt_stats.register_static(
+            "agent", SYSTEM_PROMPT + json.dumps([convert_to_openai_tool(tool) for tool in tools], ensure_ascii=False)
+        )
+        return AgentExecutor(
+            agent=agent,
             tools=tools,
-            llm=self.llm,
-            agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
             memory=memory,
             verbose=True,
-            handle_parsing_errors=self._handle_parsing_error,
-            max_iterations=AGENT_MAX_ITERATIONS,
-            early_stopping_method="generate"
+            max_iterations=AGENT_MAX_ITERATIONS
         )
-        self.sessions[session_id] = agent
-        return agent
 
     def _handle_parsing_error(self, error_message: str) -> str:
         """Custom handler for parsing errors - extract the actual response"""
@@ -171,8 +253,18 @@ class CustomerSupportAgent:
         cleaned = cleaned.replace("`", "").replace("For troubleshooting, visit:", "")
         return cleaned.strip()
 
-    def handle_message(self, session_id: str, user_message: str) -> str:
-        """Handle user message with a session-specific agent."""
+    def handle_message(self, session_id: str, user_message: str, tenant: Optional[str] = None) -> str:
+        """Handle user message with a session-specific agent.
+
+        A session is routed to the tenant given on its first message and stays there.
+        Safe to call concurrently: turns of the same session are serialized (double submits
+        share one answer, messages queued behind a running turn are merged), including a turn
+        abandoned at its deadline, which keeps the session until its agent run has finished.
+        """
+        return self.actors.run(session_id, user_message,
+                               lambda text: self._handle_message(session_id, text, tenant))
+
+    def _handle_message(self, session_id: str, user_message: str, tenant: Optional[str] = None) -> str:
         try:
             # Input validation
             if not user_message or not user_message.strip():
@@ -185,18 +277,68 @@ class CustomerSupportAgent:
             # Get or create agent for this session
             agent = self.sessions.get(session_id)
             if not agent:
-                agent = self._create_agent_for_session(session_id)
+                agent = self._create_agent_for_session(session_id, tenant)
             
             # Cleanup old sessions if too many
             if len(self.sessions) > MAX_ACTIVE_SESSIONS:
-                oldest_session = list(self.sessions.keys())[0]
-                del self.sessions[oldest_session]
+                oldest_session = next(iter(list(self.sessions)), None)
+                # concurrent turns may evict the same session → pop, not del
+                if self.sessions.pop(oldest_session, None) is not None:
+                    ledger.forget(oldest_session)
 
-            # Run the agent - memory is handled automatically by LangChain
-            response = agent.run(user_message)
+            # Run the agent under the request deadline - memory is handled automatically by LangChain
+            # (token usage of the whole turn is booked on the session's ledger)
+            start = time.perf_counter()
+            with ledger.turn(session_id), deadline_scope(REQUEST_DEADLINE_S) as deadline, \
+                    (prefetch_scope() if SPECULATIVE_PREFETCH else nullcontext()):
+                # Over the session's token budget → cheap mode (fewer agent iterations, no rerank, extractive
+                # tools). Checked after ledger.turn() reset the turn's tokens, so only the session total counts
+                # here; the per-turn budget kicks in (cheap_mode()) once this turn itself spends too much
+                if ledger.over_budget(session_id):
+                    ledger.cheap_turns += 1
+                    agent.max_iterations = AGENT_CHEAP_MAX_ITERATIONS
+                else:
+                    agent.max_iterations = AGENT_MAX_ITERATIONS
+                if SPECULATIVE_PREFETCH:
+                    # likely retrievals start now, concurrently with the agent's planning call
+                    self.retriever_manager.prefetch(user_message, (agent.metadata or {}).get("tenant"))
+                agent_budget = max(0.0, deadline.remaining() - DEGRADED_RESERVE_S)
+                agent.max_execution_time = agent_budget
+                # copy_context → the deadline, ledger session and prefetch cache follow the turn into the worker thread
+                context = contextvars.copy_context()
+                # profiled() → agent.invoke itself unless a cProfile capture is armed (/profile calls N)
+                future = self._executor.submit(context.run, profiler.profiled(agent.invoke), {"input": user_message})
+                try:
+                    response = future.result(timeout=agent_budget)["output"]
+                except FutureTimeout:
+                    if not deadline.cancel():
+                        # the agent already wrote its answer to memory → it is about to return it
+                        response = future.result()["output"]
+                    else:
+                        # the abandoned turn will not touch memory; the answer the user gets is recorded instead.
+                        # Still queued (pool saturated) → never starts; running → the session stays busy
+                        # until the agent run actually stops (same executor, same memory)
+                        future.cancel()
+                        self.actors.hold(session_id, future)
+                        response = self._degraded_answer(user_message, (agent.metadata or {}).get("tenant"))
+                        agent.memory.chat_memory.add_user_message(user_message)
+                        agent.memory.chat_memory.add_ai_message(response)
+                        return response
             
             # Clean the response
             response = self._clean_response(response)
+
+            if SHADOW_ANSWERS:
+                # Shadow: direct retrieval answer (no agent LLM) vs the agent's answer, in the background
+                tenant = (agent.metadata or {}).get("tenant")
+                shadow.submit(
+                    "answer:direct",
+                    response,
+                    time.perf_counter() - start,
+                    lambda: self._degraded_lookup(user_message, tenant),
+                    answer_similarity,
+                    lambda primary, alternative: {"query": user_message, "primary": primary, "shadow": alternative},
+                )
             
             return response
 
@@ -212,6 +354,51 @@ class CustomerSupportAgent:
             else:
                 return PROCESSING_ERROR.format(error=error_str)
     
+    def _degraded_answer(self, user_message: str, tenant: Optional[str] = None) -> str:
+        """Deadline reached: answer from the catalog directly (no LLM), within the reserved budget."""
+        self.degraded_count += 1
+        future = self._degraded_executor.submit(self._degraded_lookup, user_message, tenant)
+        try:
+            return future.result(timeout=DEGRADED_RESERVE_S)
+        except Exception:
+            return DEGRADED_MESSAGE
+
+    def _degraded_lookup(self, user_message: str, tenant: Optional[str] = None) -> str:
+        # FAQ واثقة → الإجابة المخزنة، غير كده أقرب الباقات من الكتالوج
+        faq = self.retriever_manager.get_scored_documents(user_message, "faq", tenant=tenant, k=1)
+        if faq and faq[0][1] >= FAQ_EXTRACTIVE_MIN_SCORE:
+            doc = faq[0][0]
+            return FAQ_EXTRACTIVE_TEMPLATE.format(answer=doc.metadata.get("content") or doc.page_content)
+
+        packages = self.retriever_manager.get_scored_documents(
+            user_message, "package", tenant=tenant, k=DEGRADED_MAX_PACKAGES
+        )
+        if packages:
+            docs_text = pack_snippets([doc for doc, _ in packages], RECOMMENDATION_CONTEXT_TOKEN_BUDGET, bullet="🔹 ")
+            return f"{DEGRADED_PACKAGES_HEADER}\n{docs_text}"
+        return DEGRADED_MESSAGE
+
+    def stats(self) -> dict:
+        """Operational counters for dashboards / admin commands."""
+        return {
+            "active_sessions": len(self.sessions),
+            "degraded_answers": self.degraded_count,
+            "hedging": hedge_stats.snapshot(),
+            "prompt_cache": prompt_stats.snapshot(),
+            "tokens": ledger.snapshot(),
+            "prefetch": prefetch_stats.snapshot(),
+            "result_cache": self.retriever_manager.result_cache_stats(),
+            "adaptive_k": adaptive_stats.snapshot(),
+            "faq": faq_stats.snapshot(),
+            "shadow": shadow_stats.snapshot(),
+            "session_queue": self.actors.stats(),
+            "session_tool_cache": session_cache_stats.snapshot(),
+        }
+
+    def reload_catalog(self, tenant: Optional[str] = None) -> dict:
+        """Admin trigger: swap in the latest published catalog version(s) without a restart."""
+        return self.retriever_manager.reload(tenant)
+
     def _clean_response(self, response: str) -> str:
         """Clean the response from unwanted strings and artifacts"""
         if not response:
@@ -244,9 +431,9 @@ class CustomerSupportAgent:
         return response.strip()
 
 
-def create_agent(retriever_manager: RetrieverManager) -> CustomerSupportAgent:
+def create_agent(retriever_manager: RetrieverManager, mode: str = AGENT_MODE) -> CustomerSupportAgent:
     """Factory helper used by the app to create a CustomerSupportAgent instance.
 
     Keeps the top-level import used in `app.py` simple: `from agent import create_agent`.
     """
-    return CustomerSupportAgent(retriever_manager)
+    return CustomerSupportAgent(retriever_manager, mode=mode)
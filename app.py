@@ -3,6 +3,7 @@
 Customer Support Chatbot
 Main application entry point
 """
+import argparse
 import sys
 from pathlib import Path
 
@@ -12,10 +13,23 @@ sys.path.insert(0, str(project_root))
 
 from agent import CustomerSupportAgent
 from utils.retrievers import RetrieverManager
+from utils.profiling import profiler, profile_command
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="مساعد فودافون الذكي - وضع التفاعل المباشر")
+    parser.add_argument("--profile-sample", type=float, metavar="SECONDS",
+                        help="sampling profile of the first SECONDS (collapsed stacks in PROFILE_DIR)")
+    parser.add_argument("--profile-calls", type=int, metavar="N", help="cProfile the first N messages")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="tracemalloc on; top-allocations report on exit")
+    return parser.parse_args()
 
 def main():
     """Main application entry point"""
+    args = parse_args()
     print("🚀 بدء تشغيل مساعد فودافون الذكي...")
+    if args.trace_memory:
+        profiler.start_memory_tracing()
     
     try:
         # Initialize components
@@ -24,6 +38,11 @@ def main():
         bot = CustomerSupportAgent(retriever_manager)
         
         print("✅ تم تهيئة البوت بنجاح!")
+        if args.profile_sample:
+            print(f"🔬 sampling profile → {profiler.start_sampling(args.profile_sample)}")
+        if args.profile_calls:
+            profiler.profile_calls(args.profile_calls)
+            print(f"🔬 cProfile لأول {args.profile_calls} رسائل → {profiler.output_dir}")
         print("\n📱 يمكنك الآن استخدام البوت:")
         print("   - Streamlit: streamlit run streamlit_app.py")
         print("   - Chainlit: chainlit run chainlit_app.py --port 8000")
@@ -31,7 +50,7 @@ def main():
         
         # Interactive mode
         print("\n💬 وضع التفاعل المباشر:")
-        print("اكتب 'exit' للخروج")
+        print("اكتب 'exit' للخروج، أو '/reload' لتحميل آخر نسخة من الكتالوج، أو '/profile' للـ profiler")
         print("-" * 50)
         
         session_id = "interactive_session"
@@ -41,11 +60,21 @@ def main():
                 user_input = input("\n👤 أنت: ").strip()
                 
                 if user_input.lower() in ['exit', 'quit', 'خروج']:
+                    if args.trace_memory:
+                        print(f"🔬 {profiler.memory_report(bot.sessions)}")
                     print("👋 وداعاً!")
                     break
                 
                 if not user_input:
                     continue
+
+                if user_input == "/reload":
+                    print(f"🔄 إصدارات الكتالوج: {bot.reload_catalog()}")
+                    continue
+
+                if user_input.startswith("/profile"):
+                    print(profile_command(user_input.split()[1:], bot.sessions))
+                    continue
                 
                 print("🤖 البوت: ", end="")
                 response = bot.handle_message(session_id, user_input)
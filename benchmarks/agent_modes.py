@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ReAct vs native tool-calling agent mode
+Runs the same conversations through both modes and reports latency,
+LLM round-trips, tokens and parse-error retries per turn.
+
+Usage: python3 benchmarks/agent_modes.py [--modes react tools] [--runs 3]
+"""
+import argparse
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from langchain_community.callbacks import get_openai_callback
+from agent import CustomerSupportAgent
+from utils.retrievers import RetrieverManager
+
+# Each conversation is a list of turns in one session
+CONVERSATIONS = [
+    ["إزاي أشحن رصيد؟"],
+    ["ايه الباقات المتاحة؟"],
+    ["عايز باقة للمكالمات بحد ١٠٠ج"],
+    ["تفاصيل فليكس ٧٠", "قارنها بفليكس ١٠٠"],
+    ["قارن بين فليكس ٧٠ و Plus 60 و باقة Plus 85 جنيه"],
+    ["عندي مشكلة في النت بطيء جداً"],
+]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_mode(mode: str, retriever_manager: RetrieverManager, runs: int) -> dict:
+    bot = CustomerSupportAgent(retriever_manager, mode=mode)
+
+    parse_errors = 0
+    original_handler = bot._handle_parsing_error
+
+    def counting_handler(error_message: str) -> str:
+        nonlocal parse_errors
+        parse_errors += 1
+        return original_handler(error_message)
+
+    bot._handle_parsing_error = counting_handler
+
+    latencies, requests, prompt_tokens, completion_tokens = [], [], [], []
+    for _ in range(runs):
+        for conversation in CONVERSATIONS:
+            session_id = f"bench-{mode}-{uuid.uuid4()}"
+            for message in conversation:
+                with get_openai_callback() as cb:
+                    start = time.perf_counter()
+                    bot.handle_message(session_id, message)
+                    latencies.append(time.perf_counter() - start)
+                requests.append(cb.successful_requests)
+                prompt_tokens.append(cb.prompt_tokens)
+                completion_tokens.append(cb.completion_tokens)
+
+    return {
+        "turns": len(latencies),
+        "p50_s": statistics.median(latencies),
+        "p95_s": percentile(latencies, 95),
+        "llm_calls": statistics.mean(requests),
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "completion_tokens": statistics.mean(completion_tokens),
+        "parse_errors": parse_errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare agent modes on the same conversations")
+    parser.add_argument("--store", default="./chroma_store")
+    parser.add_argument("--modes", nargs="+", default=["react", "tools"])
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args()
+
+    retriever_manager = RetrieverManager(persist_directory=args.store)
+    results = {mode: run_mode(mode, retriever_manager, args.runs) for mode in args.modes}
+
+    columns = ["turns", "p50_s", "p95_s", "llm_calls", "prompt_tokens", "completion_tokens", "parse_errors"]
+    print(f"{'mode':<8}" + "".join(f"{c:>19}" for c in columns))
+    for mode, row in results.items():
+        print(f"{mode:<8}" + "".join(f"{row[c]:>19.2f}" if isinstance(row[c], float) else f"{row[c]:>19}" for c in columns))
+    print("(llm_calls / tokens are per turn, including tool and rerank calls)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Fork smoke test for the pre-fork server (server.py): a retrieval query in the parent, then
+chat turns (FAQ + recommendation → vector searches) in forked workers, per backend.
+
+- chroma: the parent is built with defer_chroma=True → its query is refused (no Chroma client
+  before fork()), the workers open their own stores and answer.
+- local:  the parent's query runs on the shared mmap index, the workers answer too.
+- chroma-eager: the pre-fix setup (Chroma queried in the parent, no defer) → the workers must
+  fail fast at after_fork() instead of hanging on their first query.
+
+The store is ingested in a separate process (as in a deployment: ingest, then start the server),
+and each case runs in its own process. Uses the soak test's fake LLMs and HashingEmbeddings
+(no API key needed); exits non-zero on failure.
+
+Usage: python3 benchmarks/fork_smoke.py
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-soak-test")
+
+import server
+from benchmarks.retrieval_eval import HashingEmbeddings, build_store
+from benchmarks.soak import install_fakes
+from utils.retrievers import RetrieverManager, RetrievalOptions
+
+CASES = ("chroma", "local", "chroma-eager")
+MESSAGES = ["إزاي أشحن رصيد؟", "عايز باقة للمكالمات بحد ١٠٠ج"]
+
+
+def parent_query(retriever_manager: RetrieverManager) -> str:
+    try:
+        docs = retriever_manager.get_documents("فليكس ٧٠", "package")
+    except RuntimeError as e:
+        return f"refused ({e})"
+    return f"{len(docs)} docs"
+
+
+def run_case(case: str, store: str) -> bool:
+    install_fakes(0.0)
+    embeddings = HashingEmbeddings()
+    backend = "local" if case == "local" else "chroma"
+    retriever_manager = RetrieverManager(store, embeddings=embeddings, backend=backend,
+                                         defer_chroma=case != "chroma-eager",
+                                         options=RetrievalOptions(rerank=False))
+    print(f"[{case}] parent query: {parent_query(retriever_manager)}")
+
+    workers = server.start_workers(retriever_manager, 2)
+    router = server.Router(workers)
+    ok = True
+    try:
+        for i, message in enumerate(MESSAGES * 2):
+            start = time.perf_counter()
+            try:
+                result = router.chat({"session_id": f"smoke-{i}", "message": message})
+                outcome = f"worker {result['worker']}: {str(result['response'])[:50]!r}"
+                passed = case != "chroma-eager" and bool(result["response"])
+            except Exception as e:
+                outcome = f"{type(e).__name__}: {e}"
+                # the eager setup must fail fast (worker exited), never time out
+                passed = case == "chroma-eager" and not isinstance(e, server.FutureTimeout)
+            elapsed = time.perf_counter() - start
+            print(f"[{case}] {'✅' if passed else '❌'} {elapsed:5.2f}s {outcome}")
+            ok = ok and passed
+    finally:
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pre-fork server smoke test")
+    parser.add_argument("--case", choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--build", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.build:
+        build_store(args.store, HashingEmbeddings(), local_index=True)
+        return 0
+    if args.case:
+        return 0 if run_case(args.case, args.store) else 1
+
+    store = tempfile.mkdtemp(prefix="fork-smoke-")
+    subprocess.check_call([sys.executable, __file__, "--build", "--store", store])
+    failed = [case for case in CASES
+              if subprocess.call([sys.executable, __file__, "--case", case, "--store", store]) != 0]
+    print(f"❌ failed: {', '.join(failed)}" if failed else "✅ all cases passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: hedged vs plain LLM calls against a fake backend with heavy-tailed latency
+(no API key needed). Reports p50/p90/p99 latency and the extra request volume.
+
+Usage: python3 benchmarks/hedging.py [--calls 400] [--concurrency 16] [--tail 0.05]
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from utils.hedging import HedgedChatModel, hedge_stats
+
+
+class FakeHeavyTailChat(BaseChatModel):
+    """Fake provider: fast most of the time, occasionally very slow (independent per request)."""
+
+    median_s: float = 0.05
+    tail_probability: float = 0.05
+    tail_s: float = 1.0
+    requests: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-heavy-tail"
+
+    def _latency(self) -> float:
+        if random.random() < self.tail_probability:
+            return self.tail_s * random.uniform(1, 3)
+        return random.lognormvariate(0, 0.3) * self.median_s
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        with _lock:
+            self.requests += 1
+        time.sleep(self._latency())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+
+_lock = threading.Lock()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run(llm, calls: int, concurrency: int) -> list:
+    def one(_):
+        start = time.perf_counter()
+        llm.invoke([HumanMessage(content="ping")])
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(calls)))
+
+
+def report(name: str, durations: list, requests: int, calls: int):
+    print(f"{name:<8} p50={percentile(durations, 50) * 1000:7.1f}ms "
+          f"p90={percentile(durations, 90) * 1000:7.1f}ms "
+          f"p99={percentile(durations, 99) * 1000:7.1f}ms "
+          f"requests={requests} (+{(requests - calls) / calls:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedged vs plain LLM calls (fake backend)")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tail", type=float, default=0.02, help="probability of a slow response")
+    args = parser.parse_args()
+
+    plain = FakeHeavyTailChat(tail_probability=args.tail)
+    report("plain", run(plain, args.calls, args.concurrency), plain.requests, args.calls)
+
+    backend = FakeHeavyTailChat(tail_probability=args.tail)
+    llm = HedgedChatModel(primary=backend, call_type="bench")
+    # warm-up so the hedge delay comes from the observed p90, not the default
+    run(llm, 50, args.concurrency)
+    backend.requests = 0
+    before = hedge_stats.snapshot().get("bench", {})
+    report("hedged", run(llm, args.calls, args.concurrency), backend.requests, args.calls)
+
+    after = hedge_stats.snapshot()["bench"]
+    print(f"hedges sent={after['hedged'] - before.get('hedged', 0)} "
+          f"won={after['hedge_wins'] - before.get('hedge_wins', 0)} "
+          f"denied by budget={after['denied'] - before.get('denied', 0)} "
+          f"p90 delay={after['p90_s'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
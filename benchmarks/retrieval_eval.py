@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Retrieval evaluation: quality vs latency of RetrieverManager configurations
+over the labeled queries in benchmarks/labeled_queries.json.
+
+Builds a throwaway store from data/data.json with a local hashing embedding
+(no API key needed) and reports recall@k, MRR and per-stage latency for each
+configuration side by side. LLM-rerank configurations need OPENAI_API_KEY and --llm-rerank.
+
+Usage: python3 benchmarks/retrieval_eval.py [--runs 3] [--llm-rerank] [--verbose]
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Optional
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import OPENAI_API_KEY
+from utils.chunking import RecordChunker
+from utils.ingest import ChromaIngestor
+from utils.retrievers import RetrieverManager, RetrievalOptions
+from utils.tenants import TenantConfig
+
+LABELED_QUERIES = project_root / "benchmarks" / "labeled_queries.json"
+DATA_FILE = project_root / "data" / "data.json"
+
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+# أشكال الحروف المختلفة → شكل واحد (أ/إ/آ → ا، ة → ه، ى → ي)
+_LETTERS = str.maketrans("أإآةى", "اااهي")
+
+
+class HashingEmbeddings(Embeddings):
+    """Local lexical embedding: hashed character n-grams (deterministic, no model download).
+
+    Good enough to compare pipeline stages against each other; absolute numbers will
+    be lower than with the production embedding model.
+    """
+
+    def __init__(self, dims: int = 1024, ngrams=(2, 3, 4)):
+        self.dims = dims
+        self.ngrams = ngrams
+
+    def _embed(self, text: str) -> List[float]:
+        text = re.sub(r"[،,]", "", text.lower().translate(_ARABIC_DIGITS).translate(_LETTERS))
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in text.split():
+            word = f" {word} "
+            for n in self.ngrams:
+                for i in range(len(word) - n + 1):
+                    vector[zlib.crc32(word[i:i + n].encode("utf-8")) % self.dims] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+# name → (options, k per retriever type)
+CONFIGURATIONS = {
+    "full (no rerank)": (RetrievalOptions(rerank=False, adaptive_k=False), None),
+    "adaptive k": (RetrievalOptions(rerank=False, adaptive_k=True), None),
+    "no expansion": (RetrievalOptions(rerank=False, expand_query=False), None),
+    "no family filter": (RetrievalOptions(rerank=False, family_filter=False), None),
+    "no number filter": (RetrievalOptions(rerank=False, number_filter=False), None),
+    "hybrid off": (RetrievalOptions(rerank=False, numeric_index=False), None),
+    "semantic only": (RetrievalOptions(rerank=False, expand_query=False, numeric_index=False,
+                                       family_filter=False, number_filter=False, adaptive_k=False), None),
+    "fixed k=2": (RetrievalOptions(rerank=False, adaptive_k=False), 2),
+    "fixed k=10": (RetrievalOptions(rerank=False, adaptive_k=False), 10),
+}
+RERANK_CONFIGURATIONS = {
+    "full + LLM rerank": (RetrievalOptions(adaptive_k=False), None),
+    "adaptive k + LLM rerank": (RetrievalOptions(adaptive_k=True), None),
+}
+
+
+def build_store(directory: str, embeddings: Embeddings, local_index: Optional[bool] = None):
+    with open(DATA_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    ChromaIngestor(directory, embeddings=embeddings).ingest(RecordChunker().chunk(data), local_index=local_index)
+
+
+def evaluate(name, options, k, directory, embeddings, queries, runs, verbose):
+    tenant = TenantConfig() if k is None else TenantConfig(k={"faq": k, "package": k})
+    manager = RetrieverManager(directory, embeddings=embeddings, tenants=[tenant],
+                               options=replace(options, record_timings=True))
+
+    recalls, reciprocal_ranks, latencies, retrieved = [], [], [], []
+    for run in range(runs):
+        manager.clear_result_cache()
+        for item in queries:
+            start = time.perf_counter()
+            docs = manager.get_documents(item["query"], item["type"])
+            latencies.append(time.perf_counter() - start)
+            if run:
+                continue
+            titles = [doc.metadata.get("title") for doc in docs]
+            expected = set(item["expected"])
+            hits = [i for i, title in enumerate(titles) if title in expected]
+            recalls.append(len(expected & set(titles)) / len(expected))
+            reciprocal_ranks.append(1 / (hits[0] + 1) if hits else 0.0)
+            retrieved.append(len(docs))
+            if verbose and not hits:
+                print(f"  ✗ [{name}] {item['query']} → {titles}")
+
+    stages = {stage: statistics.mean(times) * 1000 for stage, times in manager.stage_timings.items()}
+    return {
+        "name": name,
+        "recall": statistics.mean(recalls),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "docs": statistics.mean(retrieved),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality vs latency per configuration")
+    parser.add_argument("--runs", type=int, default=3, help="latency runs per configuration (metrics from the first)")
+    parser.add_argument("--llm-rerank", action="store_true", help="also evaluate LLM-rerank configurations (needs OPENAI_API_KEY)")
+    parser.add_argument("--verbose", action="store_true", help="print queries with no relevant doc retrieved")
+    args = parser.parse_args()
+
+    with open(LABELED_QUERIES, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    configurations = dict(CONFIGURATIONS)
+    if args.llm_rerank:
+        if not OPENAI_API_KEY:
+            sys.exit("--llm-rerank needs OPENAI_API_KEY")
+        configurations.update(RERANK_CONFIGURATIONS)
+
+    embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as directory:
+        build_store(directory, embeddings)
+        results = [
+            evaluate(name, options, k, directory, embeddings, queries, args.runs, args.verbose)
+            for name, (options, k) in configurations.items()
+        ]
+
+    stage_names = sorted({stage for r in results for stage in r["stages"]})
+    print(f"\n{len(queries)} labeled queries, recall@k / MRR over the docs each configuration returns\n")
+    header = f"{'configuration':<22} {'recall':>7} {'MRR':>6} {'docs':>5} {'p50 ms':>8}"
+    header += "".join(f" {stage[:13]:>13}" for stage in stage_names)
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        line = f"{r['name']:<22} {r['recall']:>7.3f} {r['mrr']:>6.3f} {r['docs']:>5.1f} {r['p50_ms']:>8.2f}"
+        line += "".join(f" {r['stages'].get(stage, 0.0):>13.3f}" for stage in stage_names)
+        print(line)
+    print("\nstage columns: mean ms per call of that stage")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Soak / load test: hundreds of concurrent Chainlit-style users (sessions with think times,
+new sessions all the time) against fake LLM and embedding backends (no API key needed).
+
+The agent, tools, retrieval and session handling are the real code; only the OpenAI chat
+models are replaced by fakes with realistic latency (constructed the same way, per session,
+so client objects accumulating show up) and the embeddings by the local HashingEmbeddings.
+
+Samples RSS, live objects (total + agent / client types), throughput and latency
+percentiles over time, optionally ramps the number of users first to find the throughput
+knee, and exits non-zero when the RSS slope, p99 or error rate exceed their thresholds.
+
+Usage: python3 benchmarks/soak.py [--users 200] [--duration 600] [--ramp 25 50 100 200]
+                                  [--max-rss-slope 2.0] [--max-p99 5.0]
+"""
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+import warnings
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# the fakes never call OpenAI; the key only has to exist for require_openai_key()
+os.environ.setdefault("OPENAI_API_KEY", "sk-soak-test")
+
+from langchain.agents import AgentExecutor
+from langchain.memory import ConversationBufferMemory
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import agent as agent_module
+import src.nodes.faq_node as faq_node
+import src.nodes.package_recommendation_node as recommendation_node
+import src.nodes.support_node as support_node
+import utils.retrievers as retrievers
+from benchmarks.retrieval_eval import HashingEmbeddings, build_store
+from constants import MAX_ACTIVE_SESSIONS, PROCESSING_ERROR
+from utils.history import CompactHistory
+from utils.retrievers import RetrieverManager, RetrievalOptions
+from utils.session_cache import SessionToolCache
+
+# Each conversation is one user session (a new session every time it is picked)
+CONVERSATIONS = [
+    ["إزاي أشحن رصيد؟", "طب ولو الكارت مش شغال؟"],
+    ["ايه الباقات المتاحة؟", "تفاصيل فليكس ٧٠"],
+    ["عايز باقة للمكالمات بحد ١٠٠ج", "تفاصيل الباقة السابقة"],
+    ["تفاصيل فليكس ٧٠", "قارنها بفليكس ١٠٠"],
+    ["قارن بين فليكس ٧٠ و Plus 60 و باقة Plus 85 جنيه"],
+    ["عندي مشكلة في النت بطيء جداً", "لسه بطيء بعد ما عملت ريستارت"],
+]
+
+# keyword → (tool, argument) for the fake agent's "decision"
+ROUTES = [
+    ("قارن", "package_compare_tool", "package_names"),
+    ("بحد", "package_recommendation_tool", "user_needs"),
+    ("عايز باقة", "package_recommendation_tool", "user_needs"),
+    ("مشكلة", "support_tool", "issue_description"),
+    ("بطيء", "support_tool", "issue_description"),
+    ("باق", "package_info_tool", "package_query"),
+    ("فليكس", "package_info_tool", "package_query"),
+]
+
+LLM_LATENCY_S = 0.08  # median fake LLM latency (--llm-latency)
+
+ANSWER = "تمام، دي التفاصيل اللي طلبتها: {detail}. لو محتاج أي حاجة تانية أنا موجود."
+
+# Object types counted in every sample (leaks show up as a growing count)
+TRACKED_TYPES = {
+    "chat_models": BaseChatModel,
+    "agents": AgentExecutor,
+    "memories": ConversationBufferMemory,
+    "histories": CompactHistory,
+    "tool_caches": SessionToolCache,
+}
+
+
+def route(message: str):
+    for keyword, tool, argument in ROUTES:
+        if keyword in message:
+            return tool, argument
+    return "faq_tool", "question"
+
+
+class FakeChat(BaseChatModel):
+    """Fake provider: lognormal latency around LLM_LATENCY_S, accepts ChatOpenAI's constructor kwargs."""
+
+    model_name: str = "fake"
+    temperature: float = 0.0
+    api_key: str = ""
+    request_timeout: float = 0.0
+    max_retries: int = 0
+    bound_tools: bool = False
+
+    def __init__(self, model: str = "fake", **kwargs):
+        kwargs.setdefault("model_name", model)
+        super().__init__(**{k: v for k, v in kwargs.items() if k in type(self).model_fields})
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-soak"
+
+    def _sleep(self) -> None:
+        time.sleep(random.lognormvariate(0, 0.4) * LLM_LATENCY_S)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._sleep()
+        detail = str(messages[-1].content)[-120:].replace("\n", " ")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=ANSWER.format(detail=detail)))])
+
+
+class FakeAgentChat(FakeChat):
+    """Fake agent model: one tool call routed by keyword, then a final answer (ReAct text or native tool calls)."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"bound_tools": True})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._sleep()
+        # tools come bound (bind_tools) or, through a wrapper model, as a call kwarg
+        if self.bound_tools or kwargs.get("tools"):
+            message = self._tool_calling(messages)
+        else:
+            message = AIMessage(content=self._react(str(messages[-1].content)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    @staticmethod
+    def _react(prompt: str) -> str:
+        turn = prompt.rsplit("New input:", 1)[-1]
+        if "Observation:" in turn:
+            observation = turn.rsplit("Observation:", 1)[-1].strip()[:200].replace("\n", " ")
+            return f"Do I need to use a tool? No\nAI: {ANSWER.format(detail=observation)}"
+        user_input = turn.strip().split("\n", 1)[0]
+        tool, _ = route(user_input)
+        return f"Do I need to use a tool? Yes\nAction: {tool}\nAction Input: {user_input}"
+
+    @staticmethod
+    def _tool_calling(messages) -> AIMessage:
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage(content=ANSWER.format(detail=str(messages[-1].content)[:200]))
+        user_input = str(messages[-1].content)
+        tool, argument = route(user_input)
+        return AIMessage(content="", tool_calls=[{"name": tool, "args": {argument: user_input}, "id": uuid.uuid4().hex}])
+
+
+def install_fakes(latency_s: float) -> None:
+    """Every ChatOpenAI the agent / tools / reranker construct becomes a fake (same call sites)."""
+    global LLM_LATENCY_S
+    LLM_LATENCY_S = latency_s
+    agent_module.ChatOpenAI = FakeAgentChat
+    for module in (faq_node, recommendation_node, support_node, retrievers):
+        module.ChatOpenAI = FakeChat
+
+
+# ===== Measurements =====
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource  # not Linux: peak RSS (KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def object_counts() -> Dict[str, int]:
+    objects = gc.get_objects()
+    counts = Counter()
+    for obj in objects:
+        for name, cls in TRACKED_TYPES.items():
+            if isinstance(obj, cls):
+                counts[name] += 1
+    counts["gc_objects"] = len(objects)
+    return {name: counts[name] for name in ["gc_objects", *TRACKED_TYPES]}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def slope_per_minute(points) -> float:
+    """Least-squares slope of (seconds, value) points, per minute."""
+    if len(points) < 3:
+        return 0.0
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if not var:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var * 60
+
+
+class Recorder:
+    """Latencies and errors, drained per sampling window."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.turns = 0
+        self.all_latencies: List[float] = []
+        self.total_errors = 0
+        self.error_messages: Counter = Counter()
+
+    def add(self, latency: float, error: str = "") -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.turns += 1
+            if error:
+                self.errors += 1
+                self.error_messages[error[:160]] += 1
+
+    def drain(self):
+        with self._lock:
+            latencies, errors = self.latencies, self.errors
+            self.latencies, self.errors = [], 0
+            self.all_latencies += latencies
+            self.total_errors += errors
+        return latencies, errors
+
+
+# ===== Load =====
+
+def user_loop(bot, recorder: Recorder, stop: threading.Event, think_s: float, index: int) -> None:
+    rng = random.Random(index)
+    stop.wait(rng.uniform(0, think_s))  # staggered arrivals
+    while not stop.is_set():
+        session_id = f"soak-{index}-{uuid.uuid4().hex[:8]}"
+        for message in rng.choice(CONVERSATIONS):
+            if stop.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                response = bot.handle_message(session_id, message)
+                error = response if response.startswith(PROCESSING_ERROR.split("{")[0]) else ""
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            recorder.add(time.perf_counter() - start, error)
+            stop.wait(rng.expovariate(1 / think_s))
+
+
+def run_load(bot, users: int, duration_s: float, think_s: float, interval_s: float,
+             on_sample=None) -> Recorder:
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=user_loop, args=(bot, recorder, stop, think_s, i), name=f"user{i}", daemon=True)
+        for i in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    started = last = time.monotonic()
+    while last - started < duration_s:
+        time.sleep(min(interval_s, max(0.0, duration_s - (last - started))))
+        latencies, errors = recorder.drain()
+        now = time.monotonic()
+        if on_sample is not None:
+            on_sample(now - started, now - last, latencies, errors)
+        last = now
+    stop.set()
+    for thread in threads:
+        thread.join()
+    recorder.drain()
+    return recorder
+
+
+def ramp(bot, levels: List[int], step_s: float, think_s: float) -> None:
+    """Throughput and p99 per number of concurrent users; the knee is where throughput stops following."""
+    print(f"{'users':>6}{'turns/s':>10}{'p50_s':>9}{'p99_s':>9}{'errors':>8}")
+    previous = None
+    knee = None
+    for users in levels:
+        recorder = run_load(bot, users, step_s, think_s, step_s)
+        throughput = recorder.turns / step_s
+        latencies = recorder.all_latencies or [0.0]
+        print(f"{users:>6}{throughput:>10.1f}{statistics.median(latencies):>9.2f}"
+              f"{percentile(latencies, 99):>9.2f}{recorder.total_errors:>8}")
+        # more users but <10% of the expected extra throughput → past the knee
+        if previous is not None and knee is None:
+            prev_users, prev_throughput = previous
+            expected = prev_throughput * (users / prev_users - 1)
+            if throughput - prev_throughput < 0.1 * expected:
+                knee = prev_users
+        previous = (users, throughput)
+    print(f"throughput knee ≈ {knee} users" if knee else "no knee within the ramp")
+    print()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Soak / load test against fake LLM and embedding backends")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=600, help="soak duration (seconds)")
+    parser.add_argument("--interval", type=float, default=10, help="sampling interval (seconds)")
+    parser.add_argument("--think", type=float, default=2.0, help="mean think time between turns (seconds)")
+    parser.add_argument("--llm-latency", type=float, default=0.08, help="median fake LLM latency (seconds)")
+    parser.add_argument("--mode", choices=["react", "tools"], default="react")
+    parser.add_argument("--ramp", type=int, nargs="*", default=[], help="user levels to ramp through first")
+    parser.add_argument("--ramp-step", type=float, default=30, help="seconds per ramp level")
+    parser.add_argument("--trace-heap", action="store_true",
+                        help="also sample the Python heap (tracemalloc): RSS growth with a flat heap is allocator, not a leak")
+    parser.add_argument("--warmup", type=float, default=0.2, help="fraction of samples ignored for the slopes")
+    parser.add_argument("--max-rss-slope", type=float, default=2.0, help="MB per minute")
+    parser.add_argument("--max-p99", type=float, default=5.0, help="seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=DeprecationWarning)  # LangChain memory / agent notices
+    install_fakes(args.llm_latency)
+    store = tempfile.mkdtemp(prefix="soak-store-")
+    embeddings = HashingEmbeddings()
+    build_store(store, embeddings)
+    retriever_manager = RetrieverManager(store, embeddings=embeddings, options=RetrievalOptions(rerank=False))
+    bot = agent_module.CustomerSupportAgent(retriever_manager, mode=args.mode)
+
+    # no chain logging: hundreds of users would drown the report
+    create_agent = bot._create_agent_for_session
+
+    def quiet_agent(session_id, tenant=None):
+        executor = create_agent(session_id, tenant)
+        executor.verbose = False
+        return executor
+
+    bot._create_agent_for_session = quiet_agent
+
+    if args.ramp:
+        ramp(bot, args.ramp, args.ramp_step, args.think)
+
+    samples = []
+    if args.trace_heap:
+        tracemalloc.start()
+    columns = ["t_s", "rss_mb", *(["heap_mb"] if args.trace_heap else []), "turns/s", "p50_s", "p99_s", "errors", "sessions", *object_counts()]
+    print(f"soak: {args.users} users, {args.duration:g}s, think {args.think:g}s, mode {args.mode}")
+    print("".join(f"{c:>12}" for c in columns))
+
+    def on_sample(elapsed, window_s, latencies, errors):
+        gc.collect()  # count what is still reachable, not what is waiting for a collection
+        row = {
+            "t_s": elapsed,
+            "rss_mb": rss_mb(),
+            "heap_mb": tracemalloc.get_traced_memory()[0] / 1e6 if args.trace_heap else 0.0,
+            "turns/s": len(latencies) / window_s,
+            "p50_s": statistics.median(latencies) if latencies else 0.0,
+            "p99_s": percentile(latencies, 99) if latencies else 0.0,
+            "errors": errors,
+            "sessions": len(bot.sessions),
+            **object_counts(),
+        }
+        samples.append(row)
+        print("".join(f"{row[c]:>12.2f}" if isinstance(row[c], float) else f"{row[c]:>12}" for c in columns),
+              flush=True)
+
+    recorder = run_load(bot, args.users, args.duration, args.think, args.interval, on_sample)
+
+    # ===== Verdict =====
+    steady = samples[int(len(samples) * args.warmup):]
+    rss_slope = slope_per_minute([(s["t_s"], s["rss_mb"]) for s in steady])
+    object_slopes = {name: slope_per_minute([(s["t_s"], s[name]) for s in steady]) for name in object_counts()}
+    latencies = recorder.all_latencies or [0.0]
+    p99 = percentile(latencies, 99)
+    error_rate = recorder.total_errors / max(1, recorder.turns)
+
+    print()
+    print(f"turns: {recorder.turns}, p50 {statistics.median(latencies):.2f}s, p99 {p99:.2f}s, "
+          f"errors {recorder.total_errors} ({error_rate:.2%})")
+    for message, count in recorder.error_messages.most_common(5):
+        print(f"  {count}× {message}")
+    print(f"RSS slope: {rss_slope:+.2f} MB/min (after {args.warmup:.0%} warmup)")
+    if args.trace_heap:
+        print(f"heap slope: {slope_per_minute([(s['t_s'], s['heap_mb']) for s in steady]):+.2f} MB/min")
+    print("object slopes (per min): " + ", ".join(f"{name} {value:+.1f}" for name, value in object_slopes.items()))
+    print(f"(sessions are capped at MAX_ACTIVE_SESSIONS={MAX_ACTIVE_SESSIONS}; "
+          f"a steady positive slope for the agent / client types means evicted sessions are not freed)")
+
+    failures = []
+    if rss_slope > args.max_rss_slope:
+        failures.append(f"RSS slope {rss_slope:+.2f} MB/min > {args.max_rss_slope}")
+    if p99 > args.max_p99:
+        failures.append(f"p99 {p99:.2f}s > {args.max_p99}s")
+    if error_rate > args.max_error_rate:
+        failures.append(f"error rate {error_rate:.2%} > {args.max_error_rate:.2%}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ within thresholds")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Smoke checks on a catalog ingested with category summaries (RecordChunker(summaries=True),
+the README's recommended ingest), on both retrieval backends.
+
+Summary documents list every package of a category, so they rank high for many package
+queries, yet they are not a single record. The checks make sure they never stand in for one.
+
+Uses HashingEmbeddings (no API key needed); exits non-zero on failure.
+
+Usage: python3 benchmarks/summaries_smoke.py
+"""
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-smoke-test")
+
+from langchain.memory import ConversationBufferMemory
+
+from benchmarks.retrieval_eval import DATA_FILE, HashingEmbeddings
+from src.nodes.package_compare_node import PackageCompareTool
+from utils.chunking import RecordChunker
+from utils.ingest import ChromaIngestor
+from utils.retrievers import RetrieverManager, RetrievalOptions
+
+
+def build_summaries_store(directory: str, embeddings) -> List[str]:
+    """Ingest with summaries; returns the summaries' texts."""
+    with open(DATA_FILE, "r", encoding="utf-8") as f:
+        docs = RecordChunker(summaries=True).chunk(json.load(f))
+    ChromaIngestor(directory, embeddings=embeddings).ingest(docs, local_index=True)
+    return [doc.page_content for doc in docs if doc.metadata.get("chunk") == "summary"]
+
+
+def check_resolve_skips_summaries(manager: RetrieverManager, summaries: List[str]) -> str:
+    # a summary's own text → the summary is the top vector hit
+    names = summaries + ["plus business packages 5"]
+    for name, record in zip(names, manager.resolve_packages(names)):
+        assert record is None or record.record_id, f"{name[:30]!r} → {record}"
+    return f"{len(names)} names resolved without a summary standing in for a record"
+
+
+def check_compare_row_shape(manager: RetrieverManager, summaries: List[str]) -> str:
+    rows = PackageCompareTool(manager, ConversationBufferMemory()).compare(["Plus 60", "باقة ٩٩٩"])
+    assert [row["found"] for row in rows] == [True, False], rows
+    assert rows[0].keys() == rows[1].keys(), (rows[0].keys(), rows[1].keys())
+    return "found and not-found rows have the same keys"
+
+
+def check_package_query_returns_record(manager: RetrieverManager, summaries: List[str]) -> str:
+    for query in ("plus_packages 60", "Plus 60", "فليكس ٧٠"):
+        docs = manager.get_documents(query, "package")
+        assert docs and docs[0].metadata.get("record_id"), f"{query!r} → {docs[0].metadata if docs else []}"
+        assert all(doc.metadata.get("chunk") != "summary" for doc in docs), query
+    return "package queries return records, never overviews"
+
+
+def check_listing_gets_overviews(manager: RetrieverManager, summaries: List[str]) -> str:
+    docs = manager.get_documents("ايه الباقات المتاحة؟", "package_summary")
+    assert docs and all(doc.metadata.get("chunk") == "summary" for doc in docs), docs
+    return f"{len(docs)} overviews for a listing request"
+
+
+CHECKS: List[Tuple[str, Callable[[RetrieverManager, List[str]], str]]] = [
+    ("resolve_packages skips summaries", check_resolve_skips_summaries),
+    ("compare row shape", check_compare_row_shape),
+    ("package query returns the record", check_package_query_returns_record),
+    ("listing gets the overviews", check_listing_gets_overviews),
+]
+
+
+def main() -> int:
+    store = tempfile.mkdtemp(prefix="summaries-smoke-")
+    embeddings = HashingEmbeddings()
+    summaries = build_summaries_store(store, embeddings)
+    failed = 0
+    for backend in ("chroma", "local"):
+        manager = RetrieverManager(store, embeddings=embeddings, backend=backend,
+                                   options=RetrievalOptions(rerank=False))
+        for name, check in CHECKS:
+            try:
+                print(f"[{backend}] ✅ {name}: {check(manager, summaries)}")
+            except Exception as e:
+                failed += 1
+                print(f"[{backend}] ❌ {name}: {type(e).__name__}: {e}")
+    print(f"❌ {failed} failed" if failed else "✅ all checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,8 @@ Chainlit Chat Interface for Customer Support Agent
 import chainlit as cl
 from agent import CustomerSupportAgent
 from utils.retrievers import RetrieverManager
+from utils.profiling import profile_command, split_admin_args
+from config import PROFILE_COMMANDS
 import uuid
 
 # Global agent instance
@@ -23,6 +25,8 @@ async def start():
         
         retriever_manager = RetrieverManager(persist_directory="./chroma_store")
         agent = CustomerSupportAgent(retriever_manager)
+        # Pick up re-ingested catalogs without restarting (CATALOG_WATCH_INTERVAL > 0)
+        retriever_manager.start_watcher()
         
         await cl.Message(
             content="✅ تم تهيئة المساعد بنجاح!",
@@ -56,12 +60,23 @@ async def main(message: cl.Message):
     
     # Get session ID
     session_id = cl.user_session.get("session_id")
+
+    # Admin: on-demand profiling of this worker (PROFILE_COMMANDS=true + admin identity or token)
+    if PROFILE_COMMANDS and message.content.startswith("/profile"):
+        user = cl.user_session.get("user")
+        args = split_admin_args(message.content.split()[1:], getattr(user, "identifier", None))
+        if args is None:
+            await cl.Message(content="❌ الأمر ده للمسؤولين بس").send()
+        else:
+            await cl.Message(content=profile_command(args, agent.sessions)).send()
+        return
     
     # Show typing indicator
     async with cl.Step(name="🤖 جاري التفكير...") as step:
         try:
-            # Get response from agent
-            response = agent.handle_message(session_id, message.content)
+            # Get response from agent (in a worker thread: other sessions keep being served;
+            # the agent serializes turns of the same session)
+            response = await cl.make_async(agent.handle_message)(session_id, message.content)
             
             step.output = "✅ تم الحصول على الرد"
         except Exception as e:
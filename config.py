@@ -18,7 +18,48 @@ EMBEDDING_MODEL = "text-embedding-3-small"
 LLM_MODEL = "gpt-4o-mini"
 CHROMA_DIR = "./chroma_db"
 COLLECTION_NAME = "vodafone_packages"
+# Stores ingested before named collections live in langchain's default collection
+LEGACY_COLLECTION_NAME = "langchain"
+# Multi-tenant serving: JSON list of tenant configs (see utils/tenants.py); unset → single default tenant
+DEFAULT_TENANT = "default"
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+# Poll for newly published catalog versions every N seconds (0 → only on explicit reload)
+CATALOG_WATCH_INTERVAL = float(os.getenv("CATALOG_WATCH_INTERVAL", "0"))
+# Retrieval backend: "chroma" or "local" (memory-mapped .npy index exported at ingest)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+
+# Adaptive top-k (utils/adaptive_k.py): off until ADAPTIVE_MIN_RELEVANCE / ADAPTIVE_SCORE_GAP are
+# calibrated for the embedding model on benchmarks/labeled_queries.json
+ADAPTIVE_TOP_K = os.getenv("ADAPTIVE_TOP_K", "").lower() in ("1", "true", "yes")
+
+# Hedged LLM calls (utils/hedging.py): off by default; optional faster/cheaper model for the duplicate
+LLM_HEDGING = os.getenv("LLM_HEDGING", "").lower() in ("1", "true", "yes")
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL")
+
+# Speculative retrieval prefetch in parallel with agent planning (utils/prefetch.py)
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "").lower() in ("1", "true", "yes")
+
+# Shadow mode (utils/shadow.py): fraction of requests that also run the alternative pipeline
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+# Retrieval stages the shadow pipeline switches off (RetrievalOptions field names, comma-separated)
+SHADOW_DISABLE_STAGES = os.getenv("SHADOW_DISABLE_STAGES", "rerank")
+# Also compare the agent's answer with a direct retrieval answer (no agent LLM)
+SHADOW_ANSWERS = os.getenv("SHADOW_ANSWERS", "").lower() in ("1", "true", "yes")
+
+# On-demand profiler (utils/profiling.py): output directory, and whether chat users may send /profile
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_COMMANDS = os.getenv("PROFILE_COMMANDS", "").lower() in ("1", "true", "yes")
+# Who may send them: Chainlit user identifiers (comma-separated) and/or a shared admin token
+# (`/profile <token> ...`). Neither set → /profile is refused even with PROFILE_COMMANDS=true
+PROFILE_ADMINS = {u.strip() for u in os.getenv("PROFILE_ADMINS", "").split(",") if u.strip()}
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+
+# Pre-fork server (server.py): worker processes and HTTP port
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
 
 # إعدادات الـ Agent
 AGENT_TEMPERATURE = 0.3
+# "react" (text Thought/Action parsing) or "tools" (native function calling)
+AGENT_MODE = os.getenv("AGENT_MODE", "react")
 MAX_QUESTIONS = 4  # عدد الأسئلة القصوى في الحوار الاستشاري
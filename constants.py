@@ -19,6 +19,11 @@ PROCESSING_ERROR = "عذراً، حدث خطأ في المعالجة: {error}"
 
 NO_RESPONSE = "عذراً، لم أتمكن من تكوين رد مناسب."
 
+# Degraded mode (request deadline reached): direct catalog / FAQ lookup, no LLM
+DEGRADED_PACKAGES_HEADER = "⏱️ دي أقرب الباقات لطلبك من الكتالوج:"
+
+DEGRADED_MESSAGE = "⏱️ عذراً، الخدمة مشغولة حالياً. حاول تاني بعد لحظات أو كلم الدعم على ١٦٠."
+
 ESCALATION_MESSAGE = """
 🙋 سأحولك للدعم المتخصص للمساعدة بشكل أفضل.
 
@@ -26,6 +31,22 @@ ESCALATION_MESSAGE = """
 💬 **الدردشة المباشرة:** متاحة عبر التطبيق
 """
 
+# Per-session queue (utils/session_queue.py): an older message merged into the newer one / backlog full
+SUPERSEDED_MESSAGE = "↪️ تم دمج رسالتك دي مع رسالتك اللي بعدها، والرد هيكون على الاتنين."
+
+SESSION_BUSY_MESSAGE = "⏳ لسه بنرد على رسايلك اللي قبل كده، استنى الرد وبعدين ابعت تاني."
+
+# Extractive FAQ answer: stored answer + light framing, no LLM call
+FAQ_EXTRACTIVE_TEMPLATE = """✅ {answer}
+
+💡 لو محتاج أي مساعدة تانية أنا موجود!"""
+
+# Best-effort FAQ answer (deadline / token budget): closest stored answer, not a confident match
+FAQ_BEST_EFFORT_TEMPLATE = """ℹ️ أقرب إجابة لسؤالك من الأسئلة الشائعة:
+{answer}
+
+💡 لو مش دي اللي تقصدها، وضّح سؤالك أو كلم الدعم على ١٦٠."""
+
 # ===== Listing Keywords =====
 
 LISTING_KEYWORDS = [
@@ -41,6 +62,7 @@ LISTING_KEYWORDS = [
 MAX_MESSAGE_LENGTH = 1000
 MIN_MESSAGE_LENGTH = 2
 MAX_ACTIVE_SESSIONS = 100
+SESSION_MAX_MERGED = 3  # queued messages of one session merged into its next turn before new ones are rejected
 
 # ===== Retrieval Settings =====
 
@@ -48,6 +70,37 @@ MAX_DOCS_FOR_RECOMMENDATION = 6
 MAX_DOCS_FOR_LISTING = 15
 MAX_DOCS_FOR_FAQ = 5
 MAX_DOCS_PER_CATEGORY = 4
+BUDGET_CANDIDATES_K = 8  # budget/quota queries: candidates from the numeric index
+
+# Token budgets for packed record snippets in tool prompts
+FAQ_CONTEXT_TOKEN_BUDGET = 400
+RECOMMENDATION_CONTEXT_TOKEN_BUDGET = 600
+LISTING_CONTEXT_TOKEN_BUDGET = 1200
+
+# ===== Adaptive Top-k Settings =====
+
+# Candidates are cut at a score below ADAPTIVE_MIN_RELEVANCE or a drop larger than
+# ADAPTIVE_SCORE_GAP from the previous doc (cosine relevance; calibrate per embedding model)
+ADAPTIVE_MIN_K = 1
+ADAPTIVE_MIN_RELEVANCE = 0.3
+ADAPTIVE_SCORE_GAP = 0.12
+ADAPTIVE_DUPLICATE_JACCARD = 0.9   # word overlap above this → near-duplicate, keep the better one
+ADAPTIVE_OVERFETCH = 2             # candidates fetched = k * this (capped by RetrieverManager.k)
+RETRIEVAL_CONTEXT_TOKEN_BUDGET = 1200  # docs handed to improve / rerank
+
+# Vector fallback of the compare tool's name resolution: below this cosine relevance a name
+# stays "not found" rather than matching an unrelated package (calibrate per embedding model)
+PACKAGE_RESOLVE_MIN_RELEVANCE = 0.5
+# Hits fetched per name so overview / multi-row documents (no single record) can be skipped
+PACKAGE_RESOLVE_CANDIDATES = 4
+
+# ===== Extractive FAQ Settings =====
+
+# Cosine relevance of the top FAQ hit (calibrate on labeled questions per embedding model);
+# the margin guards against near-ties between two FAQs
+FAQ_EXTRACTIVE_MODE = True
+FAQ_EXTRACTIVE_MIN_SCORE = 0.6
+FAQ_EXTRACTIVE_MIN_MARGIN = 0.08
 
 # ===== Search Queries for Diverse Listing =====
 
@@ -59,9 +112,66 @@ AGENT_MAX_ITERATIONS = 5
 AGENT_TEMPERATURE = 0.3
 AGENT_REQUEST_TIMEOUT = 30
 AGENT_MAX_RETRIES = 2
+AGENT_WORKERS = 32  # threads running agent turns (a timed-out turn keeps its thread until it returns)
+
+# ===== Deadline Settings =====
+
+REQUEST_DEADLINE_S = 12.0     # end-to-end budget per handle_message (p99 SLO)
+DEGRADED_RESERVE_S = 1.5      # kept back for the degraded lookup when the agent runs out of time
+DEGRADED_WORKERS = 4          # own pool: timeouts usually mean the agent pool is saturated
+RERANK_MIN_BUDGET_S = 4.0     # skip the LLM rerank when less than this is left
+TOOL_LLM_MIN_BUDGET_S = 2.0   # tools answer without their LLM call below this
+DEGRADED_MAX_PACKAGES = 3
+
+RESULT_CACHE_SIZE = 1024   # final retrieval results kept (LRU)
+RESULT_CACHE_TTL_S = 600   # and for at most this long
+PREFETCH_WORKERS = 8  # speculative retrievals in flight (unstarted ones are cancelled at turn end)
+
+# ===== Profiling Settings =====
+
+PROFILE_SAMPLE_INTERVAL_S = 0.005  # stack sampling period (~200 Hz)
+PROFILE_MAX_DURATION_S = 120.0     # sampling captures are time-boxed to this
+PROFILE_MAX_CALLS = 50             # cProfile at most this many messages per request
+PROFILE_TOP_N = 30                 # lines in the cProfile / allocation reports
+PROFILE_TRACEMALLOC_FRAMES = 10    # traceback depth kept by tracemalloc
+
+# ===== Pre-fork Server Settings =====
+
+SERVER_WORKER_THREADS = 16                          # concurrent turns per worker process
+SERVER_REQUEST_TIMEOUT_S = REQUEST_DEADLINE_S + 3.0  # router gives up on a worker after this
+
+# ===== Shadow Mode Settings =====
+
+SHADOW_MAX_CONCURRENCY = 2          # shadow runs in flight; samples beyond this are dropped, never queued
+SHADOW_RECENT_DIFFS = 20            # latest disagreements kept for review
+SHADOW_MIN_ANSWER_SIMILARITY = 0.5  # below this an answer pair counts as a disagreement
+
+# ===== Hedging Settings =====
+
+HEDGE_PERCENTILE = 0.9        # hedge after the observed p90 of the call type
+HEDGE_MIN_SAMPLES = 20        # below this, use HEDGE_DEFAULT_DELAY_S
+HEDGE_DEFAULT_DELAY_S = 4.0
+HEDGE_LATENCY_WINDOW = 500    # recent latencies kept per call type
+HEDGE_BUDGET_RATIO = 0.1      # at most ~10% extra requests per call type (≥ 1 - HEDGE_PERCENTILE)
+HEDGE_BUDGET_BURST = 3
+HEDGE_WORKERS = 64
+
+# ===== Token Budget Settings =====
+
+SESSION_TOKEN_BUDGET = 200_000   # over this → cheap mode for the rest of the session
+TURN_TOKEN_BUDGET = 30_000       # over this → cheap mode for the rest of the turn
+AGENT_CHEAP_MAX_ITERATIONS = 2   # agent iterations once the session is over budget
+
+# USD per 1M tokens (gpt-4o-mini / text-embedding-3-small)
+LLM_PRICE_PER_1M_INPUT = 0.15
+LLM_PRICE_PER_1M_CACHED_INPUT = 0.075
+LLM_PRICE_PER_1M_OUTPUT = 0.60
+EMBEDDING_PRICE_PER_1M = 0.02
 
 # ===== Memory Settings =====
 
 RECENT_MESSAGES_LIMIT = 6
+SESSION_TOOL_CACHE_SIZE = 32  # tool outputs kept per session (LRU)
+SESSION_ENTITY_LIMIT = 20     # packages shown per session kept for "الباقة السابقة" / name matches
 SUPPORT_HISTORY_LIMIT = 8
 
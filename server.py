@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Pre-fork multi-worker server
+
+The parent loads everything read-only once (LangChain, catalogs, numeric / local indexes,
+tokenizer, prompt templates), freezes it out of the garbage collector and forks the workers,
+which share those pages copy-on-write. A small HTTP router in the parent pins each session
+to one worker (sticky affinity: a session's memory lives in that worker).
+
+Usage: python3 server.py [--workers 4] [--port 8080]
+
+    POST /chat   {"session_id": "...", "message": "...", "tenant": "..."}  → {"response": "...", "worker": 0}
+    GET  /stats  → per-worker agent stats + RSS / PSS
+"""
+import argparse
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Add project root to Python path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from config import SERVER_WORKERS, SERVER_PORT
+from constants import SERVER_WORKER_THREADS, SERVER_REQUEST_TIMEOUT_S
+from utils.retrievers import RetrieverManager
+from utils.tokens import count_tokens
+import agent as agent_module  # module-level prompt templates are built in the parent
+
+
+def memory_usage() -> Dict[str, int]:
+    """RSS and PSS (pages shared with the other workers counted proportionally), in KB."""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Private_Dirty"):
+                    usage[key.lower() + "_kb"] = int(value.split()[0])
+    except OSError:
+        pass  # not Linux
+    return usage
+
+
+# ===== Worker =====
+
+def worker_main(index: int, conn, retriever_manager: RetrieverManager) -> None:
+    """Forked worker: re-open per-process handles, then serve requests from the router."""
+    retriever_manager.after_fork()
+    random.seed()  # otherwise every worker draws the same "random" numbers (shadow sampling, ...)
+    bot = agent_module.CustomerSupportAgent(retriever_manager)
+    retriever_manager.start_watcher()
+    send_lock = threading.Lock()
+
+    def handle(request_id: int, kind: str, payload: dict) -> None:
+        try:
+            if kind == "chat":
+                result = bot.handle_message(payload["session_id"], payload["message"], payload.get("tenant"))
+            else:
+                result = {"pid": os.getpid(), **memory_usage(), **bot.stats()}
+        except Exception as e:
+            result = {"error": str(e)}
+        with send_lock:
+            conn.send((request_id, result))
+
+    # turns of different sessions run in parallel; the agent serializes each session's turns
+    with ThreadPoolExecutor(max_workers=SERVER_WORKER_THREADS, thread_name_prefix=f"worker{index}") as pool:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            pool.submit(handle, *message)
+
+
+# ===== Router (parent) =====
+
+class Worker:
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.pending: Dict[int, Future] = {}
+
+    def call(self, request_id: int, kind: str, payload: dict) -> Future:
+        future = Future()
+        self.pending[request_id] = future
+        with self.send_lock:
+            self.conn.send((request_id, kind, payload))
+        return future
+
+    def result(self, request_id: int, future: Future, timeout: float):
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # the worker may still answer later; nobody is waiting for it any more
+            self.pending.pop(request_id, None)
+            raise
+
+    def read_responses(self) -> None:
+        while True:
+            try:
+                request_id, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self.pending.pop(request_id, None)
+            if future is not None:
+                future.set_result(result)
+        # worker gone → fail whatever it still owed
+        for future in list(self.pending.values()):
+            future.set_exception(RuntimeError(f"worker {self.index} exited"))
+        self.pending.clear()
+
+
+class Router:
+    """Sticky session → worker routing: crc32(session_id) over the live workers."""
+
+    def __init__(self, workers: List[Worker]):
+        self.workers = workers
+        self._ids = itertools.count()
+
+    def pick(self, session_id: str) -> Worker:
+        alive = [w for w in self.workers if w.process.is_alive()]
+        if not alive:
+            raise RuntimeError("no live workers")
+        # a dead worker's sessions move; everyone else keeps their worker
+        preferred = self.workers[zlib.crc32(session_id.encode("utf-8")) % len(self.workers)]
+        if preferred.process.is_alive():
+            return preferred
+        return alive[zlib.crc32(session_id.encode("utf-8")) % len(alive)]
+
+    def chat(self, payload: dict) -> dict:
+        worker = self.pick(payload["session_id"])
+        request_id = next(self._ids)
+        response = worker.result(request_id, worker.call(request_id, "chat", payload), SERVER_REQUEST_TIMEOUT_S)
+        return {"response": response, "worker": worker.index}
+
+    def stats(self) -> dict:
+        calls = {}
+        for worker in self.workers:
+            if worker.process.is_alive():
+                request_id = next(self._ids)
+                calls[worker.index] = (worker, request_id, worker.call(request_id, "stats", {}))
+        return {
+            "router": {"pid": os.getpid(), **memory_usage()},
+            "workers": {
+                index: worker.result(request_id, future, SERVER_REQUEST_TIMEOUT_S)
+                for index, (worker, request_id, future) in calls.items()
+            },
+        }
+
+
+def make_handler(router: Router):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict) -> None:
+            data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path != "/chat":
+                return self._reply(404, {"error": "not found"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not payload.get("session_id") or "message" not in payload:
+                    return self._reply(400, {"error": "session_id and message are required"})
+                self._reply(200, router.chat(payload))
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+
+        def do_GET(self):
+            if self.path != "/stats":
+                return self._reply(404, {"error": "not found"})
+            try:
+                self._reply(200, router.stats())
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def preload(persist_directory: str) -> RetrieverManager:
+    """Everything shared read-only by the workers, loaded before the fork.
+
+    No Chroma client is opened here (defer_chroma): one used before fork() hangs the workers'
+    queries, so each worker opens the stores itself. Local indexes are loaded and shared.
+    """
+    retriever_manager = RetrieverManager(persist_directory=persist_directory, defer_chroma=True)
+    count_tokens("warmup")  # tokenizer tables
+    return retriever_manager
+
+
+def start_workers(retriever_manager: RetrieverManager, n: int) -> List[Worker]:
+    # Move everything allocated so far out of the GC's generations: collections in the
+    # workers then never touch (and copy) these pages
+    gc.collect()
+    gc.freeze()
+    context = multiprocessing.get_context("fork")
+    workers = []
+    for index in range(n):
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=worker_main, args=(index, child_conn, retriever_manager), name=f"worker{index}", daemon=True
+        )
+        process.start()
+        child_conn.close()
+        workers.append(Worker(index, process, parent_conn))
+    # reader threads only after all forks (forking a multi-threaded process is unsafe)
+    for worker in workers:
+        threading.Thread(target=worker.read_responses, name=f"reader{worker.index}", daemon=True).start()
+    return workers
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-fork multi-worker server")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--persist-directory", default="./chroma_store")
+    args = parser.parse_args(argv)
+
+    print(f"🚀 تحميل الكتالوج والـ indexes مرة واحدة ثم تشغيل {args.workers} workers...")
+    workers = start_workers(preload(args.persist_directory), args.workers)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(Router(workers)))
+    print(f"✅ http://{args.host}:{args.port}  (POST /chat, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 إيقاف...")
+    finally:
+        server.server_close()
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
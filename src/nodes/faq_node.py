@@ -1,49 +1,91 @@
 # src/nodes/faq_node.py
 
+import re
+import threading
 from langchain.tools import BaseTool
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.memory import ConversationBufferMemory
+from langchain.schema import SystemMessage
 from utils.retrievers import RetrieverManager
+from utils.history import render_history
+from utils.single_flight import tool_calls, context_hash
+from utils.records import pack_snippets
+from utils.adaptive_k import select_adaptive
+from utils.deadline import has_budget, call_timeout
+from utils.hedging import hedged
+from utils.ledger import cheap_mode
+from utils.prompt_cache import prompt_stats, track_prompt_usage
 from config import require_openai_key, LLM_MODEL
-from constants import RECENT_MESSAGES_LIMIT, MAX_DOCS_FOR_FAQ
-from typing import Optional, Type
+from constants import (
+    RECENT_MESSAGES_LIMIT, MAX_DOCS_FOR_FAQ, FAQ_CONTEXT_TOKEN_BUDGET, FAQ_EXTRACTIVE_MODE,
+    FAQ_EXTRACTIVE_MIN_SCORE, FAQ_EXTRACTIVE_MIN_MARGIN, FAQ_EXTRACTIVE_TEMPLATE, FAQ_BEST_EFFORT_TEMPLATE,
+    AGENT_REQUEST_TIMEOUT, TOOL_LLM_MIN_BUDGET_S
+)
+from typing import List, Optional, Tuple, Type
 from pydantic import BaseModel, Field
 
 class FaqInput(BaseModel):
     """Input for FAQ tool."""
     question: str = Field(description="سؤال المستخدم حول الأسئلة المتكررة")
 
+class FaqStats:
+    """Process-wide counters: confident extractive answers (no LLM) vs generated answers,
+    plus best-effort answers forced by the deadline / token budget (not part of the hit rate)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.extractive = 0
+        self.generated = 0
+        self.degraded = 0
+
+    def record(self, kind: str):
+        """kind: "extractive" | "generated" | "degraded"."""
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.extractive + self.generated
+        return self.extractive / total if total else 0.0
+
+    def snapshot(self) -> dict:
+        return {"extractive": self.extractive, "generated": self.generated, "degraded": self.degraded,
+                "extractive_hit_rate": round(self.hit_rate, 3)}
+
+faq_stats = FaqStats()
+
+# "إزاي أشحن؟ وإزاي أعرف الرصيد؟" → سؤالين، محتاج توليد مش إجابة واحدة محفوظة
+_QUESTION_WORDS = r"(?:ازاي|إزاي|ازاى|ايه|إيه|اية|كام|امتى|إمتى|فين|ليه|هل|how|what|when|where|why)"
+_MULTI_PART = re.compile(r"(?:\s|^)و\s*" + _QUESTION_WORDS + r"|\b(?:and|also)\s+" + _QUESTION_WORDS, re.IGNORECASE)
+
 class FaqTool(BaseTool):
     """Tool for answering frequently asked questions."""
     name: str = "faq_tool"
     description: str = "للإجابة على الأسئلة المتكررة حول خدمات شركه متخصصه في الاتصالات، الشحن، الإلغاء، والاستفسارات العامة"
     args_schema: Type[BaseModel] = FaqInput
 
-    def __init__(self, retriever_manager: RetrieverManager, memory: ConversationBufferMemory, model_name: str = LLM_MODEL):
+    def __init__(self, retriever_manager: RetrieverManager, memory: ConversationBufferMemory, model_name: str = LLM_MODEL, tenant: Optional[str] = None):
         super().__init__()
         # Store components as private attributes to avoid Pydantic issues
-        self._retriever = retriever_manager.retrievers.get("faq")
-        if not self._retriever:
-            raise ValueError("FAQ retriever مش متعرف")
+        # Validate now, but look the retriever up per call so catalog reloads are picked up
+        retriever_manager.check_retriever_type("faq", tenant)
+        self._retriever_manager = retriever_manager
+        self._tenant = tenant
 
-        self._llm = ChatOpenAI(api_key=require_openai_key(), model_name=model_name, temperature=0)
+        self._llm = track_prompt_usage(hedged(ChatOpenAI(api_key=require_openai_key(), model_name=model_name, temperature=0), "faq"), "faq")
         self._memory = memory
 
-        self._prompt = ChatPromptTemplate.from_template("""
+        # Static instructions first (byte-stable → provider prefix cache), dynamic sections last
+        self._prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content="""
 # دورك
 أنت مساعد خدمة عملاء في شركة اتصالات.
 
-# المعلومات المتاحة
-
-## 🕐 تاريخ المحادثة:
-{history}
-
-## ❓ السؤال الجديد:
-{question}
-
-## 📚 قاعدة المعرفة (FAQs):
-{context}
+# المعلومات المتاحة (في آخر الرسالة)
+- 🕐 تاريخ المحادثة
+- 📚 قاعدة المعرفة (FAQs)
+- ❓ السؤال الجديد
 
 # طريقة الرد
 
@@ -78,35 +120,80 @@ class FaqTool(BaseTool):
 - هل هي مشكلة في الشبكة؟
 - أم في الفاتورة؟
 - أم شيء آخر؟
+"""),
+            ("human", """## 🕐 تاريخ المحادثة:
+{history}
 
-الإجابة:
-""")
+## 📚 قاعدة المعرفة (FAQs):
+{context}
+
+## ❓ السؤال الجديد:
+{question}
+
+الإجابة:"""),
+        ])
+        prompt_stats.register_static("faq", self._prompt.messages[0].content)
 
     def _run(self, question: str, session_id: Optional[str] = None) -> str:
         """Run the FAQ tool."""
-        docs = self._retriever.get_relevant_documents(question)
+        # Recent history, role-tagged (cached by the session's CompactHistory)
+        history_text = render_history(self._memory, RECENT_MESSAGES_LIMIT)
+
+        # Decided per caller, and part of the key: a session near its deadline / over its token
+        # budget must not hand its best-effort answer to sessions that can still afford the LLM
+        degraded = not has_budget(TOOL_LLM_MIN_BUDGET_S) or cheap_mode()
+
+        # Identical question + identical history → one retrieval and one LLM call for all waiters
+        key = (self.name, self._tenant, self._retriever_manager.version(self._tenant),
+               RetrieverManager.normalize_query(question), context_hash(history_text), degraded)
+        return tool_calls.do(key, lambda: self._answer(question, history_text, degraded))
+
+    @staticmethod
+    def is_multi_part(question: str) -> bool:
+        return question.count("؟") + question.count("?") > 1 or bool(_MULTI_PART.search(question))
+
+    @staticmethod
+    def is_confident(scored: List[Tuple[object, float]]) -> bool:
+        """Top hit above the calibrated threshold and clearly ahead of the runner-up."""
+        if not scored or scored[0][1] < FAQ_EXTRACTIVE_MIN_SCORE:
+            return False
+        runner_up = scored[1][1] if len(scored) > 1 else 0.0
+        return scored[0][1] - runner_up >= FAQ_EXTRACTIVE_MIN_MARGIN
+
+    def _answer(self, question: str, history_text: str, degraded: bool = False) -> str:
+        scored = self._retriever_manager.get_scored_documents(question, "faq", tenant=self._tenant)
+        docs = [doc for doc, _ in scored]
         if not docs:
             response = "عذرًا، لم أجد إجابة على سؤالك. يمكنك التواصل مع الدعم على: ١٦٠"
+        elif FAQ_EXTRACTIVE_MODE and self.is_confident(scored) and not self.is_multi_part(question):
+            # Extractive: the stored FAQ answer is the answer → local template, no LLM call
+            faq_stats.record("extractive")
+            answer = docs[0].metadata.get("content") or docs[0].page_content
+            response = FAQ_EXTRACTIVE_TEMPLATE.format(answer=answer)
+        elif degraded:
+            # Degraded (near the request deadline / over the token budget): the closest stored
+            # answer, phrased as a best-effort match since it may not be a confident one
+            faq_stats.record("degraded")
+            answer = docs[0].metadata.get("content") or docs[0].page_content
+            response = FAQ_BEST_EFFORT_TEMPLATE.format(answer=answer)
         else:
-            context = "\n".join([d.page_content for d in docs[:MAX_DOCS_FOR_FAQ]])
-            
-            # Get chat history from the agent's memory
-            history_text = ""
-            if self._memory and hasattr(self._memory, 'chat_memory'):
-                messages = self._memory.chat_memory.messages
-                # Get last few messages for context
-                recent_messages = messages[-RECENT_MESSAGES_LIMIT:] if len(messages) > RECENT_MESSAGES_LIMIT else messages
-                history_text = "\n".join([
-                    f"{'User' if hasattr(msg, 'content') and 'Human' in str(type(msg)) else 'Assistant'}: {msg.content}" 
-                    for msg in recent_messages if hasattr(msg, 'content')
-                ])
+            faq_stats.record("generated")
+            # Only the relevant prefix of the hits goes into the prompt (adaptive top-k, when enabled)
+            if self._retriever_manager.options.adaptive_k:
+                relevant = select_adaptive(scored, max_k=MAX_DOCS_FOR_FAQ, token_budget=FAQ_CONTEXT_TOKEN_BUDGET)
+            else:
+                relevant = scored[:MAX_DOCS_FOR_FAQ]
+            context = pack_snippets([doc for doc, _ in relevant], FAQ_CONTEXT_TOKEN_BUDGET)
             
             chain_input = {
                 "question": question, 
                 "context": context,
                 "history": history_text
             }
-            response = self._llm.predict(self._prompt.format(**chain_input)).strip()
+            response = self._llm.invoke(
+                self._prompt.format_messages(**chain_input),
+                timeout=call_timeout(AGENT_REQUEST_TIMEOUT)
+            ).content.strip()
 
         return response
 
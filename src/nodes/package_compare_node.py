@@ -0,0 +1,119 @@
+# src/nodes/package_compare_node.py
+
+import re
+from langchain.tools import BaseTool
+from langchain.memory import ConversationBufferMemory
+from utils.retrievers import RetrieverManager
+from utils.records import CatalogRecord
+from utils.session_cache import SessionToolCache
+from typing import Any, Dict, List, Optional, Type, Union
+from pydantic import BaseModel, Field
+
+class PackageCompareInput(BaseModel):
+    """Input for package compare tool."""
+    package_names: Union[List[str], str] = Field(
+        description="أسماء الباقات المطلوب مقارنتها (قائمة، أو نص مفصول بفاصلة)"
+    )
+
+class PackageCompareTool(BaseTool):
+    """Tool for comparing several packages in one step."""
+    name: str = "package_compare_tool"
+    description: str = """
+استخدم هذه الأداة لمقارنة باقتين أو أكثر مرة واحدة.
+
+متى تستخدم هذه الأداة:
+✅ "قارن بين فليكس ٧٠ و فليكس ١٠٠"
+✅ "ايه الفرق بين Plus 60 و Plus 105 و فليكس ٧٠؟"
+✅ "قارنها بالباقة السابقة" (استخدم أسماء الباقات من المحادثة)
+
+المدخل المطلوب: كل أسماء الباقات في نداء واحد، مفصولة بفاصلة (مثل: فليكس ٧٠, Plus 60)
+"""
+    args_schema: Type[BaseModel] = PackageCompareInput
+
+    def __init__(self, retriever_manager: RetrieverManager, memory: ConversationBufferMemory, tenant: Optional[str] = None,
+                 cache: Optional[SessionToolCache] = None):
+        super().__init__()
+        self._retriever_manager = retriever_manager
+        self._memory = memory
+        self._tenant = tenant
+        # session's tool outputs + packages already shown (shared with the other package tools)
+        self._cache = cache or SessionToolCache()
+
+    @staticmethod
+    def split_names(package_names: Union[List[str], str]) -> List[str]:
+        """"فليكس ٧٠، Plus 60 و باقة ٨٥" → ["فليكس ٧٠", "Plus 60", "باقة ٨٥"]"""
+        if isinstance(package_names, str):
+            # الفاصلة بين رقمين فاصل آلاف ("1،400") مش فاصل بين باقتين؛
+            # "و" فاصل بس لو كلمة لوحدها ("وفير" / "ويك إند" مش فاصل)
+            package_names = re.split(r"\s*(?:(?<!\d)[,،]|[,،](?!\d)|\||\n|\s+و\s+)\s*", package_names)
+        return [name.strip() for name in package_names if name and name.strip()]
+
+    @staticmethod
+    def _quota(record: CatalogRecord) -> str:
+        if record.flex_units is not None:
+            return f"{record.flex_units:,} فليكس"
+        if record.mb is not None:
+            return f"{record.mb:,} ميجا"
+        return record.content
+
+    def compare(self, names: List[str]) -> List[Dict[str, Any]]:
+        """Aligned rows (same order as `names`); unresolved packages keep their row with found=False."""
+        records = self._resolve(names)
+        rows = []
+        for name, record in zip(names, records):
+            if record is None:
+                rows.append({"query": name, "found": False, "title": name, "price": None, "price_value": None,
+                             "quota": None, "details": None})
+            else:
+                rows.append({
+                    "query": name,
+                    "found": True,
+                    "title": record.title,
+                    "price": record.price,
+                    "price_value": record.price_value,
+                    "quota": self._quota(record),
+                    "details": record.content,
+                })
+        return rows
+
+    def _resolve(self, names: List[str]) -> List[Optional[CatalogRecord]]:
+        """Packages already shown in this session first, the catalog only for the rest;
+        "الباقة السابقة" → the most recent shown package not already in the comparison."""
+        version = self._retriever_manager.version(self._tenant)
+        previous = [self._cache.refers_to_previous(name) for name in names]
+        records: List[Optional[CatalogRecord]] = [
+            None if is_previous else self._cache.find(version, name) for name, is_previous in zip(names, previous)
+        ]
+        missing = [i for i, record in enumerate(records) if record is None and not previous[i]]
+        if missing:
+            resolved = self._retriever_manager.resolve_packages([names[i] for i in missing], tenant=self._tenant)
+            for i, record in zip(missing, resolved):
+                records[i] = record
+        for i, is_previous in enumerate(previous):
+            if is_previous:
+                records[i] = self._cache.previous(version, exclude=[r.record_id for r in records if r is not None])
+        self._cache.remember(version, records)
+        return records
+
+    def _run(self, package_names: Union[List[str], str], session_id: Optional[str] = None) -> str:
+        """Run the package compare tool."""
+        names = self.split_names(package_names)
+        if not names:
+            return "عذراً، لم أستلم أسماء باقات للمقارنة."
+
+        rows = self.compare(names)
+        if not any(row["found"] for row in rows):
+            return "عذراً، لم أجد أي من هذه الباقات في قاعدة البيانات. يرجى التأكد من أسماء الباقات."
+
+        # Table-ready output: one aligned row per requested package
+        lines = ["| الباقة | السعر | الحصة | التفاصيل |", "|---|---|---|---|"]
+        for row in rows:
+            if row["found"]:
+                lines.append(f"| {row['title']} | {row['price'] or '-'} | {row['quota'] or '-'} | {row['details'] or '-'} |")
+            else:
+                lines.append(f"| {row['title']} | غير موجودة | - | - |")
+        return "\n".join(lines)
+
+    async def _arun(self, package_names: Union[List[str], str], session_id: Optional[str] = None) -> str:
+        """Async run method."""
+        return self._run(package_names, session_id)
@@ -3,7 +3,9 @@
 from langchain.tools import BaseTool
 from langchain.memory import ConversationBufferMemory
 from utils.retrievers import RetrieverManager
-from typing import Optional, Type
+from utils.records import CatalogRecord
+from utils.session_cache import SessionToolCache
+from typing import Optional, Tuple, Type
 from pydantic import BaseModel, Field
 
 class PackageInfoInput(BaseModel):
@@ -31,18 +33,55 @@ class PackageInfoTool(BaseTool):
 """
     args_schema: Type[BaseModel] = PackageInfoInput
 
-    def __init__(self, retriever_manager: RetrieverManager, memory: ConversationBufferMemory):
+    def __init__(self, retriever_manager: RetrieverManager, memory: ConversationBufferMemory, tenant: Optional[str] = None,
+                 cache: Optional[SessionToolCache] = None):
         super().__init__()
         self._retriever_manager = retriever_manager
         self._memory = memory
+        self._tenant = tenant
+        # session's tool outputs + packages already shown (shared with the other package tools)
+        self._cache = cache or SessionToolCache()
+
+    @staticmethod
+    def format_record(record: CatalogRecord) -> str:
+        return f"اسم الباقة: {record.title}\nالتفاصيل: {record.content}\nالسعر: {record.price}"
 
     def _run(self, package_query: str, session_id: Optional[str] = None) -> str:
         """Run the package info tool."""
-        docs = self._retriever_manager.get_documents(package_query, retriever_type="package")
+        version = self._retriever_manager.version(self._tenant)
+        # "الباقة السابقة" changes meaning as the conversation goes → never served from the output cache
+        previous = self._cache.refers_to_previous(package_query)
+        cached = None if previous else self._cache.get(self.name, version, package_query)
+        if cached is not None:
+            response, record = cached
+        else:
+            # A package already shown in this conversation (by name, or "الباقة السابقة") → no retrieval
+            record = self._cache.find(version, package_query)
+            if record is None and previous:
+                record = self._cache.previous(version)
+            if record is not None:
+                response = self.format_record(record)
+            else:
+                response, record = self._lookup(package_query)
+                if response is None:
+                    return "عذراً، لم أجد باقة بهذا الاسم في قاعدة البيانات. يرجى التأكد من اسم الباقة أو تجربة باقة أخرى."
+            if not previous:
+                self._cache.put(self.name, version, package_query, (response, record))
+        self._cache.remember(version, [record])
+        return response
+
+    def _lookup(self, package_query: str) -> Tuple[Optional[str], Optional[CatalogRecord]]:
+        """Retrieval → (response, record); record is None for stores ingested before typed records."""
+        docs = self._retriever_manager.get_documents(package_query, retriever_type="package", tenant=self._tenant)
         if not docs:
-            return "عذراً، لم أجد باقة بهذا الاسم في قاعدة البيانات. يرجى التأكد من اسم الباقة أو تجربة باقة أخرى."
+            return None, None
         else:
             # Found documents - extract information directly without LLM processing
+            record = CatalogRecord.from_metadata(docs[0].metadata)
+            if record:
+                # Typed record parsed at ingest → no string parsing per request
+                return self.format_record(record), record
+
             context = docs[0].page_content
             
             # Parse the content to extract structured information
@@ -70,7 +109,7 @@ class PackageInfoTool(BaseTool):
                     # Fallback to showing raw content
                     response = f"هذه المعلومات المتاحة عن الباقة:\n{context}"
 
-        return response
+        return response, None
 
     async def _arun(self, package_query: str, session_id: Optional[str] = None) -> str:
         """Async run method."""
@@ -2,16 +2,26 @@
 
 from langchain.tools import BaseTool
 from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import SystemMessage
 from langchain.memory import ConversationBufferMemory
 from utils.retrievers import RetrieverManager
+from utils.history import render_history
+from utils.single_flight import tool_calls, context_hash
+from utils.records import CatalogRecord, pack_snippets, pack_docs
+from utils.session_cache import SessionToolCache
+from utils.deadline import has_budget, call_timeout
+from utils.hedging import hedged
+from utils.ledger import cheap_mode
+from utils.prompt_cache import prompt_stats, track_prompt_usage
 from config import require_openai_key, LLM_MODEL
 from constants import (
     LISTING_KEYWORDS, MAX_DOCS_FOR_RECOMMENDATION, MAX_DOCS_FOR_LISTING,
-    DIVERSE_PACKAGE_QUERIES, MAX_DOCS_PER_CATEGORY, RECENT_MESSAGES_LIMIT
+    DIVERSE_PACKAGE_QUERIES, MAX_DOCS_PER_CATEGORY, RECENT_MESSAGES_LIMIT,
+    RECOMMENDATION_CONTEXT_TOKEN_BUDGET, LISTING_CONTEXT_TOKEN_BUDGET,
+    AGENT_REQUEST_TIMEOUT, TOOL_LLM_MIN_BUDGET_S, DEGRADED_PACKAGES_HEADER
 )
-from typing import Optional, Type
+from typing import List, Optional, Tuple, Type
 from pydantic import BaseModel, Field
 
 class PackageRecommendationInput(BaseModel):
@@ -38,31 +48,30 @@ class PackageRecommendationTool(BaseTool):
 """
     args_schema: Type[BaseModel] = PackageRecommendationInput
 
-    def __init__(self, retriever_manager: RetrieverManager, memory: ConversationBufferMemory):
+    def __init__(self, retriever_manager: RetrieverManager, memory: ConversationBufferMemory, tenant: Optional[str] = None,
+                 cache: Optional[SessionToolCache] = None):
         super().__init__()
         self._retriever_manager = retriever_manager
         self._memory = memory
-        self._llm = ChatOpenAI(model=LLM_MODEL, temperature=0.3, api_key=require_openai_key())
+        self._tenant = tenant
+        # session's tool outputs + packages already shown (shared with the other package tools)
+        self._cache = cache or SessionToolCache()
+        self._llm = track_prompt_usage(
+            hedged(ChatOpenAI(model=LLM_MODEL, temperature=0.3, api_key=require_openai_key()), "recommendation"),
+            "recommendation"
+        )
 
-        self._prompt = PromptTemplate(
-            input_variables=["query", "docs", "preferences", "history"],
-            template="""
+        # Static instructions first (byte-stable → provider prefix cache), dynamic sections last
+        self._prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content="""
 # دورك
 أنت مساعد ذكي في شركة اتصالات. مهمتك: ترشيح الباقة المناسبة أو عرض الباقات المتاحة.
 
-# المعلومات المتاحة
-
-## 📝 طلب العميل:
-{query}
-
-## 📦 الباقات المتوفرة (استخدم فقط هذه القائمة):
-{docs}
-
-## 🕐 سياق المحادثة السابقة:
-{history}
-
-## 🎯 تفضيلات العميل (إن وُجدت):
-{preferences}
+# المعلومات المتاحة (في آخر الرسالة)
+- 🕐 سياق المحادثة السابقة
+- 🎯 تفضيلات العميل (إن وُجدت)
+- 📦 الباقات المتوفرة (استخدم فقط هذه القائمة)
+- 📝 طلب العميل
 
 # طريقة العمل
 
@@ -103,7 +112,7 @@ class PackageRecommendationTool(BaseTool):
 💡 هل تريد المقارنة مع باقة أخرى؟
 
 # قواعد صارمة 🚫
-1. استخدم فقط الباقات الموجودة في قسم "الباقات المتوفرة" أعلاه
+1. استخدم فقط الباقات الموجودة في قسم "الباقات المتوفرة" في آخر الرسالة
 2. لا تخترع أسعار أو مميزات غير موجودة
 3. إذا كانت المعلومات ناقصة، اسأل سؤال واحد محدد فقط
 4. لا تذكر أكثر من 3 باقات في الترشيح
@@ -114,64 +123,101 @@ class PackageRecommendationTool(BaseTool):
 - منظم (bullets أو numbering)
 - يحتوي على emoji بسيط
 - لا يزيد عن 200 كلمة إلا إذا طُلبت كل الباقات
+"""),
+            ("human", """## 🕐 سياق المحادثة السابقة:
+{history}
 
-الإجابة:
-"""
-        )
-        self._chain = LLMChain(llm=self._llm, prompt=self._prompt)
+## 🎯 تفضيلات العميل (إن وُجدت):
+{preferences}
+
+## 📦 الباقات المتوفرة (استخدم فقط هذه القائمة):
+{docs}
+
+## 📝 طلب العميل:
+{query}
+
+الإجابة:"""),
+        ])
+        prompt_stats.register_static("recommendation", self._prompt.messages[0].content)
 
     def _run(self, user_needs: str, session_id: Optional[str] = None) -> str:
         """Run the package recommendation tool."""
+        # Recent history, role-tagged (cached by the session's CompactHistory)
+        history_text = render_history(self._memory, RECENT_MESSAGES_LIMIT)
+
+        # Same needs again in this session → candidates from the session cache, no retrieval
+        version = self._retriever_manager.version(self._tenant)
+        candidates = self._cache.get(self.name, version, user_needs)
+        if candidates is None:
+            candidates = self._candidates(user_needs)
+            if candidates is None:
+                return "عذراً، لم أجد باقات مناسبة لاحتياجاتك. هل يمكنك توضيح متطلباتك أكثر؟"
+            self._cache.put(self.name, version, user_needs, candidates)
+        docs_text, records = candidates
+        self._cache.remember(version, records)
+
+        # Deadline too close for generation (or token budget used up) → return the candidates as they are
+        if not has_budget(TOOL_LLM_MIN_BUDGET_S) or cheap_mode():
+            return f"{DEGRADED_PACKAGES_HEADER}\n{docs_text}"
+
+        # Identical needs + identical history → one LLM call for all waiters
+        key = (self.name, self._tenant, version,
+               RetrieverManager.normalize_query(user_needs), context_hash(history_text))
+        return tool_calls.do(key, lambda: self._recommend(user_needs, history_text, docs_text))
+
+    def _candidates(self, user_needs: str) -> Optional[Tuple[str, List[CatalogRecord]]]:
+        """Packed candidate snippets + the packages they show (None → nothing found)."""
         # Check if user is asking for all packages
         query_lower = user_needs.lower()
         is_listing_request = any(word in query_lower for word in LISTING_KEYWORDS)
         
         if is_listing_request:
-            # Get diverse packages for listing
+            # Category overviews (ingested with RecordChunker(summaries=True)) → one doc per category
+            overviews = self._retriever_manager.get_documents(user_needs, "package_summary", tenant=self._tenant)
+            if overviews:
+                return pack_snippets(overviews, LISTING_CONTEXT_TOKEN_BUDGET, numbered=True), []
+
+            # Otherwise: diverse packages for listing
             all_docs = []
             
             # Strategy: Get diverse packages by querying different terms
             for query in DIVERSE_PACKAGE_QUERIES:
-                docs = self._retriever_manager.get_documents(query, "package")
+                docs = self._retriever_manager.get_documents(query, "package", tenant=self._tenant)
                 all_docs.extend(docs[:MAX_DOCS_PER_CATEGORY])
             
-            # Remove duplicates based on content
+            # Remove duplicates based on record ID (or content for older stores)
             seen = set()
             unique_docs = []
             for doc in all_docs:
-                content = doc.page_content
-                if content not in seen:
-                    seen.add(content)
+                key = doc.metadata.get("record_id", doc.page_content)
+                if key not in seen:
+                    seen.add(key)
                     unique_docs.append(doc)
             
-            # Format with better structure (numbered list)
-            docs_text = "\n".join([f"{i+1}. {doc.page_content}" 
-                                  for i, doc in enumerate(unique_docs[:MAX_DOCS_FOR_LISTING])])
+            # Format with better structure (numbered list of precomputed snippets)
+            docs_text = pack_snippets(unique_docs[:MAX_DOCS_FOR_LISTING], LISTING_CONTEXT_TOKEN_BUDGET, numbered=True)
+            # a listing doesn't single out a package → nothing for "the previous package"
+            return docs_text, []
         else:
             # Get specific recommendations
-            docs = self._retriever_manager.get_documents(user_needs, "package")
+            docs = self._retriever_manager.get_documents(user_needs, "package", tenant=self._tenant)
             if not docs:
-                return "عذراً، لم أجد باقات مناسبة لاحتياجاتك. هل يمكنك توضيح متطلباتك أكثر؟"
+                return None
             
-            docs_text = "\n".join([f"- {doc.page_content}" 
-                                  for doc in docs[:MAX_DOCS_FOR_RECOMMENDATION]])
-
-        # Get chat history from the agent's memory
-        history_text = ""
-        if self._memory and hasattr(self._memory, 'chat_memory'):
-            messages = self._memory.chat_memory.messages
-            recent_messages = messages[-RECENT_MESSAGES_LIMIT:] if len(messages) > RECENT_MESSAGES_LIMIT else messages
-            history_text = "\n".join([
-                f"{'User' if hasattr(msg, 'content') and 'Human' in str(type(msg)) else 'Assistant'}: {msg.content}" 
-                for msg in recent_messages if hasattr(msg, 'content')
-            ])
-
-        response = self._chain.run(
+            # only the packages that fit the budget were shown to the LLM → only those are remembered
+            docs_text, shown = pack_docs(docs[:MAX_DOCS_FOR_RECOMMENDATION], RECOMMENDATION_CONTEXT_TOKEN_BUDGET, bullet="- ")
+
+        # best candidate last → it becomes "the previous package" for the follow-ups
+        return docs_text, [CatalogRecord.from_metadata(doc.metadata) for doc in reversed(shown)]
+
+    def _recommend(self, user_needs: str, history_text: str, docs_text: str) -> str:
+        prompt = self._prompt.format_messages(
             query=user_needs,
             docs=docs_text,
             preferences="",  # We'll get preferences from conversation context
             history=history_text
         )
+        response = self._llm.invoke(prompt, timeout=call_timeout(AGENT_REQUEST_TIMEOUT)).content
 
         return response
 
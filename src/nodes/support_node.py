@@ -1,10 +1,17 @@
 from langchain.tools import BaseTool
 from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import SystemMessage
 from langchain.memory import ConversationBufferMemory
 from config import OPENAI_API_KEY, LLM_MODEL
-from constants import SUPPORT_HISTORY_LIMIT
+from utils.retrievers import RetrieverManager
+from utils.history import render_history
+from utils.single_flight import tool_calls, context_hash
+from constants import SUPPORT_HISTORY_LIMIT, ESCALATION_MESSAGE, AGENT_REQUEST_TIMEOUT, TOOL_LLM_MIN_BUDGET_S
+from utils.deadline import has_budget, call_timeout
+from utils.hedging import hedged
+from utils.ledger import cheap_mode
+from utils.prompt_cache import prompt_stats, track_prompt_usage
 from typing import Optional, Type
 from pydantic import BaseModel, Field
 
@@ -21,21 +28,17 @@ class SupportTool(BaseTool):
     def __init__(self, memory: ConversationBufferMemory):
         super().__init__()
         self._memory = memory
-        self._llm = ChatOpenAI(model=LLM_MODEL, temperature=0.3, api_key=OPENAI_API_KEY)
+        self._llm = track_prompt_usage(hedged(ChatOpenAI(model=LLM_MODEL, temperature=0.3, api_key=OPENAI_API_KEY), "support"), "support")
 
-        self._prompt = PromptTemplate(
-            input_variables=["query", "chat_history"],
-            template="""
+        # Static instructions first (byte-stable → provider prefix cache), dynamic sections last
+        self._prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content="""
 # دورك
 أنت مساعد دعم عملاء متخصص في شركة اتصالات.
 
-# المعلومات المتاحة
-
-## 🕐 سياق المحادثة:
-{chat_history}
-
-## 🆕 المشكلة الجديدة:
-{query}
+# المعلومات المتاحة (في آخر الرسالة)
+- 🕐 سياق المحادثة
+- 🆕 المشكلة الجديدة
 
 # طريقة التعامل
 
@@ -91,30 +94,32 @@ class SupportTool(BaseTool):
 - متفهم: "أتفهم أن هذا مزعج، دعني أساعدك..."
 - إيجابي: "سنحل هذا معاً!"
 - مهني: عدم استخدام لغة عامية غير لائقة
+"""),
+            ("human", """## 🕐 سياق المحادثة:
+{chat_history}
+
+## 🆕 المشكلة الجديدة:
+{query}
 
-الرد:
-"""
-        )
-        self._chain = LLMChain(llm=self._llm, prompt=self._prompt)
+الرد:"""),
+        ])
+        prompt_stats.register_static("support", self._prompt.messages[0].content)
 
     def _run(self, issue_description: str, session_id: Optional[str] = None) -> str:
         """Run the support tool."""
-        # Get chat history from the agent's memory
-        chat_history = ""
-        if self._memory and hasattr(self._memory, 'chat_memory'):
-            messages = self._memory.chat_memory.messages
-            recent_messages = messages[-SUPPORT_HISTORY_LIMIT:] if len(messages) > SUPPORT_HISTORY_LIMIT else messages
-            chat_history = "\n".join([
-                f"{'User' if hasattr(msg, 'content') and 'Human' in str(type(msg)) else 'Assistant'}: {msg.content}" 
-                for msg in recent_messages if hasattr(msg, 'content')
-            ])
-
-        response = self._chain.run(
-            query=issue_description,
-            chat_history=chat_history
-        )
-
-        return response
+        # Recent history, role-tagged (cached by the session's CompactHistory)
+        chat_history = render_history(self._memory, SUPPORT_HISTORY_LIMIT)
+
+        # Deadline too close for generation (or token budget used up) → escalate directly
+        if not has_budget(TOOL_LLM_MIN_BUDGET_S) or cheap_mode():
+            return ESCALATION_MESSAGE
+
+        # Identical issue + identical history → one LLM call for all waiters
+        key = (self.name, RetrieverManager.normalize_query(issue_description), context_hash(chat_history))
+        prompt = self._prompt.format_messages(query=issue_description, chat_history=chat_history)
+        return tool_calls.do(key, lambda: self._llm.invoke(
+            prompt, timeout=call_timeout(AGENT_REQUEST_TIMEOUT)
+        ).content)
 
     async def _arun(self, issue_description: str, session_id: Optional[str] = None) -> str:
         """Async run method."""
@@ -0,0 +1,98 @@
+# utils/adaptive_k.py
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+from utils.records import doc_snippet
+from utils.tokens import count_tokens
+from constants import ADAPTIVE_MIN_K, ADAPTIVE_MIN_RELEVANCE, ADAPTIVE_SCORE_GAP, ADAPTIVE_DUPLICATE_JACCARD
+
+# Adaptive top-k: instead of a fixed k, keep candidates while they stay relevant.
+# Easy queries (one clear hit) end up with 1-2 docs, ambiguous ones keep the full k.
+
+Scored = List[Tuple[Document, float]]
+
+
+class AdaptiveStats:
+    """How many candidates came in and how many survived each cut."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.candidates = 0
+        self.kept = 0
+        self.duplicates = 0
+
+    def record(self, candidates: int, kept: int, duplicates: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.candidates += candidates
+            self.kept += kept
+            self.duplicates += duplicates
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "avg_candidates": round(self.candidates / self.calls, 2) if self.calls else 0.0,
+                "avg_kept": round(self.kept / self.calls, 2) if self.calls else 0.0,
+                "duplicates_collapsed": self.duplicates,
+            }
+
+
+adaptive_stats = AdaptiveStats()
+
+
+def _words(doc: Document) -> set:
+    return set(doc_snippet(doc).split())
+
+
+def _is_duplicate(doc: Document, kept: List[Tuple[Document, float, set]], words: set) -> bool:
+    record = doc.metadata.get("record_id")
+    for other, _, other_words in kept:
+        if record and record == other.metadata.get("record_id"):
+            return True
+        union = words | other_words
+        if union and len(words & other_words) / len(union) >= ADAPTIVE_DUPLICATE_JACCARD:
+            return True
+    return False
+
+
+def select_adaptive(
+    scored: Scored,
+    max_k: Optional[int] = None,
+    token_budget: Optional[int] = None,
+    min_k: int = ADAPTIVE_MIN_K,
+    min_relevance: float = ADAPTIVE_MIN_RELEVANCE,
+    max_gap: float = ADAPTIVE_SCORE_GAP,
+) -> Scored:
+    """Best-first (doc, score) → the relevant prefix.
+
+    Stops at a score below `min_relevance` or a drop larger than `max_gap` from the
+    previous kept doc (always keeping `min_k`), skips near-duplicates, and stops
+    at `max_k` docs or `token_budget` snippet tokens.
+    """
+    kept: List[Tuple[Document, float, set]] = []
+    duplicates = 0
+    tokens = 0
+    previous = None
+    for doc, score in sorted(scored, key=lambda pair: pair[1], reverse=True):
+        if max_k is not None and len(kept) >= max_k:
+            break
+        if len(kept) >= min_k:
+            if score < min_relevance or (previous is not None and previous - score > max_gap):
+                break
+        words = _words(doc)
+        if _is_duplicate(doc, kept, words):
+            duplicates += 1
+            continue
+        doc_tokens = doc.metadata.get("snippet_tokens") or count_tokens(doc_snippet(doc))
+        if token_budget is not None and kept and tokens + doc_tokens > token_budget:
+            break
+        tokens += doc_tokens
+        kept.append((doc, score, words))
+        previous = score
+
+    adaptive_stats.record(len(scored), len(kept), duplicates)
+    return [(doc, score) for doc, score, _ in kept]
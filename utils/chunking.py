@@ -1,7 +1,9 @@
 # utils/chunking.py
 
-from typing import List, Dict, Any
+from collections import defaultdict
+from typing import List, Dict, Any, Iterable, Iterator
 from langchain.schema import Document
+from utils.records import CatalogRecord, record_id
 
 # Chunker that groups records by a specified number of rows
 
@@ -37,6 +39,62 @@ class NRowsChunker:
                 "chunk_index": i // self.n,
             }
 
+            # Single-record chunk → attach the typed record + precomputed prompt snippet
+
+            if len(group) == 1:
+                metadata.update(CatalogRecord.from_raw(group[0]).to_metadata())
+
             docs.append(Document(page_content=page_content, metadata=metadata))
 
         return docs
+
+
+# Chunker that emits one compact document per record (+ optional category summaries)
+
+class RecordChunker:
+    """One document per record: page_content is the record's clean snippet (no NaN),
+    metadata carries the typed fields, and the ID is the deterministic record_id,
+    so a re-ingest of the same record gets the same ID.
+
+    Records are processed as a stream; `summaries=True` adds one overview document per
+    package category (useful for "ايه الباقات المتاحة؟"). Overviews get their own type,
+    "package_summary", so package searches never return them in place of a record.
+    """
+
+    def __init__(self, summaries: bool = False):
+        self.summaries = summaries
+
+    def iter_chunks(self, records: Iterable[Dict[str, Any]]) -> Iterator[Document]:
+        seen = set()
+        by_category = defaultdict(list)
+
+        for raw in records:
+            record = CatalogRecord.from_raw(raw)
+            if not (record.title or record.content) or record.record_id in seen:
+                continue
+            seen.add(record.record_id)
+
+            metadata = record.to_metadata()
+            metadata["chunk"] = "record"
+            del metadata["snippet"]  # page_content is the snippet
+            yield Document(id=record.record_id, page_content=record.snippet, metadata=metadata)
+
+            if self.summaries and record.type == "package":
+                by_category[record.category].append(record)
+
+        for category, group in by_category.items():
+            lines = [f"{r.title} — {r.price}" if r.price else r.title for r in group]
+            yield Document(
+                id=record_id("summary", category, ""),
+                page_content=f"{category}:\n" + "\n".join(lines),
+                metadata={
+                    "type": "package_summary",
+                    "category": category,
+                    "family": group[0].family,
+                    "title": category,
+                    "chunk": "summary",
+                },
+            )
+
+    def chunk(self, records: Iterable[Dict[str, Any]]) -> List[Document]:
+        return list(self.iter_chunks(records))
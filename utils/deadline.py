@@ -0,0 +1,118 @@
+# utils/deadline.py
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# End-to-end request deadline, propagated implicitly (contextvars) into retrieval,
+# rerank, tool LLM calls and the agent loop, so no signature has to carry it.
+
+_current: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+class Deadline:
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        # None → running, "cancelled" → abandoned at the deadline, "committed" → results recorded
+        self._state: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def cancel(self) -> bool:
+        """Abandon the turn: whatever it still produces must not be recorded.
+        False if it already recorded its results (its answer is about to come back)."""
+        with self._lock:
+            if self._state is None:
+                self._state = "cancelled"
+            return self._state == "cancelled"
+
+    def commit(self, write: Callable[[], None]) -> bool:
+        """Run `write` (record the turn's results) unless the turn was cancelled."""
+        with self._lock:
+            if self._state == "cancelled":
+                return False
+            write()
+            self._state = "committed"
+            return True
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(budget: float):
+    """Run the enclosed block (and everything it calls) under a deadline of `budget` seconds."""
+    deadline = Deadline(budget)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def has_budget(needed: float) -> bool:
+    """True if there is no deadline or at least `needed` seconds are left."""
+    deadline = _current.get()
+    return deadline is None or deadline.remaining() >= needed
+
+
+def call_timeout(default: float) -> float:
+    """Per-call timeout: the call's own default, capped by what is left of the request budget."""
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    return max(0.1, min(default, deadline.remaining()))
+
+
+class DeadlineChatModel(BaseChatModel):
+    """Chat model wrapper whose per-call timeout and retries come out of the request deadline.
+
+    `inner` should be built without client retries: they happen here, only while budget is left,
+    so a turn abandoned at its deadline stops calling the provider soon after.
+    """
+
+    inner: BaseChatModel
+    default_timeout: float
+    max_retries: int = 0
+    min_attempt_s: float = 1.0  # no new attempt with less than this left
+
+    @property
+    def _llm_type(self) -> str:
+        return "deadline"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        for attempt in range(self.max_retries + 1):
+            if not has_budget(self.min_attempt_s):
+                raise TimeoutError("request deadline reached")
+            try:
+                return self.inner._generate(messages, stop=stop, timeout=call_timeout(self.default_timeout), **kwargs)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+
+
+def within_deadline(llm: BaseChatModel, default_timeout: float, max_retries: int) -> BaseChatModel:
+    return DeadlineChatModel(inner=llm, default_timeout=default_timeout, max_retries=max_retries)
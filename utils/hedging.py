@@ -0,0 +1,211 @@
+# utils/hedging.py
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from config import LLM_HEDGING, LLM_HEDGE_MODEL
+from constants import (
+    HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DELAY_S, HEDGE_LATENCY_WINDOW,
+    HEDGE_BUDGET_RATIO, HEDGE_BUDGET_BURST, HEDGE_WORKERS
+)
+
+# Hedged LLM requests: if a call has not answered after the call type's observed p90,
+# a duplicate is sent (optionally to a faster model); the first answer wins.
+# A per-call-type token bucket caps the extra volume at ~HEDGE_BUDGET_RATIO of the calls.
+
+
+class LatencyTracker:
+    """Sliding window of primary-call latencies per call type."""
+
+    def __init__(self, window: int = HEDGE_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, call_type: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[call_type].append(seconds)
+
+    def quantile(self, call_type: str, q: float = HEDGE_PERCENTILE) -> Optional[float]:
+        """None until there are enough samples to trust the estimate."""
+        with self._lock:
+            samples = sorted(self._samples[call_type])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class HedgeBudget:
+    """Token bucket per call type: every call earns `ratio` tokens, every hedge spends one."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, float] = defaultdict(float)
+
+    def earn(self, call_type: str) -> None:
+        with self._lock:
+            self._tokens[call_type] = min(self.burst, self._tokens[call_type] + self.ratio)
+
+    def try_spend(self, call_type: str) -> bool:
+        with self._lock:
+            if self._tokens[call_type] < 1:
+                return False
+            self._tokens[call_type] -= 1
+            return True
+
+
+class HedgeStats:
+    """Counters per call type: calls, hedges sent, hedges that won, hedges denied by the budget."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0, "denied": 0}
+        )
+
+    def incr(self, call_type: str, counter: str) -> None:
+        with self._lock:
+            self._counts[call_type][counter] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            counts = {call_type: dict(c) for call_type, c in self._counts.items()}
+        for call_type, c in counts.items():
+            c["p90_s"] = latencies.quantile(call_type)
+        return counts
+
+
+latencies = LatencyTracker()
+budget = HedgeBudget()
+hedge_stats = HedgeStats()
+_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+class HedgedChatModel(BaseChatModel):
+    """Chat model wrapper that hedges slow calls of `primary` with `hedge_model` (or a second primary call).
+
+    Sync calls can only abandon the losing request (its thread finishes in the background);
+    async calls cancel the losing task.
+    """
+
+    primary: BaseChatModel
+    hedge_model: Optional[BaseChatModel] = None
+    call_type: str = "default"
+    delay: Optional[float] = None  # fixed hedge delay; None → observed p90 of the call type
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"call_type": self.call_type, "primary": self.primary._llm_type}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def hedge_delay(self) -> float:
+        if self.delay is not None:
+            return self.delay
+        p90 = latencies.quantile(self.call_type)
+        return HEDGE_DEFAULT_DELAY_S if p90 is None else p90
+
+    def _submit(self, model: BaseChatModel, messages, stop, kwargs, start: Optional[float] = None):
+        context = contextvars.copy_context()
+        future = _pool.submit(context.run, model._generate, messages, stop=stop, **kwargs)
+        if start is not None:
+            # latency of the primary is recorded even when it loses → unbiased p90
+            future.add_done_callback(lambda _: latencies.record(self.call_type, time.monotonic() - start))
+        return future
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        hedge_stats.incr(self.call_type, "calls")
+        budget.earn(self.call_type)
+
+        primary = self._submit(self.primary, messages, stop, kwargs, start=time.monotonic())
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+        if not budget.try_spend(self.call_type):
+            hedge_stats.incr(self.call_type, "denied")
+            return primary.result()
+
+        hedge_stats.incr(self.call_type, "hedged")
+        hedge = self._submit(self.hedge_model or self.primary, messages, stop, kwargs)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if future is hedge:
+                    hedge_stats.incr(self.call_type, "hedge_wins")
+                return future.result()
+        raise error
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        hedge_stats.incr(self.call_type, "calls")
+        budget.earn(self.call_type)
+
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self.primary._agenerate(messages, stop=stop, **kwargs))
+        primary.add_done_callback(lambda _: latencies.record(self.call_type, time.monotonic() - start))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+        if not budget.try_spend(self.call_type):
+            hedge_stats.incr(self.call_type, "denied")
+            return await primary
+
+        hedge_stats.incr(self.call_type, "hedged")
+        hedge = asyncio.ensure_future((self.hedge_model or self.primary)._agenerate(messages, stop=stop, **kwargs))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if task is hedge:
+                    hedge_stats.incr(self.call_type, "hedge_wins")
+                return task.result()
+        raise error
+
+
+def hedged(llm: BaseChatModel, call_type: str) -> BaseChatModel:
+    """Wrap `llm` for hedging when LLM_HEDGING is on (otherwise return it unchanged)."""
+    if not LLM_HEDGING:
+        return llm
+    hedge_model = None
+    if LLM_HEDGE_MODEL:
+        hedge_model = llm.model_copy(update={"model_name": LLM_HEDGE_MODEL})
+    return HedgedChatModel(primary=llm, hedge_model=hedge_model, call_type=call_type)
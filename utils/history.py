@@ -0,0 +1,126 @@
+# utils/history.py
+
+import sys
+from array import array
+from collections import deque
+from typing import Deque, Dict, List, Sequence, Tuple
+
+from langchain.memory import ConversationBufferMemory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from utils.deadline import current_deadline
+
+# Compact per-session history: a role code per message + the (interned) text, instead of a
+# pydantic message object per message. Message objects are only built when a prompt asks
+# for them, and the "User: ... / Assistant: ..." rendering the tools use is cached and extended
+# with each new message instead of rebuilt.
+
+HUMAN, AI, SYSTEM, OTHER = 0, 1, 2, 3
+_ROLES = {HumanMessage: HUMAN, AIMessage: AI, SystemMessage: SYSTEM}
+_LABELS = ("User", "Assistant", "Assistant", "Assistant")
+
+
+class CompactHistory(BaseChatMessageHistory):
+    """Chat history as parallel arrays (role codes, texts) with lazy message materialization.
+
+    Plain human / AI / system text messages are stored compactly; anything else (tool calls,
+    extra kwargs) is kept as the original object so nothing is lost.
+    """
+
+    def __init__(self):
+        self._roles = array("b")
+        self._texts: List[str] = []
+        self._others: Dict[int, BaseMessage] = {}
+        # window size → (messages count when rendered, text, line lengths in the window)
+        self._rendered: Dict[int, Tuple[int, str, Deque[int]]] = {}
+
+    def add_message(self, message: BaseMessage) -> None:
+        role = _ROLES.get(type(message), OTHER)
+        text = message.content
+        if role != OTHER and isinstance(text, str) and not (message.additional_kwargs or message.id
+                                                            or getattr(message, "tool_calls", None)):
+            # repeated texts (greetings, canned answers) share one string object across sessions
+            self._texts.append(sys.intern(text))
+        else:
+            role = OTHER
+            self._others[len(self._texts)] = message
+            self._texts.append(message.content if isinstance(message.content, str) else str(message.content))
+        self._roles.append(role)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        for message in messages:
+            self.add_message(message)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Materialized on every access (prompt building); nothing is kept."""
+        result = []
+        for i, (role, text) in enumerate(zip(self._roles, self._texts)):
+            if role == HUMAN:
+                result.append(HumanMessage(content=text))
+            elif role == AI:
+                result.append(AIMessage(content=text))
+            elif role == SYSTEM:
+                result.append(SystemMessage(content=text))
+            else:
+                result.append(self._others[i])
+        return result
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def render(self, limit: int) -> str:
+        """The last `limit` messages as "User: ..." / "Assistant: ..." lines (cached per window,
+        new messages are appended and the oldest lines cut off the front)."""
+        count = len(self._texts)
+        if limit <= 0:
+            return ""
+        cached = self._rendered.get(limit)
+        if cached is not None and cached[0] == count:
+            return cached[1]
+        if cached is None or count - cached[0] >= limit:
+            start, text, lengths = max(0, count - limit), "", deque()
+        else:
+            start, text, lengths = cached
+        new_lines = [self._line(i) for i in range(start, count)]
+        text = "\n".join([text, *new_lines] if text else new_lines)
+        lengths.extend(len(line) for line in new_lines)
+        while len(lengths) > limit:
+            text = text[lengths.popleft() + 1:]
+        self._rendered[limit] = (count, text, lengths)
+        return text
+
+    def _line(self, i: int) -> str:
+        return f"{_LABELS[self._roles[i]]}: {self._texts[i]}"
+
+    def clear(self) -> None:
+        self._roles = array("b")
+        self._texts = []
+        self._others = {}
+        self._rendered = {}
+
+
+class TurnMemory(ConversationBufferMemory):
+    """Session memory that records a turn only if the turn was not abandoned at its deadline
+    (the user got the degraded answer instead, which the agent records itself)."""
+
+    def save_context(self, inputs, outputs) -> None:
+        deadline = current_deadline()
+        if deadline is None:
+            super().save_context(inputs, outputs)
+        else:
+            deadline.commit(lambda: super(TurnMemory, self).save_context(inputs, outputs))
+
+
+def render_history(memory, limit: int) -> str:
+    """Role-tagged recent history of a session's memory (CompactHistory or any LangChain history)."""
+    history = getattr(memory, "chat_memory", None) if memory else None
+    if history is None:
+        return ""
+    if isinstance(history, CompactHistory):
+        return history.render(limit)
+    messages = history.messages[-limit:]
+    return "\n".join(
+        f"{'User' if isinstance(msg, HumanMessage) else 'Assistant'}: {msg.content}" for msg in messages
+    )
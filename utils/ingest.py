@@ -1,17 +1,27 @@
 # utils/ingest.py
 
-from typing import List 
+from typing import List, Optional
+import shutil
+import chromadb
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain.schema import Document
-from config import OPENAI_API_KEY, EMBEDDING_MODEL
+from config import OPENAI_API_KEY, EMBEDDING_MODEL, COLLECTION_NAME, RETRIEVAL_BACKEND
+from utils.records import CatalogRecord, save_records
+from utils.local_index import LocalVectorIndex
+from utils.snapshots import current_version, version_location, publish_version
 
 class ChromaIngestor:
 
-    def __init__(self, chroma_dir: str ="./chroma_store", embedding_model: str = EMBEDDING_MODEL):
+    def __init__(self, chroma_dir: str ="./chroma_store", embedding_model: str = EMBEDDING_MODEL, collection_name: str = COLLECTION_NAME,
+                 embeddings: Optional[Embeddings] = None):
         self.chroma_dir = chroma_dir
+        self.embeddings = embeddings  # optional Embeddings instance (e.g. local model for offline evaluation)
+        self.collection_name = collection_name
         self.embedding_model = embedding_model
         self.vectorstore = None
+        self.version = None
 
     # Clean text by removing "nan" and trimming whitespace
 
@@ -21,28 +31,86 @@ class ChromaIngestor:
             return ""
         return str(text).replace("nan", "").strip()
 
-    def ingest(self, docs: List[Document]):
+    def ingest(self, docs: List[Document], local_index: Optional[bool] = None) -> int:
+        """Build a new catalog version beside the live one, then publish it atomically.
 
-        # Clean docs قبل ingestion
+        Running services pick it up via RetrieverManager.reload() without a restart.
+        `local_index=None` exports the local index whenever RETRIEVAL_BACKEND is "local",
+        so a published version always has what the configured backend loads.
+        """
+
+        # Clean docs قبل ingestion (docs من RecordChunker نضيفة أصلاً → تعدي زي ما هي)
 
         cleaned_docs = [
-            Document(
+            doc if doc.metadata.get("chunk") else Document(
                 page_content=self.clean_text(doc.page_content),
                 metadata=doc.metadata
             )
             for doc in docs
-            if doc.page_content and self.clean_text(doc.page_content) != ""
+            if doc.metadata.get("chunk") or (doc.page_content and self.clean_text(doc.page_content) != "")
         ]
+        # Deterministic IDs when the chunker provides them (same record → same ID on every ingest)
+        ids = [doc.id for doc in cleaned_docs] if all(doc.id for doc in cleaned_docs) else None
        
-       # Initialize Chroma vectorstore مع cleaned documents
+       # Initialize Chroma vectorstore مع cleaned documents (في collection جديدة للـ version)
 
-        embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=self.embedding_model)
+        self.version = current_version(self.chroma_dir, self.collection_name) + 1
+        embeddings = self.embeddings or OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=self.embedding_model)
         self.vectorstore = Chroma.from_documents(
             documents=cleaned_docs,
             embedding=embeddings,
+            ids=ids,
+            collection_name=self.versioned_collection,
+            # cosine → relevance scores are cosine similarity, same scale as the local index
+            collection_metadata={"hnsw:space": "cosine"},
             persist_directory=self.chroma_dir
         )
         # Chroma automatically persists, no need for manual persist()
+
+        # Side table of typed records (record_id → record) for lookups without the vector store
+
+        records = [CatalogRecord.from_metadata(doc.metadata) for doc in cleaned_docs]
+        for record, doc in zip(records, cleaned_docs):
+            if record is not None and not record.snippet:
+                record.snippet = doc.page_content
+        save_records([r for r in records if r is not None], self.artifacts_dir)
+
+        # Optional memory-mapped local index (reuses the embeddings already stored in Chroma)
+
+        if local_index is None:
+            local_index = RETRIEVAL_BACKEND == "local"
+        if local_index:
+            self.export_local_index()
+
+        # Publish: الـ version الجديدة تبقى live بعد ما كل حاجة اتبنت
+
+        publish_version(self.chroma_dir, self.collection_name, self.version)
+        return self.version
+
+    def prune_versions(self, keep: int = 2):
+        """Drop old version collections, keeping the newest `keep` (the previous one serves in-flight requests)."""
+        live = current_version(self.chroma_dir, self.collection_name)
+        client = chromadb.PersistentClient(path=self.chroma_dir)
+        for version in range(1, live - keep + 1):
+            name, directory = version_location(self.chroma_dir, self.collection_name, version)
+            try:
+                client.delete_collection(name)
+            except Exception:
+                pass  # already pruned
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def export_local_index(self) -> LocalVectorIndex:
+        return LocalVectorIndex.from_chroma(self.get_vectorstore(), self.artifacts_dir)
+
+    # Versioned collection + directory for the records side table and local index
+
+    @property
+    def versioned_collection(self) -> str:
+        return version_location(self.chroma_dir, self.collection_name, self.version)[0]
+
+    @property
+    def artifacts_dir(self) -> str:
+        return version_location(self.chroma_dir, self.collection_name, self.version)[1]
     
         # Getter for vectorstore
 
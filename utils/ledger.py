@@ -0,0 +1,171 @@
+# utils/ledger.py
+
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from utils.tokens import count_tokens
+from constants import (
+    SESSION_TOKEN_BUDGET, TURN_TOKEN_BUDGET, LLM_PRICE_PER_1M_INPUT, LLM_PRICE_PER_1M_CACHED_INPUT,
+    LLM_PRICE_PER_1M_OUTPUT, EMBEDDING_PRICE_PER_1M
+)
+
+# Token / cost ledger: every LLM and embedding call is attributed to the session of the
+# current turn (contextvar → follows the turn into worker threads) and to its stage
+# (agent, faq, recommendation, support, rerank, embedding).
+
+_session: contextvars.ContextVar = contextvars.ContextVar("ledger_session", default=None)
+
+
+def _empty_stage() -> Dict[str, int]:
+    return {"calls": 0, "input": 0, "cached": 0, "output": 0}
+
+
+class SessionUsage:
+    """Running totals of one session."""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, int]] = {}
+        self.turns = 0
+        self.turn_tokens = 0
+
+    @property
+    def tokens(self) -> int:
+        return sum(s["input"] + s["output"] for s in self.stages.values())
+
+    @property
+    def cost_usd(self) -> float:
+        cost = 0.0
+        for stage, s in self.stages.items():
+            if stage == "embedding":
+                cost += s["input"] * EMBEDDING_PRICE_PER_1M
+            else:
+                cost += ((s["input"] - s["cached"]) * LLM_PRICE_PER_1M_INPUT
+                         + s["cached"] * LLM_PRICE_PER_1M_CACHED_INPUT
+                         + s["output"] * LLM_PRICE_PER_1M_OUTPUT)
+        return cost / 1_000_000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "turns": self.turns,
+            "last_turn_tokens": self.turn_tokens,
+            "stages": {stage: dict(s) for stage, s in self.stages.items()},
+        }
+
+
+class TokenLedger:
+    """Per-session token usage with per-session and per-turn budgets."""
+
+    def __init__(self, session_budget: int = SESSION_TOKEN_BUDGET, turn_budget: int = TURN_TOKEN_BUDGET):
+        self.session_budget = session_budget
+        self.turn_budget = turn_budget
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, SessionUsage] = {}
+        self.cheap_turns = 0
+
+    @contextmanager
+    def turn(self, session_id: str):
+        """Attribute everything called inside the block to `session_id` (one user turn)."""
+        with self._lock:
+            usage = self._sessions.setdefault(session_id, SessionUsage())
+            usage.turns += 1
+            usage.turn_tokens = 0
+        token = _session.set(session_id)
+        try:
+            yield usage
+        finally:
+            _session.reset(token)
+
+    def record(self, stage: str, input_tokens: int, output_tokens: int = 0, cached_tokens: int = 0) -> None:
+        session_id = _session.get()
+        if session_id is None:
+            return
+        with self._lock:
+            usage = self._sessions.setdefault(session_id, SessionUsage())
+            s = usage.stages.setdefault(stage, _empty_stage())
+            s["calls"] += 1
+            s["input"] += input_tokens
+            s["cached"] += cached_tokens
+            s["output"] += output_tokens
+            usage.turn_tokens += input_tokens + output_tokens
+
+    def record_usage(self, stage: str, usage: Dict[str, Any]) -> None:
+        """From a chat completion's usage_metadata."""
+        self.record(
+            stage,
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+            (usage.get("input_token_details") or {}).get("cache_read", 0) or 0,
+        )
+
+    def over_budget(self, session_id: Optional[str] = None) -> bool:
+        """True when the session (or its current turn) has used up its token budget → cheap mode."""
+        session_id = session_id or _session.get()
+        if session_id is None:
+            return False
+        with self._lock:
+            usage = self._sessions.get(session_id)
+            if usage is None:
+                return False
+            return usage.tokens >= self.session_budget or usage.turn_tokens >= self.turn_budget
+
+    def session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            usage = self._sessions.get(session_id)
+            return usage.to_dict() if usage else None
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def top_sessions(self, n: int = 5) -> List[Dict[str, Any]]:
+        with self._lock:
+            ranked = sorted(self._sessions.items(), key=lambda item: item[1].tokens, reverse=True)[:n]
+            return [{"session_id": session_id, **usage.to_dict()} for session_id, usage in ranked]
+
+    def snapshot(self, top: int = 5) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            totals: Dict[str, Dict[str, int]] = {}
+            for usage in sessions:
+                for stage, s in usage.stages.items():
+                    t = totals.setdefault(stage, _empty_stage())
+                    for field, value in s.items():
+                        t[field] += value
+            cost = sum(usage.cost_usd for usage in sessions)
+        return {
+            "sessions": len(sessions),
+            "cost_usd": round(cost, 6),
+            "cheap_turns": self.cheap_turns,
+            "stages": totals,
+            "top_sessions": self.top_sessions(top),
+        }
+
+
+ledger = TokenLedger()
+
+
+def cheap_mode() -> bool:
+    """Current turn's session is over its token budget → skip rerank, answer extractively."""
+    return ledger.over_budget()
+
+
+class MeteredEmbeddings(Embeddings):
+    """Embeddings wrapper that books estimated input tokens on the ledger (stage "embedding")."""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if _session.get() is not None:
+            ledger.record("embedding", sum(count_tokens(text) for text in texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if _session.get() is not None:
+            ledger.record("embedding", count_tokens(text))
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,146 @@
+# utils/local_index.py
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Pre-embedded local vector index: float32 matrix of normalized embeddings (.npy, memory-mapped)
+# + JSON metadata sidecar. Worker processes share the matrix through the OS page cache.
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "index_metadata.json"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class LocalVectorIndex(VectorStore):
+    """Read-only, memory-mapped vector store with the same interface as Chroma.
+
+    Search is a single dot product (embeddings are normalized → cosine similarity)
+    over the rows allowed by the filter, followed by argpartition for top-k.
+    """
+
+    def __init__(self, matrix: np.ndarray, documents: List[Document], embedding: Embeddings):
+        self.matrix = matrix
+        self.documents = documents
+        self._embedding = embedding
+        self._row_by_id = {d.metadata.get("record_id"): i for i, d in enumerate(documents) if d.metadata.get("record_id")}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: Dict[Tuple[str, Any], np.ndarray] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # ===== Build / load =====
+
+    @classmethod
+    def build(cls, documents: List[Document], vectors: Iterable[List[float]], directory: str, embedding: Embeddings) -> "LocalVectorIndex":
+        """Write the matrix + sidecar from already computed embeddings."""
+        os.makedirs(directory, exist_ok=True)
+        matrix = _normalize(np.asarray(list(vectors), dtype=np.float32))
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), matrix)
+        with open(os.path.join(directory, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump([{"page_content": d.page_content, "metadata": d.metadata} for d in documents], f, ensure_ascii=False)
+        return cls.load(directory, embedding)
+
+    @classmethod
+    def from_chroma(cls, vectorstore, directory: str) -> "LocalVectorIndex":
+        """Export an existing Chroma collection (no re-embedding)."""
+        data = vectorstore.get(include=["embeddings", "documents", "metadatas"])
+        documents = [Document(page_content=text, metadata=meta or {}) for text, meta in zip(data["documents"], data["metadatas"])]
+        return cls.build(documents, data["embeddings"], directory, vectorstore.embeddings)
+
+    @classmethod
+    def load(cls, directory: str, embedding: Embeddings) -> "LocalVectorIndex":
+        """Zero-copy load: the matrix stays on disk and is paged in on demand."""
+        matrix = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, METADATA_FILE), "r", encoding="utf-8") as f:
+            documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.load(f)]
+        return cls(matrix, documents, embedding)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, EMBEDDINGS_FILE)) and os.path.exists(os.path.join(directory, METADATA_FILE))
+
+    # ===== Filtering =====
+
+    def _column(self, key: str) -> np.ndarray:
+        if key not in self._columns:
+            self._columns[key] = np.array([d.metadata.get(key) for d in self.documents], dtype=object)
+        return self._columns[key]
+
+    def _mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Chroma-style filter → boolean row mask ({"type": "faq"}, {"record_id": {"$in": [...]}}, {"$and": [...]})."""
+        if not filter:
+            return None
+        mask = np.ones(len(self.documents), dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self._mask(sub)
+            elif isinstance(condition, dict) and "$in" in condition:
+                if key == "record_id":
+                    rows = [self._row_by_id[i] for i in condition["$in"] if i in self._row_by_id]
+                    sub_mask = np.zeros(len(self.documents), dtype=bool)
+                    sub_mask[rows] = True
+                else:
+                    sub_mask = np.isin(self._column(key), list(condition["$in"]))
+                mask &= sub_mask
+            else:
+                value = condition["$eq"] if isinstance(condition, dict) else condition
+                cache_key = (key, value)
+                if cache_key not in self._masks:
+                    self._masks[cache_key] = self._column(key) == value
+                mask &= self._masks[cache_key]
+        return mask
+
+    # ===== Search =====
+
+    def search_by_vector(self, vector: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        mask = self._mask(filter)
+        if mask is None:
+            rows = np.arange(len(self.documents))
+            scores = self.matrix @ query
+        else:
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return []
+            scores = self.matrix[rows] @ query
+        k = min(k, rows.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[rows[i]], float(scores[i])) for i in top]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.search_by_vector(self._embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.search_by_vector(embedding, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        # Normalized dot product is already cosine similarity
+        return lambda score: score
+
+    # ===== Read-only store =====
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("LocalVectorIndex is read-only; rebuild it with LocalVectorIndex.build()")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, directory: str = "./local_index", **kwargs: Any) -> "LocalVectorIndex":
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        return cls.build(documents, embedding.embed_documents(list(texts)), directory, embedding)
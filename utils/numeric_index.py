@@ -0,0 +1,137 @@
+# utils/numeric_index.py
+
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from utils.records import CatalogRecord, normalize_numbers
+
+# Numeric attributes indexed for range queries (all parsed at ingest in CatalogRecord)
+NUMERIC_ATTRIBUTES = ("price_value", "flex_units", "mb")
+
+
+class NumericConstraint(NamedTuple):
+    attribute: str
+    low: Optional[float]
+    high: Optional[float]
+
+
+class NumericIndex:
+    """Sorted-array index over package price and quotas.
+
+    Each attribute keeps parallel sorted lists (values, record IDs), so
+    "≤ budget" and range queries are two bisects and a slice.
+    """
+
+    def __init__(self, records: Iterable[CatalogRecord]):
+        self._values: Dict[str, List[float]] = {}
+        self._ids: Dict[str, List[str]] = {}
+        records = [r for r in records if r.type == "package"]
+        for attribute in NUMERIC_ATTRIBUTES:
+            pairs = sorted(
+                (getattr(r, attribute), r.record_id)
+                for r in records if getattr(r, attribute) is not None
+            )
+            self._values[attribute] = [v for v, _ in pairs]
+            self._ids[attribute] = [i for _, i in pairs]
+
+    def __len__(self) -> int:
+        return len(self._ids.get("price_value", []))
+
+    def range(self, attribute: str, low: Optional[float] = None, high: Optional[float] = None) -> List[str]:
+        """Record IDs with low ≤ value ≤ high (either bound optional), ascending by value."""
+        values = self._values[attribute]
+        start = bisect_left(values, low) if low is not None else 0
+        end = bisect_right(values, high) if high is not None else len(values)
+        return self._ids[attribute][start:end]
+
+    def at_most(self, attribute: str, value: float) -> List[str]:
+        return self.range(attribute, high=value)
+
+    def query(self, constraints: Sequence[NumericConstraint]) -> List[str]:
+        """Record IDs satisfying all constraints, ascending by the first constraint's attribute."""
+        ids = self.range(constraints[0].attribute, constraints[0].low, constraints[0].high)
+        for constraint in constraints[1:]:
+            allowed = set(self.range(constraint.attribute, constraint.low, constraint.high))
+            ids = [i for i in ids if i in allowed]
+        return ids
+
+
+# ===== Parsing budget / quota constraints from the user query =====
+
+_AT_MOST = ("بحد", "حد اقصى", "حد أقصى", "لحد", "تحت", "أقل من", "اقل من", "مش اكتر من", "مش أكثر من",
+            "ميزانيتي", "ميزانية", "في حدود", "under", "below", "less than", "up to", "max", "within", "budget")
+_AT_LEAST = ("أكثر من", "اكثر من", "اكتر من", "فوق", "على الاقل", "على الأقل", "more than", "over", "at least", "above")
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+# وحدة بعد الرقم مباشرة: الحصة بالميجا / الجيجا / الفليكس، غير كده السعر
+_UNIT = r"(?:\s*(جيجا|giga|gb|ميجا|mega|mb|فليكس|flex)(?!\w))?"
+# كلمات ممكن تيجي بين الكلمة والرقم ("في حدود الـ ١٠٠"، "budget of 100")
+_FILLER = r"(?:\s*(?:الـ|ال|حوالي|يعني|of|about|around|\$))*\s*"
+
+
+def _keywords(words) -> str:
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+# كلمة الحد → الرقم اللي بعدها بالظبط (كلمة كاملة: "max" مش جزء من "maximum"، و"و" ملزوقة مسموحة)
+_BOUND = re.compile(
+    rf"(?<!\w)و?(?:(?P<most>{_keywords(_AT_MOST)})|(?P<least>{_keywords(_AT_LEAST)}))(?!\w){_FILLER}{_NUMBER}{_UNIT}"
+)
+_BETWEEN = re.compile(
+    rf"(?<!\w)(?:بين|من|between|from)\s*{_NUMBER}{_UNIT}\s*(?:و|ل|لـ|الى|إلى|to|and|-)\s*{_NUMBER}{_UNIT}"
+)
+_QUOTA = re.compile(rf"{_NUMBER}\s*(جيجا|giga|gb|ميجا|mega|mb|فليكس|flex)(?!\w)")
+
+
+def _attribute(unit: Optional[str]) -> str:
+    if unit in ("جيجا", "giga", "gb", "ميجا", "mega", "mb"):
+        return "mb"
+    if unit in ("فليكس", "flex"):
+        return "flex_units"
+    return "price_value"
+
+
+def _value(number: str, unit: Optional[str]) -> float:
+    value = float(number)
+    return value * 1000 if unit in ("جيجا", "giga", "gb") else value
+
+
+def parse_numeric_constraints(query: str) -> Tuple[NumericConstraint, ...]:
+    """استخراج شروط رقمية (ميزانية و/أو حصة) من السؤال، شرط واحد لكل attribute
+
+    كل كلمة حد بتتربط بالرقم اللي بعدها مباشرة، والوحدة اللي بعد الرقم بتحدد هو سعر ولا حصة:
+    "باقة انترنت 10 جيجا بحد 200 جنيه" → price_value ≤ 200 و mb ≥ 10000
+    "فليكس ٧٠ ولا فليكس ١٠٠ أحسن تحت ٢٠٠" → price_value ≤ 200 (الـ ٧٠ والـ ١٠٠ أسماء باقات)
+    "باقة ٧٠" من غير كلمة حد → () (ده اسم باقة مش ميزانية)
+    حصة من غير كلمة حد ("10 جيجا") تتحسب "على الأقل" بس لو السؤال فيه شرط تاني صريح.
+    """
+    text = normalize_numbers((query or "").lower())
+    bounds: Dict[str, List[Optional[float]]] = {}
+
+    def add(attribute: str, low: Optional[float], high: Optional[float]) -> None:
+        current = bounds.setdefault(attribute, [None, None])
+        if low is not None:
+            current[0] = low if current[0] is None else max(current[0], low)
+        if high is not None:
+            current[1] = high if current[1] is None else min(current[1], high)
+
+    for match in _BETWEEN.finditer(text):
+        unit = match.group(2) or match.group(4)
+        values = sorted((_value(match.group(1), unit), _value(match.group(3), unit)))
+        add(_attribute(unit), values[0], values[1])
+    for match in _BOUND.finditer(text):
+        value, attribute = _value(match.group(3), match.group(4)), _attribute(match.group(4))
+        if match.group("most"):
+            add(attribute, None, value)
+        else:
+            add(attribute, value, None)
+
+    if bounds:
+        for match in _QUOTA.finditer(text):
+            attribute = _attribute(match.group(2))
+            if attribute not in bounds:
+                add(attribute, _value(match.group(1), match.group(2)), None)
+
+    return tuple(
+        NumericConstraint(attribute, *bounds[attribute]) for attribute in NUMERIC_ATTRIBUTES if attribute in bounds
+    )
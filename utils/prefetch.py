@@ -0,0 +1,135 @@
+# utils/prefetch.py
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from constants import PREFETCH_WORKERS
+
+# Speculative retrieval: when a message arrives, the likely searches (FAQ / package with the
+# message as-is) start in the background while the agent plans. Tools that later run the same
+# search take the prefetched result from the per-turn cache; unused prefetches are cancelled
+# (if not started yet) when the turn ends.
+
+_turn: contextvars.ContextVar = contextvars.ContextVar("prefetch_turn", default=None)
+_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+class PrefetchStats:
+    """started / used / wasted (ran, never used) / cancelled (never ran) + latency saved for the tools."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.cancelled = 0
+        self.saved_s = 0.0
+
+    def add(self, counter: str, value: Any = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            unused = self.wasted + self.cancelled
+            return {
+                "started": self.started,
+                "used": self.used,
+                "wasted": self.wasted,
+                "cancelled": self.cancelled,
+                "waste_ratio": round(unused / self.started, 3) if self.started else 0.0,
+                "latency_saved_s": round(self.saved_s, 3),
+                "avg_saved_ms": round(self.saved_s / self.used * 1000, 1) if self.used else 0.0,
+            }
+
+
+prefetch_stats = PrefetchStats()
+
+
+class _Entry:
+    __slots__ = ("future", "started", "finished")
+
+    def __init__(self):
+        self.future = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+
+class TurnPrefetch:
+    """Prefetched results of one turn, keyed like the searches that will consume them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+
+    def submit(self, key: Hashable, fn: Callable[[], Any]) -> None:
+        entry = _Entry()
+
+        def run():
+            entry.started = time.monotonic()
+            try:
+                return fn()
+            finally:
+                entry.finished = time.monotonic()
+
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+        # the prefetch runs in the turn's context (deadline, ledger session)
+        entry.future = _pool.submit(contextvars.copy_context().run, run)
+        prefetch_stats.add("started")
+
+    def take(self, key: Hashable):
+        """(True, result) for a prefetched key, else (False, None). Each prefetch is used once."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return False, None
+        waited_from = time.monotonic()
+        try:
+            result = entry.future.result()
+        except Exception:
+            # failed prefetch → the caller just runs the search itself
+            prefetch_stats.add("wasted")
+            return False, None
+        waited = time.monotonic() - waited_from
+        prefetch_stats.add("used")
+        prefetch_stats.add("saved_s", max(0.0, (entry.finished - entry.started) - waited))
+        return True, result
+
+    def close(self) -> None:
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            prefetch_stats.add("cancelled" if entry.future.cancel() else "wasted")
+
+
+def current_prefetch() -> Optional[TurnPrefetch]:
+    return _turn.get()
+
+
+@contextmanager
+def prefetch_scope():
+    """Per-turn prefetch cache; everything left unused is cancelled / counted as waste on exit."""
+    turn = TurnPrefetch()
+    token = _turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _turn.reset(token)
+        turn.close()
+
+
+def prefetched(key: Hashable, fn: Callable[[], Any]) -> Any:
+    """The turn's prefetched result for `key` if there is one, else run `fn`."""
+    turn = _turn.get()
+    if turn is not None:
+        found, result = turn.take(key)
+        if found:
+            return result
+    return fn()
@@ -0,0 +1,276 @@
+# utils/profiling.py
+
+import cProfile
+import hmac
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from config import PROFILE_DIR, PROFILE_ADMINS, PROFILE_ADMIN_TOKEN
+from constants import (
+    PROFILE_SAMPLE_INTERVAL_S, PROFILE_MAX_DURATION_S, PROFILE_MAX_CALLS, PROFILE_TOP_N,
+    PROFILE_TRACEMALLOC_FRAMES
+)
+
+# On-demand profiling of a live worker (admin command / app.py flags). Nothing runs while idle:
+# the sampler thread only exists during a capture, the cProfile hook is a counter check per
+# message and tracemalloc is off until memory tracing is requested.
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Profiler:
+    """Time-boxed stack sampling, cProfile of the next N messages and tracemalloc reports.
+
+    Outputs go to PROFILE_DIR: `*.folded` (collapsed stacks for flamegraph.pl / speedscope),
+    `*.prof` + `*.txt` (cProfile) and `*-memory.txt` (top allocations).
+    """
+
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._calls_left = 0
+        self._calls_target = 0
+        self._stats: Optional[pstats.Stats] = None
+        self._profiled_calls = 0
+        self._profiling = False  # a cProfile capture is running (one at a time)
+        self._previous_snapshot = None
+        self._sequence = itertools.count(1)
+        self.last_outputs: List[str] = []
+
+    def _path(self, kind: str, ext: str) -> str:
+        """Unique per capture: several captures in the same second / several workers never collide."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+        return os.path.join(self.output_dir, f"{stamp}-p{os.getpid()}-{next(self._sequence)}-{kind}.{ext}")
+
+    def _written(self, path: str) -> str:
+        with self._lock:
+            self.last_outputs = (self.last_outputs + [path])[-10:]
+        return path
+
+    # ----- sampling -----
+
+    def start_sampling(self, duration_s: float, interval_s: float = PROFILE_SAMPLE_INTERVAL_S) -> str:
+        """Sample all threads' stacks for `duration_s` in the background; returns the output path."""
+        duration_s = min(duration_s, PROFILE_MAX_DURATION_S)
+        path = self._path("sample", "folded")
+        with self._lock:
+            if self._sampler is not None and self._sampler.is_alive():
+                raise RuntimeError("فيه sampling profile شغال بالفعل")
+            self._sampler = threading.Thread(
+                target=self._sample, args=(duration_s, interval_s, path), name="profiler-sampler", daemon=True
+            )
+            self._sampler.start()
+        return path
+
+    def sample(self, duration_s: float, interval_s: float = PROFILE_SAMPLE_INTERVAL_S) -> str:
+        """Blocking version of start_sampling (CLI)."""
+        path = self.start_sampling(duration_s, interval_s)
+        self._sampler.join()
+        return path
+
+    def _sample(self, duration_s: float, interval_s: float, path: str) -> None:
+        own = threading.get_ident()
+        names = {}
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + duration_s
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                labels.append(names.get(ident, str(ident)))
+                # collapsed format: root first, frames joined by ";", then the sample count
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval_s)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self._written(path)
+
+    # ----- cProfile of the next N messages -----
+
+    def profile_calls(self, n: int) -> None:
+        """Profile the next `n` handle_message calls (merged into one report)."""
+        with self._lock:
+            self._calls_left = self._calls_target = min(n, PROFILE_MAX_CALLS)
+            self._stats = None
+            self._profiled_calls = 0
+
+    def profiled(self, fn: Callable) -> Callable:
+        """`fn` itself when idle, else a wrapper that runs it under cProfile (in the calling thread).
+
+        Only one turn is profiled at a time: cProfile is process-wide on Python ≥ 3.12 (a second
+        enable() raises ValueError), so turns overlapping a capture run unprofiled and the
+        capture moves on to a later turn.
+        """
+        if self._calls_left <= 0:
+            return fn
+
+        def run(*args, **kwargs):
+            with self._lock:
+                if self._profiling or self._calls_left <= 0:
+                    profile = None
+                else:
+                    self._profiling = True
+                    self._calls_left -= 1
+                    profile = cProfile.Profile()
+            if profile is None:
+                return fn(*args, **kwargs)
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler / debugger owns the hook → give the call back, run unprofiled
+                with self._lock:
+                    self._profiling = False
+                    self._calls_left += 1
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._add_profile(profile)
+
+        return run
+
+    def _add_profile(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._profiled_calls += 1
+            self._profiling = False
+            # the last of the N profiled calls writes the merged report
+            done = self._profiled_calls == self._calls_target
+            stats = self._stats
+        if done:
+            self._write_profile(stats)
+
+    def _write_profile(self, stats: pstats.Stats) -> str:
+        path = self._path("calls", "prof")
+        stats.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(path, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        with open(path[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        return self._written(path)
+
+    # ----- memory -----
+
+    def start_memory_tracing(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+
+    def stop_memory_tracing(self) -> None:
+        tracemalloc.stop()
+        self._previous_snapshot = None
+
+    def memory_report(self, sessions: Optional[Dict[str, Any]] = None, top: int = PROFILE_TOP_N) -> str:
+        """Top allocations (and growth since the previous report) + session store size."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc مش شغال - ابدأ بـ start_memory_tracing()")
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)", ""]
+        if sessions is not None:
+            lines += self._session_lines(sessions) + [""]
+        # Session store: allocations made by CompactHistory (utils/history.py) anywhere in the traceback
+        store = snapshot.filter_traces([tracemalloc.Filter(True, "*/utils/history.py", all_frames=True)])
+        lines.append(f"session store: {sum(s.size for s in store.statistics('filename')) / 1e6:.2f} MB")
+        lines += [f"  {stat}" for stat in store.statistics("lineno")[:top // 3]]
+        lines += ["", f"top {top} allocations by line:"]
+        lines += [f"  {stat}" for stat in snapshot.statistics("lineno")[:top]]
+        if self._previous_snapshot is not None:
+            lines += ["", f"top {top} growth since the previous report:"]
+            lines += [f"  {stat}" for stat in snapshot.compare_to(self._previous_snapshot, "lineno")[:top]]
+        self._previous_snapshot = snapshot
+
+        path = self._path("memory", "txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return self._written(path)
+
+    @staticmethod
+    def _session_lines(sessions: Dict[str, Any]) -> List[str]:
+        messages = chars = 0
+        for executor in list(sessions.values()):
+            memory = getattr(executor, "memory", None)
+            history = getattr(memory, "chat_memory", None)
+            for text in getattr(history, "_texts", None) or [m.content for m in getattr(history, "messages", ())]:
+                messages += 1
+                chars += len(str(text))
+        return [f"sessions: {len(sessions)}, messages: {messages}, message chars: {chars}"]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sampling": self._sampler is not None and self._sampler.is_alive(),
+                "calls_left": self._calls_left,
+                "calls_profiled": self._profiled_calls,
+                "memory_tracing": tracemalloc.is_tracing(),
+                "outputs": list(self.last_outputs),
+            }
+
+
+profiler = Profiler()
+
+
+def split_admin_args(args: Iterable[str], identity: Optional[str] = None) -> Optional[List[str]]:
+    """Command args if the sender is an admin (PROFILE_ADMINS identity, or PROFILE_ADMIN_TOKEN
+    as the first arg, which is stripped), else None."""
+    args = list(args)
+    if identity and identity in PROFILE_ADMINS:
+        return args
+    if PROFILE_ADMIN_TOKEN and args and hmac.compare_digest(args[0], PROFILE_ADMIN_TOKEN):
+        return args[1:]
+    return None
+
+
+def profile_command(args: Iterable[str], sessions: Optional[Dict[str, Any]] = None) -> str:
+    """Admin command: `/profile sample <s>` | `calls <n>` | `memory [start|stop]` | `status`."""
+    args = list(args)
+    action = args[0] if args else "status"
+    try:
+        if action == "sample":
+            seconds = float(args[1]) if len(args) > 1 else 10.0
+            return f"🔬 sampling {min(seconds, PROFILE_MAX_DURATION_S):g}s → {profiler.start_sampling(seconds)}"
+        if action == "calls":
+            n = int(args[1]) if len(args) > 1 else 5
+            profiler.profile_calls(n)
+            return f"🔬 cProfile للـ {min(n, PROFILE_MAX_CALLS)} رسائل الجاية → {profiler.output_dir}"
+        if action == "memory":
+            sub = args[1] if len(args) > 1 else "report"
+            if sub == "start":
+                profiler.start_memory_tracing()
+                return "🔬 tracemalloc شغال"
+            if sub == "stop":
+                profiler.stop_memory_tracing()
+                return "🔬 tracemalloc اتقفل"
+            return f"🔬 {profiler.memory_report(sessions)}"
+        if action == "status":
+            return f"🔬 {profiler.status()}"
+    except (RuntimeError, ValueError) as e:
+        return f"❌ {e}"
+    return "الاستخدام: /profile sample <ثواني> | calls <عدد> | memory [start|stop] | status"
@@ -0,0 +1,79 @@
+# utils/prompt_cache.py
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from utils.tokens import count_tokens
+from utils.ledger import ledger
+
+# Prompt layout for provider prefix caching: every prompt starts with a byte-stable static
+# block (instructions, tool descriptions) and ends with the dynamic parts (history, context,
+# question). These counters show how much of each prompt is static and how much the
+# provider actually served from its cache.
+
+
+class PromptStats:
+    """Per call type: static vs dynamic prompt tokens and provider cached tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._static: Dict[str, int] = {}
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "prompt_tokens": 0, "static_tokens": 0, "dynamic_tokens": 0, "cached_tokens": 0}
+        )
+
+    def register_static(self, call_type: str, static_prefix: str) -> None:
+        """Token count of the call type's static prefix (counted once per process)."""
+        if call_type in self._static:
+            return
+        tokens = count_tokens(static_prefix)
+        with self._lock:
+            self._static[call_type] = tokens
+
+    def record(self, call_type: str, usage: Dict[str, Any]) -> None:
+        prompt_tokens = usage.get("input_tokens", 0)
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        static = min(self._static.get(call_type, 0), prompt_tokens)
+        with self._lock:
+            c = self._counts[call_type]
+            c["calls"] += 1
+            c["prompt_tokens"] += prompt_tokens
+            c["static_tokens"] += static
+            c["dynamic_tokens"] += prompt_tokens - static
+            c["cached_tokens"] += cached
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            counts = {call_type: dict(c) for call_type, c in self._counts.items()}
+        for c in counts.values():
+            c["static_share"] = round(c["static_tokens"] / c["prompt_tokens"], 3) if c["prompt_tokens"] else 0.0
+            c["cache_hit_rate"] = round(c["cached_tokens"] / c["prompt_tokens"], 3) if c["prompt_tokens"] else 0.0
+        return counts
+
+
+prompt_stats = PromptStats()
+
+
+class PromptUsageHandler(BaseCallbackHandler):
+    """Reads usage_metadata (incl. cached input tokens) from every chat completion of one call type
+    into the prompt stats and the session token ledger."""
+
+    def __init__(self, call_type: str):
+        self.call_type = call_type
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_stats.record(self.call_type, usage)
+                    ledger.record_usage(self.call_type, usage)
+
+
+def track_prompt_usage(llm: BaseChatModel, call_type: str) -> BaseChatModel:
+    """Attach the usage handler to the outermost model (local callbacks, not inherited by tool calls)."""
+    llm.callbacks = list(llm.callbacks or []) + [PromptUsageHandler(call_type)]
+    return llm
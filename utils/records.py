@@ -0,0 +1,189 @@
+# utils/records.py
+
+import hashlib
+import json
+import math
+import os
+import re
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from langchain.schema import Document
+from utils.tokens import count_tokens
+
+# Typed catalog records parsed once at ingest time, so the query path never re-parses strings
+
+RECORDS_FILE = "records.json"
+
+FAMILY_BY_CATEGORY = {
+    "flex_packages": "flex",
+    "plus_packages": "plus",
+    "plus_business": "plus_business",
+    "specialized_apps": "apps",
+    "faq": "faq",
+}
+
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+# "1،400" / "١٠،٠٠٠" / "1,750" → thousands separators between digits
+_THOUSANDS_SEP = re.compile(r"(?<=\d)[،,](?=\d{3})")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _clean(value: Any) -> str:
+    """Raw field → clean string (NaN/None → "")."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    text = str(value).strip()
+    return "" if text.lower() == "nan" else text
+
+
+def normalize_numbers(text: str) -> str:
+    """أرقام عربية → لاتينية ومن غير فواصل الآلاف ("١٠،٠٠٠" → "10000")"""
+    return _THOUSANDS_SEP.sub("", (text or "").translate(_ARABIC_DIGITS))
+
+
+def parse_numbers(text: str) -> List[float]:
+    """كل الأرقام في النص بعد توحيد الأرقام العربية والفواصل"""
+    return [float(n) for n in _NUMBER.findall(normalize_numbers(text))]
+
+
+def _first_number(text: str) -> Optional[float]:
+    numbers = parse_numbers(text)
+    return numbers[0] if numbers else None
+
+
+def _quota_before(text: str, unit: str) -> Optional[int]:
+    """الرقم اللي قبل الوحدة مباشرة (مثال: "٣،٠٠٠ فليكس" → 3000)"""
+    normalized = _THOUSANDS_SEP.sub("", (text or "").translate(_ARABIC_DIGITS))
+    match = re.search(r"(\d+(?:\.\d+)?)\s*" + unit, normalized)
+    return int(float(match.group(1))) if match else None
+
+
+def record_id(record_type: str, category: str, title: str) -> str:
+    """Deterministic ID: same record → same ID across re-ingests."""
+    key = f"{record_type}|{category}|{title}".encode("utf-8")
+    return hashlib.sha1(key).hexdigest()[:16]
+
+
+@dataclass
+class CatalogRecord:
+    """Typed package / FAQ record with a pre-rendered prompt snippet."""
+    record_id: str
+    type: str
+    title: str
+    content: str = ""
+    price: str = ""
+    category: str = ""
+    family: str = ""
+    tags: List[str] = field(default_factory=list)
+    number: Optional[float] = None
+    price_value: Optional[float] = None
+    flex_units: Optional[int] = None
+    mb: Optional[int] = None
+    snippet: str = ""
+    snippet_tokens: int = 0
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> "CatalogRecord":
+        record_type = _clean(raw.get("type"))
+        title = _clean(raw.get("title"))
+        content = _clean(raw.get("content"))
+        price = _clean(raw.get("price"))
+        category = _clean(raw.get("category"))
+        tags = [t for t in _clean(raw.get("tags")).split(";") if t]
+
+        record = cls(
+            record_id=record_id(record_type, category, title),
+            type=record_type,
+            title=title,
+            content=content,
+            price=price,
+            category=category,
+            family=FAMILY_BY_CATEGORY.get(category, category),
+            tags=tags,
+        )
+        if record_type == "package":
+            record.number = _first_number(title)
+            record.price_value = _first_number(price)
+            record.flex_units = _quota_before(content, "فليكس")
+            record.mb = _quota_before(content, "ميجا")
+        record.snippet = record.render_snippet()
+        record.snippet_tokens = count_tokens(record.snippet)
+        return record
+
+    def render_snippet(self) -> str:
+        """Compact prompt line for this record (no NaN, no redundant separators)."""
+        if self.type == "faq":
+            return f"س: {self.title}\nج: {self.content}"
+        parts = [p for p in (self.title, self.content, self.price) if p]
+        return " — ".join(parts)
+
+    def to_metadata(self) -> Dict[str, Any]:
+        """Chroma metadata accepts scalars only: drop None and join lists."""
+        metadata = {k: v for k, v in asdict(self).items() if v is not None}
+        metadata["tags"] = ";".join(self.tags)
+        return metadata
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any]) -> Optional["CatalogRecord"]:
+        if "record_id" not in metadata:
+            return None
+        names = cls.__dataclass_fields__.keys()
+        values = {k: v for k, v in metadata.items() if k in names}
+        values["tags"] = [t for t in str(values.get("tags", "")).split(";") if t]
+        return cls(**values)
+
+
+def build_records(raw_records: Iterable[Dict[str, Any]]) -> List[CatalogRecord]:
+    return [CatalogRecord.from_raw(r) for r in raw_records]
+
+
+def catalog_dir(persist_directory: str, collection_name: str) -> str:
+    """Per-collection directory for side artifacts (records, local index)."""
+    return os.path.join(persist_directory, collection_name)
+
+
+def save_records(records: Iterable[CatalogRecord], directory: str) -> str:
+    """Write the side table next to the vector store."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, RECORDS_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([asdict(r) for r in records], f, ensure_ascii=False)
+    return path
+
+
+def load_records(directory: str) -> Dict[str, CatalogRecord]:
+    """Side table: record_id → CatalogRecord (empty if the store predates records)."""
+    path = os.path.join(directory, RECORDS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {r["record_id"]: CatalogRecord(**r) for r in json.load(f)}
+
+
+def doc_snippet(doc: Document) -> str:
+    return doc.metadata.get("snippet") or doc.page_content
+
+
+def pack_snippets(docs: List[Document], token_budget: int, numbered: bool = False, bullet: str = "") -> str:
+    """Pack the most relevant records (docs are in rank order) into a fixed token budget.
+
+    Uses the snippet and token length precomputed at ingest; falls back to
+    page_content for stores ingested before records existed.
+    """
+    return pack_docs(docs, token_budget, numbered, bullet)[0]
+
+
+def pack_docs(docs: List[Document], token_budget: int, numbered: bool = False,
+              bullet: str = "") -> Tuple[str, List[Document]]:
+    """pack_snippets + the docs that actually fit (a rank-order prefix of `docs`)."""
+    lines = []
+    used = 0
+    for doc in docs:
+        snippet = doc_snippet(doc)
+        tokens = doc.metadata.get("snippet_tokens") or count_tokens(snippet)
+        if lines and used + tokens > token_budget:
+            break
+        used += tokens
+        prefix = f"{len(lines) + 1}. " if numbered else bullet
+        lines.append(f"{prefix}{snippet}")
+    return "\n".join(lines), docs[:len(lines)]
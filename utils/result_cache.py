@@ -0,0 +1,73 @@
+# utils/result_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+from constants import RESULT_CACHE_SIZE, RESULT_CACHE_TTL_S
+
+
+class ResultCache:
+    """Size-bounded LRU + TTL cache of final retrieval results (ranked document IDs).
+
+    Keys start with (tenant, version, ...) so a re-ingest never serves old results;
+    `invalidate(tenant)` also drops the old version's entries right away on reload.
+    """
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL_S):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, ids = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return ids
+
+    def put(self, key: Hashable, ids: List[str]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, tenant: Optional[str] = None) -> int:
+        """Drop all entries (of one tenant); returns how many were dropped."""
+        with self._lock:
+            keys = [k for k in self._entries if tenant is None or k[0] == tenant]
+            for k in keys:
+                del self._entries[k]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
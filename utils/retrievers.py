@@ -1,20 +1,295 @@
 # src/retrievers.py
-from typing import List
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+import chromadb
 from langchain_chroma import Chroma
 from langchain.schema import Document
 from langchain_openai import OpenAIEmbeddings
-from config import OPENAI_API_KEY, EMBEDDING_MODEL, require_openai_key
+from langchain_core.embeddings import Embeddings
+from config import (
+    OPENAI_API_KEY, EMBEDDING_MODEL, RETRIEVAL_BACKEND, DEFAULT_TENANT, TENANTS_FILE,
+    CATALOG_WATCH_INTERVAL, SHADOW_DISABLE_STAGES, ADAPTIVE_TOP_K, LEGACY_COLLECTION_NAME,
+    require_openai_key
+)
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from utils.single_flight import SingleFlight, context_hash
+from utils.result_cache import ResultCache
+from utils.records import CatalogRecord, load_records, parse_numbers
+from utils.snapshots import current_version, version_location
+from utils.tenants import TenantConfig, load_tenants
+from utils.local_index import LocalVectorIndex
+from utils.numeric_index import NumericIndex, NumericConstraint, parse_numeric_constraints
+from utils.deadline import has_budget, call_timeout
+from utils.hedging import hedged
+from utils.prompt_cache import track_prompt_usage
+from utils.ledger import MeteredEmbeddings, cheap_mode
+from utils.prefetch import current_prefetch, prefetched
+from utils.adaptive_k import select_adaptive
+from utils.shadow import shadow, doc_overlap
+from constants import (
+    BUDGET_CANDIDATES_K, AGENT_REQUEST_TIMEOUT, RERANK_MIN_BUDGET_S, ADAPTIVE_OVERFETCH,
+    RETRIEVAL_CONTEXT_TOKEN_BUDGET, PACKAGE_RESOLVE_MIN_RELEVANCE, PACKAGE_RESOLVE_CANDIDATES
+)
 import re
 
+@dataclass
+class RetrievalOptions:
+    """Stages of the get_documents pipeline that can be switched off (evaluation / tuning)."""
+    expand_query: bool = True       # "باقة ٧٠" → "فليكس ٧٠"
+    numeric_index: bool = True      # hybrid: budget / quota queries via the numeric index
+    adaptive_k: bool = ADAPTIVE_TOP_K  # score-aware cut instead of the tenant's fixed k
+    family_filter: bool = True      # فليكس / Plus intent → keep that family
+    number_filter: bool = True      # keep docs mentioning the query's numbers
+    rerank: bool = True             # LLM rerank
+    record_timings: bool = False    # per-stage latency into RetrieverManager.stage_timings
+
+    def without(self, stages: str) -> "RetrievalOptions":
+        """"rerank,expand_query" → a copy with those stages switched off."""
+        names = [name.strip() for name in stages.split(",") if name.strip()]
+        known = {f.name for f in fields(self)} - {"record_timings"}
+        unknown = set(names) - known
+        if unknown:
+            raise ValueError(f"مراحل غير معروفة: {', '.join(sorted(unknown))}")
+        return replace(self, **{name: False for name in names})
+
+
+class Tenant:
+    """Immutable snapshot of one tenant's catalog version: vector store, records side table
+    and numeric index. Reloads build a new Tenant and swap it in."""
+
+    def __init__(self, config: TenantConfig, db, records: Dict[str, CatalogRecord], version: int = 0):
+        self.config = config
+        self.name = config.name
+        self.version = version
+        self._db = db
+        self.records = records
+        self.numeric_index = NumericIndex(records.values())
+        # Normalized package title → record, for name lookups without a vector search
+        self.titles = {
+            RetrieverManager.normalize_query(r.title): r for r in records.values() if r.type == "package"
+        }
+        # Document ID → final (cleaned) document, for results served from the result cache
+        self.documents: Dict[str, Document] = {}
+
+    @property
+    def db(self):
+        if self._db is None:
+            # defer_chroma: a Chroma client used before fork() hangs the workers' queries
+            raise RuntimeError(f"Tenant '{self.name}': the Chroma store is opened in the workers (after_fork), not in the parent")
+        return self._db
+
+    @db.setter
+    def db(self, db) -> None:
+        self._db = db
+
+    @staticmethod
+    def doc_id(doc: Document) -> str:
+        return doc.metadata.get("record_id") or doc.id or context_hash(doc.page_content)
+
+    def remember(self, docs: List[Document]) -> List[str]:
+        ids = []
+        for doc in docs:
+            doc_id = self.doc_id(doc)
+            self.documents[doc_id] = doc
+            ids.append(doc_id)
+        return ids
+
+    def resolve(self, ids: List[str]) -> Optional[List[Document]]:
+        docs = [self.documents.get(doc_id) for doc_id in ids]
+        return None if any(doc is None for doc in docs) else docs
+
+
 class RetrieverManager:
-    def __init__(self, persist_directory: str, embedding_model: str = EMBEDDING_MODEL, k: int = 20):
-        self.embedding_model = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=embedding_model)
-        self.db = Chroma(persist_directory=persist_directory, embedding_function=self.embedding_model)
-        self.retrievers = {}
-        self.k = k
+    """Hosts one or more tenants (brand / region catalogs) sharing one embedding client,
+    one Chroma client per persist directory and one in-flight deduplication layer."""
+
+    def __init__(self, persist_directory: str, embedding_model: str = EMBEDDING_MODEL, k: int = 20,
+                 backend: str = RETRIEVAL_BACKEND, tenants: Optional[List[TenantConfig]] = None,
+                 options: Optional[RetrievalOptions] = None, embeddings: Optional[Embeddings] = None,
+                 shadow_options: Optional[RetrievalOptions] = None, defer_chroma: bool = False):
+        """`defer_chroma=True` (pre-fork parent): load records and indexes but open no Chroma
+        client until after_fork(); a client that ran a query before fork() deadlocks the children."""
+        if backend not in ("chroma", "local"):
+            raise ValueError(f"Retrieval backend '{backend}' غير مدعوم")
+        self.persist_directory = persist_directory
+        # `embeddings` → any LangChain Embeddings (e.g. a local model for offline evaluation)
+        self.embedding_model = MeteredEmbeddings(
+            embeddings or OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=embedding_model)
+        )
+        self.options = options or RetrievalOptions()
+        # Alternative pipeline run on sampled traffic in shadow mode (utils/shadow.py)
+        self.shadow_options = shadow_options or self.options.without(SHADOW_DISABLE_STAGES)
+        self.stage_timings: Dict[str, List[float]] = defaultdict(list)
+        self.backend = backend
+        self.k = k  # upper bound on candidates fetched for adaptive top-k
+        # Concurrent identical queries share one retrieval + rerank
+        self._inflight = SingleFlight()
+        # Final ranked results per (tenant, version, type, expanded query)
+        self._results = ResultCache()
+        self._clients = {}
+        self.defer_chroma = defer_chroma and backend == "chroma"
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.tenants: Dict[str, Tenant] = {}
+        if tenants is None:
+            tenants = load_tenants(TENANTS_FILE) if TENANTS_FILE else [TenantConfig()]
+        for config in tenants:
+            self.add_tenant(config)
+
+    def _client(self, persist_directory: str):
+        """One Chroma client per persist directory, shared by all collections in it."""
+        if persist_directory not in self._clients:
+            self._clients[persist_directory] = chromadb.PersistentClient(path=persist_directory)
+        return self._clients[persist_directory]
+
+    def _build_tenant(self, config: TenantConfig) -> Tenant:
+        """Open the currently published version of a tenant's catalog."""
+        persist_directory = config.persist_directory or self.persist_directory
+        version = current_version(persist_directory, config.collection_name)
+        _, directory = version_location(persist_directory, config.collection_name, version)
+        if self.backend == "local":
+            if not LocalVectorIndex.exists(directory):
+                # Refuse the version → reload() keeps serving the current one
+                raise RuntimeError(
+                    f"Catalog '{config.collection_name}' version {version} has no local index "
+                    f"(RETRIEVAL_BACKEND=local); re-ingest with local_index=True"
+                )
+            # Same vector store interface, without the Chroma client / SQLite per query
+            db = LocalVectorIndex.load(directory, self.embedding_model)
+        elif self.defer_chroma:
+            db = None  # opened per worker in after_fork()
+        else:
+            db = self._open_version(persist_directory, config.collection_name, version)
+        # Typed records side table + numeric index (empty for stores ingested before records)
+        return Tenant(config, db, load_records(directory), version)
+
+    def _open_version(self, persist_directory: str, collection_name: str, version: int) -> Chroma:
+        name, _ = version_location(persist_directory, collection_name, version)
+        if not version:
+            name = self._unversioned_collection(persist_directory, name)
+        return self._open_chroma(persist_directory, name)
+
+    def _collection_count(self, persist_directory: str, collection_name: str) -> int:
+        try:
+            return self._client(persist_directory).get_collection(collection_name).count()
+        except Exception:
+            return 0  # collection doesn't exist
+
+    def _unversioned_collection(self, persist_directory: str, collection_name: str) -> str:
+        """Collection to open for a store with no published version.
+
+        Stores from the original ingest (before named collections) are in langchain's default
+        collection; opening `collection_name` there would silently serve an empty catalog.
+        """
+        if self._collection_count(persist_directory, collection_name):
+            return collection_name
+        if self._collection_count(persist_directory, LEGACY_COLLECTION_NAME):
+            print(f"⚠️ '{collection_name}' not found in {persist_directory}, "
+                  f"using the legacy '{LEGACY_COLLECTION_NAME}' collection")
+            return LEGACY_COLLECTION_NAME
+        raise RuntimeError(
+            f"Catalog '{collection_name}' is empty or missing in {persist_directory}; "
+            f"run ChromaIngestor(collection_name='{collection_name}').ingest(...) first"
+        )
+
+    def _open_chroma(self, persist_directory: str, collection_name: str) -> Chroma:
+        return Chroma(
+            client=self._client(persist_directory),
+            collection_name=collection_name,
+            embedding_function=self.embedding_model,
+        )
+
+    def after_fork(self) -> None:
+        """Re-open per-process handles in a forked worker (server.py pre-fork mode).
+
+        Chroma clients (SQLite connections) and the embeddings HTTP client must not be shared
+        across processes. Records, numeric indexes and local mmap indexes stay shared
+        copy-on-write from the parent. With the Chroma backend the parent must be built with
+        `defer_chroma=True`: the worker opens the stores here, nothing is inherited.
+        """
+        if self._clients:
+            raise RuntimeError("Chroma was opened before fork(); build the pre-fork RetrieverManager "
+                               "with defer_chroma=True (or use RETRIEVAL_BACKEND=local)")
+        self.defer_chroma = False
+        self._reload_lock = threading.Lock()
+        self._inflight = SingleFlight()
+        self._watcher = None
+        inner = self.embedding_model.embeddings
+        if isinstance(inner, OpenAIEmbeddings):
+            self.embedding_model.embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=inner.model)
+        if self.backend != "chroma":
+            return
+        for tenant in self.tenants.values():
+            persist_directory = tenant.config.persist_directory or self.persist_directory
+            tenant.db = self._open_version(persist_directory, tenant.config.collection_name, tenant.version)
+
+    def add_tenant(self, config: TenantConfig) -> Tenant:
+        tenant = self._build_tenant(config)
+        self.tenants[config.name] = tenant
+        return tenant
+
+    def version(self, tenant: Optional[str] = None) -> int:
+        return self.tenant(tenant).version
+
+    # ===== Hot reload =====
+
+    def reload(self, tenant: Optional[str] = None) -> Dict[str, int]:
+        """Swap in newly published catalog versions without a restart.
+
+        The new snapshot is fully built (store, records, indexes) before the swap;
+        requests already running keep the Tenant object they started with. Caches keyed by
+        version (in-flight dedup, tool calls) stop matching the old version automatically.
+        """
+        names = [tenant] if tenant else list(self.tenants)
+        with self._reload_lock:
+            for name in names:
+                live = self.tenant(name)
+                persist_directory = live.config.persist_directory or self.persist_directory
+                if current_version(persist_directory, live.config.collection_name) != live.version:
+                    self.tenants[name] = self._build_tenant(live.config)
+                    self._results.invalidate(name)
+        return {name: self.tenants[name].version for name in names}
+
+    def start_watcher(self, interval: float = CATALOG_WATCH_INTERVAL):
+        """Background thread that polls the published versions and reloads on change."""
+        if self._watcher or interval <= 0:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"⚠️ Catalog reload failed: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def tenant(self, name: Optional[str] = None) -> Tenant:
+        name = name or DEFAULT_TENANT
+        if name not in self.tenants:
+            raise ValueError(f"Tenant '{name}' غير موجود")
+        return self.tenants[name]
+
+    # Default tenant shortcuts (single-catalog deployments)
+
+    @property
+    def db(self):
+        return self.tenant().db
+
+    @property
+    def records(self) -> Dict[str, CatalogRecord]:
+        return self.tenant().records
+
+    @property
+    def numeric_index(self) -> NumericIndex:
+        return self.tenant().numeric_index
 
     @staticmethod
     def normalize_numbers(text: str) -> str:
@@ -23,6 +298,13 @@ class RetrieverManager:
         table = str.maketrans(arabic_nums, english_nums)
         return text.translate(table)
 
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """توحيد صيغة الاستعلام (أرقام، حروف، مسافات وعلامات استفهام) لاستخدامه كمفتاح"""
+        text = RetrieverManager.normalize_numbers(text or "").lower()
+        text = text.strip().rstrip("؟?!.")
+        return " ".join(text.split())
+
     @staticmethod
     def extract_numbers(text: str) -> List[str]:
         """تستخرج الأرقام من النص"""
@@ -33,6 +315,10 @@ class RetrieverManager:
         """فلترة docs اللي فيها nan أو فاضية"""
         cleaned_docs = []
         for doc in docs:
+            # docs من RecordChunker نضيفة من وقت الـ ingest
+            if doc.metadata.get("chunk"):
+                cleaned_docs.append(doc)
+                continue
             if doc.page_content and doc.page_content.strip() != "":
                 # Remove trailing "nan" from content
                 content = doc.page_content.strip()
@@ -50,27 +336,72 @@ class RetrieverManager:
                     cleaned_docs.append(cleaned_doc)
         return cleaned_docs
 
-    def setup_retrievers(self):
-        self.retrievers['faq'] = self.db.as_retriever(search_kwargs={"k": 4, "filter": {"type": "faq"}})
-        self.retrievers['package'] = self.db.as_retriever(search_kwargs={"k": 6, "filter": {"type": "package"}})
+    def check_retriever_type(self, retriever_type: str, tenant: Optional[str] = None) -> None:
+        """ValueError for a retriever type the tenant has no k / filter for."""
+        if retriever_type not in self.tenant(tenant).config.k:
+            raise ValueError(f"Retriever '{retriever_type}' غير موجود")
+
+    def get_scored_documents(self, query: str, retriever_type: str, tenant: Optional[str] = None,
+                             k: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """Semantic search with relevance scores in [0, 1] (cosine similarity), best first."""
+        state = self.tenant(tenant)
+        if k is None:
+            key = (retriever_type, "scored", state.name, state.version, self.normalize_query(query))
+            return prefetched(key, lambda: self._scored_search(query, retriever_type, state))
+        return self._scored_search(query, retriever_type, state, k)
+
+    @staticmethod
+    def _scored_search(query: str, retriever_type: str, state: Tenant,
+                       k: Optional[int] = None) -> List[Tuple[Document, float]]:
+        return state.db.similarity_search_with_relevance_scores(
+            query,
+            k=k or state.config.k[retriever_type],
+            filter=state.config.filters[retriever_type],
+        )
+
+    def _candidate_search(self, query: str, retriever_type: str, state: Tenant) -> List[Tuple[Document, float]]:
+        """Scored candidates for adaptive top-k (over-fetched so duplicates can be collapsed)."""
+        k = min(self.k, state.config.k[retriever_type] * ADAPTIVE_OVERFETCH)
+        return self._scored_search(query, retriever_type, state, k)
+
+    def prefetch(self, query: str, tenant: Optional[str] = None) -> None:
+        """Speculatively start the turn's likely searches (FAQ scored search, package search)
+        with the message as-is, while the agent is still planning."""
+        turn = current_prefetch()
+        if turn is None:
+            return
+        state = self.tenant(tenant)
+        turn.submit(("faq", "scored", state.name, state.version, self.normalize_query(query)),
+                    lambda: self._scored_search(query, "faq", state))
+        # budget / quota queries go through the numeric index, not the semantic search
+        if len(state.numeric_index) and parse_numeric_constraints(query):
+            return
+        expanded = self._expand_package_query(query)
+        turn.submit(("package", "search", state.name, state.version, self.normalize_query(expanded)),
+                    lambda: self._candidate_search(expanded, "package", state))
 
     def rerank_with_llm(self, query: str, docs: List[Document]) -> List[Document]:
         """LLM re-ranking للـ docs"""
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=require_openai_key())
+        llm = track_prompt_usage(
+            hedged(ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=require_openai_key()), "rerank"),
+            "rerank"
+        )
 
         prompt = PromptTemplate(
             input_variables=["query", "docs"],
-            template="""السؤال: {query}
+            # التعليمات الثابتة الأول والأجزاء المتغيرة في الآخر (prefix cache)
+            template="""اختار أفضل الوثائق (بالترتيب) اللي بتجاوب على السؤال. ارجع النصوص فقط بنفس الترتيب.
 
 الوثائق:
 {docs}
 
-اختار أفضل الوثائق (بالترتيب) اللي بتجاوب على السؤال. ارجع النصوص فقط بنفس الترتيب."""
+السؤال: {query}"""
         )
-        chain = LLMChain(llm=llm, prompt=prompt)
-
         docs_text = "\n\n".join([f"[{i}] {doc.page_content}" for i, doc in enumerate(docs)])
-        result = chain.run(query=query, docs=docs_text)
+        result = llm.invoke(
+            prompt.format(query=query, docs=docs_text),
+            timeout=call_timeout(AGENT_REQUEST_TIMEOUT)
+        ).content
 
         ranked_docs = []
         for doc in docs:
@@ -79,30 +410,110 @@ class RetrieverManager:
 
         return ranked_docs if ranked_docs else docs
 
-    def get_documents(self, query: str, retriever_type: str) -> List[Document]:
-        retriever = self.retrievers.get(retriever_type)
-        if not retriever:
+    def get_documents(self, query: str, retriever_type: str, tenant: Optional[str] = None) -> List[Document]:
+        # Pin the snapshot for the whole request: a concurrent reload doesn't affect it
+        state = self.tenant(tenant)
+        if retriever_type not in state.config.k:
             raise ValueError(f"Retriever '{retriever_type}' غير موجود")
 
+        # المفتاح: الـ query بعد الـ expansion (+ قيد الميزانية/الحصة لو فيه) ونسخة الكتالوج
+        search_query = self._expand_package_query(query) if retriever_type == "package" else query
+        constraints = parse_numeric_constraints(query) if retriever_type == "package" else ()
+        key = (state.name, state.version, retriever_type, self.normalize_query(search_query), constraints)
+
+        ids = self._results.get(key)
+        if ids is not None:
+            docs = state.resolve(ids)
+            if docs is not None:
+                return docs
+
+        # Single-flight: نفس السؤال في نفس اللحظة (ونفس الـ version) → retrieval و rerank مرة واحدة
+        return self._inflight.do(key, lambda: self._compute_documents(key, query, retriever_type, state))
+
+    def _compute_documents(self, key, query: str, retriever_type: str, state: Tenant) -> List[Document]:
+        start = time.perf_counter()
+        docs, complete = self._get_documents(query, retriever_type, state)
+        elapsed = time.perf_counter() - start
+        # نتائج ناقصة (rerank اتشال بسبب الوقت أو الميزانية) ما تتخزنش
+        if complete:
+            self._results.put(key, state.remember(docs))
+            # Shadow: نفس الطلب في الخلفية بالـ pipeline البديل، للمقارنة بس (الرد مش بيستناه)
+            shadow.submit(
+                f"retrieval:{retriever_type}",
+                [state.doc_id(doc) for doc in docs],
+                elapsed,
+                lambda: [state.doc_id(doc) for doc in
+                         self._get_documents(query, retriever_type, state, self.shadow_options)[0]],
+                doc_overlap,
+                lambda primary, alternative: {"query": query, "primary": primary, "shadow": alternative},
+            )
+        return docs
+
+    def result_cache_stats(self) -> Dict[str, Any]:
+        return self._results.stats()
+
+    def clear_result_cache(self, tenant: Optional[str] = None) -> int:
+        return self._results.invalidate(tenant)
+
+    @contextmanager
+    def _stage(self, name: str, options: RetrievalOptions):
+        """Per-stage latency, recorded only when options.record_timings is on."""
+        if not options.record_timings:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_timings[name].append(time.perf_counter() - start)
+
+    def _get_documents(self, query: str, retriever_type: str, state: Tenant,
+                       options: Optional[RetrievalOptions] = None) -> Tuple[List[Document], bool]:
+        """Full pipeline → (docs, complete); complete=False when a stage was skipped for time / budget."""
+        options = options or self.options
+
+        # لو Package وفيه ميزانية/حصة → numeric index بدل مطابقة نص الرقم
+        if retriever_type == "package" and options.numeric_index and len(state.numeric_index):
+            constraints = parse_numeric_constraints(query)
+            if constraints:
+                with self._stage("numeric_index", options):
+                    return self._constrained_search(query, constraints, state), True
+
         # لو Package → expand query قبل البحث
-        if retriever_type == "package":
+        if retriever_type == "package" and options.expand_query:
             query = self._expand_package_query(query)
 
-        docs = retriever.get_relevant_documents(query)
+        # لو الـ search اتعمل speculatively مع بداية الـ turn → خد النتيجة من الـ cache
+        key = (retriever_type, "search", state.name, state.version, self.normalize_query(query))
+        with self._stage("search", options):
+            scored = prefetched(key, lambda: self._candidate_search(query, retriever_type, state))
 
-        # تنظيف النتائج (حذف nan أو الفاضية)
-        docs = self.clean_docs(docs)
+        # Adaptive top-k: cut at a score gap / minimum relevance, collapse near-duplicates, cap tokens
+        with self._stage("select", options):
+            if options.adaptive_k:
+                selected = select_adaptive(scored, max_k=state.config.k[retriever_type],
+                                           token_budget=RETRIEVAL_CONTEXT_TOKEN_BUDGET)
+            else:
+                selected = scored[:state.config.k[retriever_type]]
+            docs = [doc for doc, _ in selected]
+
+            # تنظيف النتائج (حذف nan أو الفاضية)
+            docs = self.clean_docs(docs)
 
         # لو FAQ → semantic فقط
         if retriever_type == "faq":
-            return docs
+            return docs, True
 
         # لو Package → improve search
         if retriever_type == "package":
-            docs = self._improve_package_search(query, docs)
+            # overviews from stores ingested before summaries had their own type
+            docs = [doc for doc in docs if doc.metadata.get("chunk") != "summary"]
+            if options.family_filter:
+                with self._stage("family_filter", options):
+                    docs = self._improve_package_search(query, docs)
             
             # فلترة أرقام إذا وُجدت
-            query_numbers = self.extract_numbers(query)
+            query_numbers = self.extract_numbers(query) if options.number_filter else []
             if query_numbers:
                 filtered_docs = [
                     doc for doc in docs
@@ -112,11 +523,94 @@ class RetrieverManager:
                     docs = filtered_docs
                 else:
                     # مفيش أي doc يطابق الرقم المطلوب → رجّع فاضي
-                    return []
+                    return [], True
 
-        # rerank بالـ LLM
-        return self.rerank_with_llm(query, docs)
+        # rerank بالـ LLM (أقل مرحلة قيمة → تتشال لو الوقت المتبقي قليل أو الجلسة عدت ميزانية التوكنز)
+        if not options.rerank:
+            return docs, True
+        if not has_budget(RERANK_MIN_BUDGET_S) or cheap_mode():
+            return docs, False
+        with self._stage("rerank", options):
+            return self.rerank_with_llm(query, docs), True
     
+    def _constrained_search(self, query: str, constraints: Tuple[NumericConstraint, ...], state: Tenant) -> List[Document]:
+        """Budget / quota query: candidates from the numeric index, ranked semantically.
+
+        No LLM rerank here - the candidates are already correct, the LLM only phrases the answer.
+        """
+        candidate_ids = state.numeric_index.query(constraints)
+        if not candidate_ids:
+            return []
+        docs = state.db.similarity_search(
+            query,
+            k=min(len(candidate_ids), BUDGET_CANDIDATES_K),
+            filter={"$and": [state.config.filters["package"], {"record_id": {"$in": candidate_ids}}]},
+        )
+        return self.clean_docs(docs)
+
+    def resolve_packages(self, names: List[str], tenant: Optional[str] = None) -> List[Optional[CatalogRecord]]:
+        """Resolve N package names in one batched lookup (aligned with `names`, None if not found).
+
+        Catalog hits (exact title, or family + number) need no vector search; the rest are
+        embedded in a single batch call and matched with one top-1 search each. No LLM rerank.
+        The best hit that is a single record (not a category summary / multi-row chunk) counts
+        only above PACKAGE_RESOLVE_MIN_RELEVANCE and, when the name has a number ("باقة ٩٩٩"),
+        only if the package has that number.
+        """
+        state = self.tenant(tenant)
+        resolved = [self._match_record(name, state) for name in names]
+
+        missing = [i for i, record in enumerate(resolved) if record is None]
+        if missing:
+            vectors = self.embedding_model.embed_documents([names[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                hits = self._scored_search_by_vector(vector, "package", state, k=PACKAGE_RESOLVE_CANDIDATES)
+                scored = [(CatalogRecord.from_metadata(doc.metadata), score) for doc, score in hits]
+                record, score = next(((r, s) for r, s in scored if r is not None), (None, 0.0))
+                if record is None or score < PACKAGE_RESOLVE_MIN_RELEVANCE:
+                    continue
+                numbers = parse_numbers(self.normalize_query(names[i]))
+                if numbers and record.number not in numbers:
+                    continue
+                resolved[i] = record
+        return resolved
+
+    @staticmethod
+    def _scored_search_by_vector(vector: List[float], retriever_type: str, state: Tenant,
+                                 k: int) -> List[Tuple[Document, float]]:
+        """(doc, cosine relevance) for an already embedded query, on either backend."""
+        filter = state.config.filters[retriever_type]
+        if isinstance(state.db, LocalVectorIndex):
+            pairs = state.db.search_by_vector(vector, k=k, filter=filter)
+        else:
+            pairs = state.db.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=filter)
+        to_relevance = state.db._select_relevance_score_fn()
+        return [(doc, to_relevance(score)) for doc, score in pairs]
+
+    def _match_record(self, name: str, state: Tenant) -> Optional[CatalogRecord]:
+        """اسم باقة → record من الكتالوج (مثال: "فليكس ٧٠"، "باقة ٧٠"، "Plus 155")"""
+        normalized = self.normalize_query(name)
+        if normalized in state.titles:
+            return state.titles[normalized]
+
+        numbers = parse_numbers(normalized)
+        if not numbers:
+            return None
+        if "business" in normalized or "بيزنس" in normalized:
+            family = "plus_business"
+        elif "plus" in normalized or "بلس" in normalized:
+            family = "plus"
+        elif "فليكس" in normalized or "flex" in normalized:
+            family = "flex"
+        else:
+            family = None
+        candidates = [
+            r for r in state.titles.values()
+            if r.number == numbers[0] and (family is None or r.family == family)
+        ]
+        # الأقصر = الباقة الأساسية مش الإضافات (مثال: "فليكس ٧٠" قبل "Plus YouTube - فليكس ...")
+        return min(candidates, key=lambda r: len(r.title)) if candidates else None
+
     def _expand_package_query(self, query: str) -> str:
         """توسيع الاستعلام لتحسين البحث
         
@@ -0,0 +1,135 @@
+# utils/session_cache.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from utils.records import CatalogRecord
+from utils.retrievers import RetrieverManager
+from constants import SESSION_TOOL_CACHE_SIZE, SESSION_ENTITY_LIMIT
+
+# Follow-ups ("تفاصيل الباقة السابقة", "قارنها باللي فاتت") refer to packages already shown in
+# this conversation. Each session keeps the packages it has seen and its recent tool outputs,
+# so a package costs one retrieval per conversation instead of one per mention.
+
+# "الباقة السابقة" / "اللي فاتت" / "the previous one" → the last package shown
+PREVIOUS_REFERENCE = re.compile(
+    r"(?:السابق[هة]?|اللي\s+فات(?:ت)?|اللي\s+قبلها|الأخير[هة]|اللي\s+قولتلي\s+عليها|دي\s+نفسها"
+    r"|\bprevious\b|\blast\s+one\b|\bthat\s+(?:one|package)\b|\bsame\s+package\b)",
+    re.IGNORECASE,
+)
+
+
+class SessionCacheStats:
+    """Process-wide counters over all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.entity_hits = 0
+        self.previous_refs = 0
+
+    def add(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entity_hits": self.entity_hits,
+                "previous_refs": self.previous_refs,
+            }
+
+
+session_cache_stats = SessionCacheStats()
+
+
+def _tokens(text: str) -> List[str]:
+    return RetrieverManager.normalize_query(text).split()
+
+
+class SessionToolCache:
+    """One session's tool outputs (by tool, catalog version, normalized input) and the
+    packages shown so far (most recent last). Entries of an older catalog version never match."""
+
+    def __init__(self, max_outputs: int = SESSION_TOOL_CACHE_SIZE, max_entities: int = SESSION_ENTITY_LIMIT):
+        self.max_outputs = max_outputs
+        self.max_entities = max_entities
+        self._lock = threading.Lock()
+        self._outputs: "OrderedDict[Hashable, Any]" = OrderedDict()
+        # record_id → (version, record), ordered by last mention
+        self._entities: "OrderedDict[str, tuple]" = OrderedDict()
+
+    # ----- tool outputs -----
+
+    @staticmethod
+    def key(tool: str, version: int, tool_input: str) -> Hashable:
+        return (tool, version, RetrieverManager.normalize_query(tool_input))
+
+    def get(self, tool: str, version: int, tool_input: str) -> Optional[Any]:
+        with self._lock:
+            key = self.key(tool, version, tool_input)
+            if key in self._outputs:
+                self._outputs.move_to_end(key)
+                session_cache_stats.add("hits")
+                return self._outputs[key]
+        session_cache_stats.add("misses")
+        return None
+
+    def put(self, tool: str, version: int, tool_input: str, output: Any) -> None:
+        with self._lock:
+            key = self.key(tool, version, tool_input)
+            self._outputs[key] = output
+            self._outputs.move_to_end(key)
+            while len(self._outputs) > self.max_outputs:
+                self._outputs.popitem(last=False)
+
+    # ----- entities -----
+
+    def remember(self, version: int, records: Iterable[Optional[CatalogRecord]]) -> None:
+        """Packages shown to the user (in the order shown; the last one becomes "the previous package")."""
+        with self._lock:
+            for record in records:
+                if record is None or record.type != "package":
+                    continue
+                self._entities[record.record_id] = (version, record)
+                self._entities.move_to_end(record.record_id)
+            while len(self._entities) > self.max_entities:
+                self._entities.popitem(last=False)
+
+    def entities(self, version: int) -> List[CatalogRecord]:
+        """Packages of this catalog version shown in the conversation, most recent first."""
+        with self._lock:
+            return [record for v, record in reversed(self._entities.values()) if v == version]
+
+    def previous(self, version: int, exclude: Iterable[str] = ()) -> Optional[CatalogRecord]:
+        """"The previously mentioned package": the most recent one not in `exclude` (record IDs)."""
+        excluded = set(exclude)
+        for record in self.entities(version):
+            if record.record_id not in excluded:
+                session_cache_stats.add("previous_refs")
+                return record
+        return None
+
+    def find(self, version: int, query: str) -> Optional[CatalogRecord]:
+        """A package already shown whose full title appears in the query ("فليكس ٧٠" ⊂ "تفاصيل فليكس ٧٠")."""
+        words = _tokens(query)
+        best = None
+        for record in self.entities(version):
+            title = _tokens(record.title)
+            if title and any(words[i:i + len(title)] == title for i in range(len(words) - len(title) + 1)):
+                if best is None or len(title) > len(_tokens(best.title)):
+                    best = record
+        if best is not None:
+            session_cache_stats.add("entity_hits")
+        return best
+
+    @staticmethod
+    def refers_to_previous(text: str) -> bool:
+        return bool(PREVIOUS_REFERENCE.search(text))
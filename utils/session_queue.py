@@ -0,0 +1,156 @@
+# utils/session_queue.py
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from constants import SESSION_MAX_MERGED, MAX_MESSAGE_LENGTH, SUPERSEDED_MESSAGE, SESSION_BUSY_MESSAGE
+
+# Per-session serialization: one turn at a time per session (the agent and its memory are not
+# safe for concurrent turns), while different sessions run fully in parallel.
+#
+# Each session has at most one running turn and one pending turn:
+# - the same text again while it is running / pending (double submit) → waits for that answer
+# - a new message while another one is still pending → merged into the pending one; the older
+#   caller returns SUPERSEDED_MESSAGE right away instead of getting its own (stale) turn
+# - more than SESSION_MAX_MERGED merged messages → rejected with SESSION_BUSY_MESSAGE
+# A turn that answered before its work finished (deadline → degraded answer) can hold() the
+# session until that work is done, so the next turn never runs alongside it.
+
+
+class _Turn:
+    __slots__ = ("text", "parts", "future", "ready", "superseded", "queued_at", "hold")
+
+    def __init__(self, text: str, parts: int = 1):
+        self.text = text
+        self.parts = parts
+        self.future: Future = Future()
+        self.ready = threading.Event()
+        self.superseded = False
+        self.queued_at = time.monotonic()
+        self.hold: Optional[Future] = None
+
+
+class _Session:
+    __slots__ = ("running", "pending", "waiters")
+
+    def __init__(self):
+        self.running: Optional[_Turn] = None
+        self.pending: Optional[_Turn] = None
+        self.waiters = 0
+
+
+class SessionActors:
+    """Runs each session's messages one at a time, in arrival order, in the callers' threads."""
+
+    def __init__(self, max_merged: int = SESSION_MAX_MERGED):
+        self.max_merged = max_merged
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _Session] = {}
+        self.turns = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.rejected = 0
+        self.held = 0
+        self.max_depth = 0
+        self.wait_s = 0.0
+
+    def run(self, session_id: str, message: str, handler: Callable[[str], str]) -> str:
+        """handler(text) for this message (or the merged text) once the session is free."""
+        with self._lock:
+            session = self._sessions.setdefault(session_id, _Session())
+            turn = None
+            for candidate in (session.running, session.pending):
+                if candidate is not None and candidate.text == message:
+                    # double submit → same answer, no second turn
+                    self.coalesced += 1
+                    session.waiters += 1
+                    shared = candidate.future
+                    break
+            else:
+                shared = None
+                if session.running is None:
+                    turn = session.running = _Turn(message)
+                    turn.ready.set()
+                elif session.pending is None:
+                    turn = session.pending = _Turn(message)
+                else:
+                    previous = session.pending
+                    merged = f"{previous.text}\n{message}"
+                    if previous.parts >= self.max_merged or len(merged) > MAX_MESSAGE_LENGTH:
+                        self.rejected += 1
+                        return SESSION_BUSY_MESSAGE
+                    # the older pending message is answered as part of this one
+                    turn = session.pending = _Turn(merged, previous.parts + 1)
+                    previous.superseded = True
+                    previous.future.set_result(SUPERSEDED_MESSAGE)
+                    previous.ready.set()
+                    self.superseded += 1
+            self.max_depth = max(self.max_depth, self._depth())
+
+        if shared is not None:
+            try:
+                return shared.result()
+            finally:
+                with self._lock:
+                    session.waiters -= 1
+                    self._cleanup(session_id, session)
+
+        turn.ready.wait()
+        if turn.superseded:
+            return turn.future.result()
+        with self._lock:
+            self.turns += 1
+            self.wait_s += time.monotonic() - turn.queued_at
+        try:
+            result = handler(turn.text)
+            turn.future.set_result(result)
+            return result
+        except BaseException as e:
+            turn.future.set_exception(e)
+            raise
+        finally:
+            if turn.hold is None:
+                self._release(session_id, session)
+            else:
+                # the caller has its answer; the next turn waits for the held work
+                turn.hold.add_done_callback(lambda _: self._release(session_id, session))
+
+    def hold(self, session_id: str, work: Future) -> None:
+        """Called from inside a running turn: keep the session busy until `work` is done."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.running is not None:
+                session.running.hold = work
+                self.held += 1
+
+    def _release(self, session_id: str, session: _Session) -> None:
+        with self._lock:
+            session.running = session.pending
+            session.pending = None
+            if session.running is not None:
+                session.running.ready.set()
+            self._cleanup(session_id, session)
+
+    def _cleanup(self, session_id: str, session: _Session) -> None:
+        if session.running is None and session.pending is None and session.waiters == 0:
+            self._sessions.pop(session_id, None)
+
+    def _depth(self) -> int:
+        return sum((s.running is not None) + (s.pending is not None) + s.waiters for s in self._sessions.values())
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "busy_sessions": len(self._sessions),
+                "queue_depth": self._depth(),
+                "queued": sum(s.pending is not None for s in self._sessions.values()),
+                "max_depth": self.max_depth,
+                "turns": self.turns,
+                "coalesced": self.coalesced,
+                "superseded": self.superseded,
+                "rejected": self.rejected,
+                "held": self.held,
+                "avg_wait_ms": round(self.wait_s / self.turns * 1000, 1) if self.turns else 0.0,
+            }
@@ -0,0 +1,139 @@
+# utils/shadow.py
+
+import contextvars
+import difflib
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from config import SHADOW_SAMPLE_RATE
+from constants import SHADOW_MAX_CONCURRENCY, SHADOW_RECENT_DIFFS, SHADOW_MIN_ANSWER_SIMILARITY
+
+# Shadow mode: a sampled fraction of real requests also runs an alternative pipeline in the
+# background. Only the comparison is recorded - the user always gets the primary result, and
+# when all shadow slots are busy the sample is dropped instead of queued.
+
+
+def doc_overlap(primary: Sequence[str], shadow: Sequence[str]) -> Dict[str, float]:
+    """Agreement of two ranked doc ID lists: Jaccard of the sets and same top-1."""
+    a, b = set(primary), set(shadow)
+    union = a | b
+    return {
+        "doc_jaccard": len(a & b) / len(union) if union else 1.0,
+        "top1_agreement": float(primary[:1] == shadow[:1]),
+    }
+
+
+def answer_similarity(primary: str, shadow: str) -> Dict[str, float]:
+    return {"answer_similarity": difflib.SequenceMatcher(None, primary, shadow).ratio()}
+
+
+class ShadowStats:
+    """Per shadow pipeline: sampled / dropped (no free slot) / failed runs, latency of both
+    sides and the running mean of each agreement metric."""
+
+    def __init__(self, recent: int = SHADOW_RECENT_DIFFS):
+        self._lock = threading.Lock()
+        self._pipelines: Dict[str, Dict[str, Any]] = {}
+        # Latest disagreements (top-1 differs / low similarity) for manual review
+        self.recent_diffs: deque = deque(maxlen=recent)
+
+    def _pipeline(self, name: str) -> Dict[str, Any]:
+        return self._pipelines.setdefault(name, {
+            "sampled": 0, "dropped": 0, "failed": 0, "compared": 0,
+            "primary_s": 0.0, "shadow_s": 0.0, "metrics": {},
+        })
+
+    def add(self, name: str, counter: str) -> None:
+        with self._lock:
+            self._pipeline(name)[counter] += 1
+
+    def record(self, name: str, primary_s: float, shadow_s: float, metrics: Dict[str, float],
+               example: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            p = self._pipeline(name)
+            p["compared"] += 1
+            p["primary_s"] += primary_s
+            p["shadow_s"] += shadow_s
+            for metric, value in metrics.items():
+                p["metrics"][metric] = p["metrics"].get(metric, 0.0) + value
+            if example is not None:
+                self.recent_diffs.append({"pipeline": name, **example})
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for name, p in self._pipelines.items():
+                n = p["compared"]
+                result[name] = {
+                    "sampled": p["sampled"],
+                    "dropped": p["dropped"],
+                    "failed": p["failed"],
+                    "compared": n,
+                    "primary_ms": round(p["primary_s"] / n * 1000, 1) if n else 0.0,
+                    "shadow_ms": round(p["shadow_s"] / n * 1000, 1) if n else 0.0,
+                    **{metric: round(total / n, 3) for metric, total in p["metrics"].items()},
+                }
+            result["recent_diffs"] = list(self.recent_diffs)
+            return result
+
+
+shadow_stats = ShadowStats()
+
+
+class ShadowRunner:
+    """Samples requests and runs the alternative pipeline off the critical path."""
+
+    def __init__(self, sample_rate: float = SHADOW_SAMPLE_RATE, max_concurrency: int = SHADOW_MAX_CONCURRENCY):
+        self.sample_rate = sample_rate
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="shadow")
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def submit(
+        self,
+        name: str,
+        primary: Any,
+        primary_s: float,
+        run: Callable[[], Any],
+        compare: Callable[[Any, Any], Dict[str, float]],
+        describe: Optional[Callable[[Any, Any], Dict[str, Any]]] = None,
+    ) -> bool:
+        """Maybe shadow one request; returns immediately either way (True if a run was started).
+
+        `describe(primary, shadow)` → an example for recent_diffs when top-1 / answers disagree.
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return False
+        shadow_stats.add(name, "sampled")
+        if not self._slots.acquire(blocking=False):
+            shadow_stats.add(name, "dropped")
+            return False
+
+        def job():
+            try:
+                start = time.perf_counter()
+                result = run()
+                shadow_s = time.perf_counter() - start
+                metrics = compare(primary, result)
+                disagree = metrics.get("top1_agreement", 1.0) < 1.0 or metrics.get("answer_similarity", 1.0) < SHADOW_MIN_ANSWER_SIMILARITY
+                example = describe(primary, result) if describe and disagree else None
+                shadow_stats.record(name, primary_s, shadow_s, metrics, example)
+            except Exception:
+                shadow_stats.add(name, "failed")
+            finally:
+                self._slots.release()
+
+        # Empty context: the shadow run gets no deadline, is not booked on the user's token
+        # ledger and never consumes the turn's prefetched results
+        self._pool.submit(contextvars.Context().run, job)
+        return True
+
+
+shadow = ShadowRunner()
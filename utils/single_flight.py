@@ -0,0 +1,89 @@
+# utils/single_flight.py
+
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from utils.deadline import current_deadline
+
+
+class _Call:
+    """State of one in-flight call shared by all its waiters."""
+
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Single-flight deduplication: concurrent calls with the same key share one execution.
+
+    The first caller (the leader) runs the function, every other caller that arrives
+    while it is still running waits and receives the same result (or exception).
+    Results are shared between callers, so treat them as read-only. A waiter waits at most
+    until its own request deadline, then runs the call itself (a stuck leader never holds
+    other sessions past theirs).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0  # calls that actually ran upstream
+        self.shared = 0    # calls served by another in-flight call
+        self.timed_out = 0  # waiters that gave up on the leader at their deadline and ran it themselves
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            deadline = current_deadline()
+            if not call.event.wait(None if deadline is None else deadline.remaining()):
+                with self._lock:
+                    self.timed_out += 1
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "shared": self.shared, "timed_out": self.timed_out,
+                "in_flight": self.in_flight()}
+
+
+def context_hash(context: str) -> str:
+    """Short stable hash of the context (e.g. chat history) that affects a call's result."""
+    return hashlib.sha1((context or "").encode("utf-8")).hexdigest()[:16]
+
+
+# Shared across sessions: identical tool LLM calls (same input, same context) run once.
+# Callers decide degraded / cheap-mode answers before joining (or put that state in the key),
+# so one session's deadline or token budget never downgrades another session's answer.
+tool_calls = SingleFlight()
@@ -0,0 +1,42 @@
+# utils/snapshots.py
+
+import os
+from typing import Optional, Tuple
+from utils.records import catalog_dir
+
+# Versioned catalog snapshots: every ingest builds version N+1 beside the live one
+# (collection "<name>_v<N>" + artifacts in "<catalog_dir>/v<N>/"), then publishes it
+# by atomically replacing the CURRENT pointer file.
+
+CURRENT_FILE = "CURRENT"
+
+
+def current_version(persist_directory: str, collection_name: str) -> int:
+    """Published version of a collection (0 → unversioned store from before snapshots)."""
+    path = os.path.join(catalog_dir(persist_directory, collection_name), CURRENT_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def version_location(persist_directory: str, collection_name: str, version: Optional[int]) -> Tuple[str, str]:
+    """(Chroma collection name, artifacts directory) for a given version."""
+    base_dir = catalog_dir(persist_directory, collection_name)
+    if not version:
+        return collection_name, base_dir
+    return f"{collection_name}_v{version}", os.path.join(base_dir, f"v{version}")
+
+
+def publish_version(persist_directory: str, collection_name: str, version: int) -> None:
+    """Atomic swap: readers see either the old or the new pointer, never a partial file."""
+    base_dir = catalog_dir(persist_directory, collection_name)
+    os.makedirs(base_dir, exist_ok=True)
+    path = os.path.join(base_dir, CURRENT_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(version))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,40 @@
+# utils/tenants.py
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from config import COLLECTION_NAME, DEFAULT_TENANT
+
+# Per-tenant (brand / region) catalog settings; one RetrieverManager hosts all tenants
+
+
+def _default_k() -> Dict[str, int]:
+    return {"faq": 4, "package": 6, "package_summary": 4}
+
+
+def _default_filters() -> Dict[str, Dict[str, Any]]:
+    # package_summary: RecordChunker(summaries=True) category overviews, for listing requests only
+    return {"faq": {"type": "faq"}, "package": {"type": "package"}, "package_summary": {"type": "package_summary"}}
+
+
+@dataclass
+class TenantConfig:
+    name: str = DEFAULT_TENANT
+    collection_name: str = COLLECTION_NAME
+    persist_directory: Optional[str] = None  # None → the manager's persist directory
+    k: Dict[str, int] = field(default_factory=_default_k)
+    filters: Dict[str, Dict[str, Any]] = field(default_factory=_default_filters)
+
+
+def load_tenants(path: str) -> List[TenantConfig]:
+    """تحميل إعدادات الـ tenants من ملف JSON (list of TenantConfig fields)"""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    tenants = []
+    for entry in entries:
+        config = TenantConfig(**{k: v for k, v in entry.items() if k not in ("k", "filters")})
+        # Partial overrides keep the defaults for unspecified retriever types
+        config.k.update(entry.get("k", {}))
+        config.filters.update(entry.get("filters", {}))
+        tenants.append(config)
+    return tenants
@@ -0,0 +1,33 @@
+# utils/tokens.py
+
+from functools import lru_cache
+from config import LLM_MODEL
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a rough estimate
+    tiktoken = None
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+
+def count_tokens(text: str, model: str = LLM_MODEL) -> int:
+    """عدد التوكنز في النص (تقدير تقريبي لو tiktoken مش متاح)"""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        # Arabic text averages roughly 3 characters per token
+        return max(1, len(text) // 3)
+    return len(encoding.encode(text))